@@ -1,9 +1,17 @@
+import hashlib
+import heapq
 import json
+import math
 from typing import Dict, List, Tuple, Optional
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from models import User, Exam, Topic, Recommendation
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session, joinedload
+from models import User, Exam, Topic, Recommendation, load_json
 from lifecycle import lifecycle_machine
+from study_scheduler import StudyScheduler
+from exam_dates import exam_date_ranges
+from catalog import exam_catalog
+from cache import cache_user_recommendations, get_cached_recommendations, invalidate_recommendations
+from logger import logger
 
 class CareerRecommender:
     """
@@ -118,50 +126,114 @@ class TopicPrioritizer:
     def __init__(self, db: Session):
         self.db = db
 
+    PLAN_VERSION = 2
+
     def generate_study_plan(self, user_id: int, exam_code: str, days_available: int) -> Dict:
         """
         Generate personalized study plan using topic prioritization algorithm
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        exam = self.db.query(Exam).filter(Exam.code == exam_code).first()
+        user = self.db.get(User, user_id)
+        exam = exam_catalog.snapshot(self.db).get_by_code(exam_code)
 
         if not user or not exam:
             return {"error": "User or exam not found"}
 
-        # Get user's preparation profile
-        profile = user.preparation_profile or {}
-        strengths = profile.get("strengths", [])
-        weaknesses = profile.get("weaknesses", [])
+        return self.plan_response(self.build_plan(user, exam, days_available))
+
+    def build_plan(
+        self,
+        user: User,
+        exam: Exam,
+        days_available: int,
+        prioritized_topics: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Build the structured (storable, diffable) form of a study plan.
+
+        `history` days are kept as-is and scheduling resumes after them.
+        """
+        profile = load_json(user.preparation_profile, {})
+        if prioritized_topics is None:
+            prioritized_topics = self.prioritize_topics(exam.id, profile, days_available)
+
+        return self._assemble_plan(exam.code, days_available, profile, prioritized_topics, history)
+
+    def _assemble_plan(
+        self,
+        exam_code: str,
+        days_available: int,
+        profile: Dict,
+        prioritized_topics: List[Dict],
+        history: Optional[List[Dict]] = None
+    ) -> Dict:
+        # Pack topics into days
+        schedule = self.schedule_topics(prioritized_topics, days_available, profile, history)
+
+        return {
+            "version": self.PLAN_VERSION,
+            "exam_code": exam_code,
+            "total_days": days_available,
+            "inputs": self.plan_inputs(profile),
+            "topics": prioritized_topics,
+            "days": schedule["days"],
+            "unscheduled_topics": schedule["unscheduled_topics"],
+            "schedule_stats": schedule["stats"],
+            "success_probability": self._calculate_success_probability(prioritized_topics, profile)
+        }
+
+    @staticmethod
+    def plan_response(plan: Dict) -> Dict:
+        """API view of a structured plan"""
+        return {
+            "exam_code": plan["exam_code"],
+            "exam_codes": plan.get("exam_codes", [plan["exam_code"]]),
+            "total_days": plan["total_days"],
+            "prioritized_topics": plan["topics"][:10],  # Top 10
+            "weekly_plan": StudyScheduler.to_weekly_plan(plan["days"]),
+            "unscheduled_topics": plan["unscheduled_topics"],
+            "schedule_stats": plan["schedule_stats"],
+            "estimated_completion": f"{plan['total_days']} days from now",
+            "success_probability": plan["success_probability"]
+        }
+
+    @staticmethod
+    def plan_inputs(profile: Dict) -> Dict:
+        """Profile fields a plan depends on"""
+        return {
+            "strengths": sorted(profile.get("strengths", [])),
+            "weaknesses": sorted(profile.get("weaknesses", [])),
+            "study_hours_per_day": profile.get("study_hours_per_day", 6) or 6
+        }
 
+    def prioritize_topics(self, exam_id: int, profile: Dict, days_available: int) -> List[Dict]:
+        """Score every topic of an exam, highest priority first"""
         # Get exam topics
-        topics = self.db.query(Topic).filter(Topic.exam_id == exam.id).all()
+        topics = self.db.query(Topic).filter(Topic.exam_id == exam_id).all()
+
+        prioritized_topics = self._score_topics(topics, profile, days_available)
+
+        # Sort by priority score
+        prioritized_topics.sort(key=lambda x: x["priority_score"], reverse=True)
+        return prioritized_topics
+
+    def _score_topics(self, topics: List[Topic], profile: Dict, days_available: int) -> List[Dict]:
+        """Calculate priority scores for each topic"""
+        strengths = profile.get("strengths", [])
+        weaknesses = profile.get("weaknesses", [])
 
-        # Calculate priority scores for each topic
         prioritized_topics = []
         for topic in topics:
             priority_score = self._calculate_priority_score(topic, strengths, weaknesses, days_available)
             prioritized_topics.append({
-                "topic": topic,
+                "topic": {"id": topic.id, "name": topic.name, "subject": topic.subject},
                 "priority_score": priority_score,
+                "estimated_hours": self._estimate_study_hours(topic),
                 "estimated_days": self._estimate_study_days(topic, profile),
                 "difficulty": self._get_topic_difficulty(topic),
                 "weightage": json.loads(topic.weightage_history)[-1] if topic.weightage_history else 0
             })
-
-        # Sort by priority score
-        prioritized_topics.sort(key=lambda x: x["priority_score"], reverse=True)
-
-        # Generate weekly plan
-        study_plan = self._create_weekly_plan(prioritized_topics, days_available)
-
-        return {
-            "exam_code": exam_code,
-            "total_days": days_available,
-            "prioritized_topics": prioritized_topics[:10],  # Top 10
-            "weekly_plan": study_plan,
-            "estimated_completion": f"{days_available} days from now",
-            "success_probability": self._calculate_success_probability(prioritized_topics, profile)
-        }
+        return prioritized_topics
 
     def _calculate_priority_score(self, topic: Topic, strengths: List, weaknesses: List, days_available: int) -> float:
         """
@@ -184,15 +256,19 @@ class TopicPrioritizer:
 
         return round(priority_score, 2)
 
-    def _estimate_study_days(self, topic: Topic, profile: Dict) -> int:
-        """Estimate days needed to master a topic"""
-        base_days = topic.avg_questions // 2  # 2 questions per day
-        study_hours_per_day = profile.get("study_hours_per_day", 6)
+    def _estimate_study_hours(self, topic: Topic) -> float:
+        """Estimate hours needed to master a topic"""
+        base_hours = (topic.avg_questions or 1) * 2  # Rough estimate: 2 hours per question
 
         # Adjust based on difficulty
         difficulty_multiplier = 1.5 if topic.name in ["modern_physics", "organic_chemistry"] else 1.0
 
-        return max(1, int(base_days * difficulty_multiplier / study_hours_per_day))
+        return round(base_hours * difficulty_multiplier, 2)
+
+    def _estimate_study_days(self, topic: Topic, profile: Dict) -> int:
+        """Estimate days needed to master a topic"""
+        study_hours_per_day = profile.get("study_hours_per_day", 6) or 6
+        return max(1, math.ceil(self._estimate_study_hours(topic) / study_hours_per_day))
 
     def _get_topic_difficulty(self, topic: Topic) -> str:
         """Get topic difficulty level"""
@@ -206,31 +282,28 @@ class TopicPrioritizer:
         else:
             return "easy"
 
-    def _create_weekly_plan(self, prioritized_topics: List, total_days: int) -> Dict:
-        """Create weekly study plan"""
-        weeks = total_days // 7
-        plan = {}
-
-        topic_index = 0
-        for week in range(1, weeks + 1):
-            weekly_topics = []
-            week_days = 7 if week <= weeks else total_days % 7
-
-            for day in range(1, week_days + 1):
-                if topic_index < len(prioritized_topics):
-                    topic_data = prioritized_topics[topic_index]
-                    weekly_topics.append({
-                        "day": f"Week {week}, Day {day}",
-                        "topic": topic_data["topic"].name,
-                        "focus_area": f"High-weightage ({topic_data['weightage']}%)",
-                        "estimated_hours": 6,
-                        "difficulty": topic_data["difficulty"]
-                    })
-                    topic_index += 1
-
-            plan[f"week_{week}"] = weekly_topics
-
-        return plan
+    def schedule_topics(
+        self,
+        prioritized_topics: List,
+        total_days: int,
+        profile: Dict,
+        history: Optional[List[Dict]] = None
+    ) -> Dict:
+        """Pack prioritized topics into daily slots with spaced revision"""
+        scheduler = StudyScheduler(hours_per_day=profile.get("study_hours_per_day", 6) or 6)
+        return scheduler.schedule(
+            [
+                {
+                    "name": t["topic"]["name"],
+                    "subject": t["topic"]["subject"],
+                    "hours": t["estimated_hours"],
+                    "difficulty": t["difficulty"],
+                    "weightage": t["weightage"]
+                } for t in prioritized_topics
+            ],
+            total_days,
+            history
+        )
 
     def _calculate_success_probability(self, topics: List, profile: Dict) -> float:
         """Calculate estimated success probability"""
@@ -243,33 +316,213 @@ class TopicPrioritizer:
 
         return round(adjusted_probability, 2)
 
+class JointStudyPlanner(TopicPrioritizer):
+    """
+    One study plan across all of a user's active exams.
+
+    Topics shared between exams (same subject and name, or listed in each
+    other's correlation_topics) are merged and studied once. A merged topic's
+    priority is the sum of its per-exam priorities, each weighted by how soon
+    that exam is, so the nearest exam's syllabus comes first.
+    """
+
+    CORRELATED_EXTRA = 0.25  # extra share of hours for each correlated (non-identical) topic merged in
+    DEFAULT_DAYS = 90
+
+    def generate_joint_plan(self, user_id: int, days_available: Optional[int] = None) -> Dict:
+        """
+        Generate a single study plan for every exam in the user's active_exams
+        """
+        user = self.db.get(User, user_id)
+        if not user:
+            return {"error": "User not found"}
+
+        exams = self.load_exams(user.active_exams or [])
+        if not exams:
+            return {"error": "No active exams found"}
+
+        days_available = days_available or self.default_days(exams)
+        return self.plan_response(self.build_joint_plan(user, exams, days_available))
+
+    def build_joint_plan(
+        self,
+        user: User,
+        exams: List[Exam],
+        days_available: int,
+        prioritized_topics: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
+    ) -> Dict:
+        """Structured joint plan, in the same form as `build_plan`"""
+        profile = load_json(user.preparation_profile, {})
+        if prioritized_topics is None:
+            prioritized_topics = self.prioritize_joint_topics(exams, profile, days_available)
+
+        plan = self._assemble_plan(self.joint_code(exams), days_available, profile, prioritized_topics, history)
+        plan["exam_codes"] = [exam.code for exam in exams]
+        return plan
+
+    @staticmethod
+    def joint_code(exams: List[Exam]) -> str:
+        """Stable identifier for a set of exams"""
+        return "+".join(sorted(exam.code for exam in exams))
+
+    def load_exams(self, exam_codes: List[str]) -> List[Exam]:
+        """Load exams in one query, nearest exam date first"""
+        if not exam_codes:
+            return []
+        exams = exam_catalog.snapshot(self.db).get_many(exam_codes)
+        return sorted(exams, key=lambda e: (self._exam_date(e) or datetime.max, e.code))
+
+    def default_days(self, exams: List[Exam]) -> int:
+        """Days until the last upcoming exam"""
+        now = datetime.utcnow()
+        upcoming = [(d - now).days for d in map(self._exam_date, exams) if d and d > now]
+        return max(upcoming) if upcoming else self.DEFAULT_DAYS
+
+    def prioritize_joint_topics(self, exams: List[Exam], profile: Dict, days_available: int) -> List[Dict]:
+        """Merge and score topics across exams, highest priority first"""
+        code_by_id = {exam.id: exam.code for exam in exams}
+        weights = self._exam_weights(exams, days_available)
+
+        topics = self.db.query(Topic).filter(Topic.exam_id.in_(list(code_by_id))).all()
+        scored = self._score_topics(topics, profile, days_available)
+
+        # Union-find over topic indices
+        parent = list(range(len(topics)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        by_key: Dict[Tuple, List[int]] = {}
+        for i, topic in enumerate(topics):
+            by_key.setdefault(self._topic_key(topic.subject, topic.name), []).append(i)
+
+        # Same topic in several exams
+        for indices in by_key.values():
+            for i in indices[1:]:
+                parent[find(i)] = find(indices[0])
+
+        topic_weight = [scored[i]["priority_score"] * weights[topic.exam_id] for i, topic in enumerate(topics)]
+        exams_of: Dict[int, set] = {}
+        group_weight: Dict[int, float] = {}
+        for i, topic in enumerate(topics):
+            root = find(i)
+            exams_of.setdefault(root, set()).add(topic.exam_id)
+            group_weight[root] = max(group_weight.get(root, 0.0), topic_weight[i])
+
+        # Correlated topics from different exams are paired, strongest pairs first. Each
+        # topic gets at most one partner and never one from its own exam: the transitive
+        # closure would chain distinct topics of one exam, or a whole subject, together
+        candidates = set()
+        for i, topic in enumerate(topics):
+            for name in load_json(topic.correlation_topics, []) or []:
+                for j in by_key.get(self._topic_key(topic.subject, name), []):
+                    a, b = find(i), find(j)
+                    if topics[j].exam_id != topic.exam_id and a != b:
+                        candidates.add((min(a, b), max(a, b)))
+
+        paired = set()
+        for a, b in sorted(candidates, key=lambda pair: (-(group_weight[pair[0]] + group_weight[pair[1]]), pair)):
+            if a in paired or b in paired or exams_of[a] & exams_of[b]:
+                continue
+            parent[b] = a
+            paired.update((a, b))
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(topics)):
+            groups.setdefault(find(i), []).append(i)
+
+        hours_per_day = profile.get("study_hours_per_day", 6) or 6
+        merged = []
+        for members in groups.values():
+            weighted = {i: topic_weight[i] for i in members}
+            lead = max(members, key=lambda i: (weighted[i], -i))
+
+            # Identical topics are studied once; correlated ones add a fraction of their hours
+            hours_by_name: Dict[Tuple, float] = {}
+            for i in members:
+                key = self._topic_key(topics[i].subject, topics[i].name)
+                hours_by_name[key] = max(hours_by_name.get(key, 0), scored[i]["estimated_hours"])
+            lead_hours = hours_by_name.pop(self._topic_key(topics[lead].subject, topics[lead].name))
+            hours = lead_hours + self.CORRELATED_EXTRA * sum(hours_by_name.values())
+
+            entry = dict(scored[lead])
+            entry.update({
+                "priority_score": round(sum(weighted.values()), 2),
+                "estimated_hours": round(hours, 2),
+                "estimated_days": max(1, math.ceil(hours / hours_per_day)),
+                "exams": sorted({code_by_id[topics[i].exam_id] for i in members}),
+                "merged_topics": sorted({topics[i].name for i in members} - {topics[lead].name})
+            })
+            merged.append(entry)
+
+        merged.sort(key=lambda x: (-x["priority_score"], x["topic"]["name"]))
+        return merged
+
+    def _exam_weights(self, exams: List[Exam], days_available: int) -> Dict[int, float]:
+        """Weight each exam by proximity: the nearest exam gets 1.0"""
+        now = datetime.utcnow()
+        days_until = {}
+        for exam in exams:
+            exam_date = self._exam_date(exam)
+            days_until[exam.id] = max(1, (exam_date - now).days) if exam_date and exam_date > now else max(1, days_available)
+
+        nearest = min(days_until.values())
+        return {exam_id: nearest / days for exam_id, days in days_until.items()}
+
+    @staticmethod
+    def _exam_date(exam: Exam) -> Optional[datetime]:
+        """First exam day listed for an exam"""
+        ranges = exam_date_ranges(exam.important_dates)
+        return datetime.combine(ranges[0][0], datetime.min.time()) if ranges else None
+
+    @staticmethod
+    def _topic_key(subject: Optional[str], name: Optional[str]) -> Tuple:
+        return ((subject or "").strip().lower(), (name or "").strip().lower().replace(" ", "_"))
+
 class ExamClashDetector:
     """
     Detect and resolve exam date conflicts
+
+    Exam dates are parsed into day ranges and swept in start order, keeping
+    only ranges that can still reach the current one. Exact overlaps and
+    near-clashes (exams `near_clash_days` or fewer days apart) are found in
+    O(n log n + k) for n ranges and k clashing pairs. In global mode the
+    whole catalog's clash graph is computed once per catalog change, so a
+    user's check is a dictionary lookup per exam pair.
     """
 
+    DEFAULT_NEAR_CLASH_DAYS = 1
+
+    # Shared across detectors: (catalog version, near_clash_days) -> graph
+    _graph_cache: Dict[Tuple, Dict[str, Dict[str, Dict]]] = {}
+
+    def __init__(self, near_clash_days: int = DEFAULT_NEAR_CLASH_DAYS, use_global_graph: bool = False):
+        self.near_clash_days = near_clash_days
+        self.use_global_graph = use_global_graph
+
     def detect_clashes(self, user_exams: List[str], db: Session) -> Dict:
         """
         Detect conflicting exam dates
         """
-        exam_dates = {}
-        for exam_code in user_exams:
-            exam = db.query(Exam).filter(Exam.code == exam_code).first()
-            if exam and exam.important_dates:
-                dates = json.loads(exam.important_dates)
-                exam_dates[exam_code] = dates.get("exam_dates", [])
-
-        clashes = []
-        for i, (exam1, dates1) in enumerate(exam_dates.items()):
-            for j, (exam2, dates2) in enumerate(exam_dates.items()):
-                if i < j:  # Avoid duplicate comparisons
-                    overlapping_dates = set(dates1) & set(dates2)
-                    if overlapping_dates:
-                        clashes.append({
-                            "exams": [exam1, exam2],
-                            "conflicting_dates": list(overlapping_dates),
-                            "severity": "high" if len(overlapping_dates) > 1 else "medium"
-                        })
+        if self.use_global_graph:
+            graph = self.clash_graph(db)
+            clashes = []
+            for i, exam1 in enumerate(user_exams):
+                for exam2 in user_exams[i + 1:]:
+                    clash = graph.get(exam1, {}).get(exam2)
+                    if clash:
+                        clashes.append(dict(clash, exams=[exam1, exam2]))
+        else:
+            exams = exam_catalog.snapshot(db).get_many(user_exams)
+            order = {code: i for i, code in enumerate(user_exams)}
+            clashes = self.find_clashes(self._intervals(exams))
+            for clash in clashes:
+                clash["exams"].sort(key=lambda code: order.get(code, len(order)))
+            clashes.sort(key=lambda c: [order.get(code, len(order)) for code in c["exams"]])
 
         return {
             "has_clashes": len(clashes) > 0,
@@ -277,6 +530,86 @@ class ExamClashDetector:
             "recommendations": self._generate_clash_resolutions(clashes, user_exams)
         }
 
+    def find_clashes(self, intervals: List[Tuple[date, date, str]]) -> List[Dict]:
+        """
+        Sweep (start, end, exam_code) day ranges and return one clash per exam pair
+        """
+        reach = timedelta(days=self.near_clash_days)
+        active: List[Tuple[date, int]] = []  # heap of (end, index)
+        pairs: Dict[Tuple[str, str], Dict] = {}
+
+        intervals = sorted(intervals)
+        for index, (start, end, code) in enumerate(intervals):
+            # Drop ranges that ended too long ago to clash with anything from here on
+            while active and active[0][0] + reach < start:
+                heapq.heappop(active)
+
+            for other_end, other_index in active:
+                other_start, _, other_code = intervals[other_index]
+                if other_code == code:
+                    continue
+                pair = pairs.setdefault(tuple(sorted((code, other_code))), {"overlap": set(), "days_apart": None})
+                if start <= other_end:
+                    overlap_end = min(end, other_end)
+                    day = start
+                    while day <= overlap_end:
+                        pair["overlap"].add(day)
+                        day += timedelta(days=1)
+                else:
+                    days_apart = (start - other_end).days
+                    if pair["days_apart"] is None or days_apart < pair["days_apart"]:
+                        pair["days_apart"] = days_apart
+
+            heapq.heappush(active, (end, index))
+
+        clashes = []
+        for (exam1, exam2), pair in sorted(pairs.items()):
+            overlap = sorted(pair["overlap"])
+            if overlap:
+                clashes.append({
+                    "exams": [exam1, exam2],
+                    "type": "overlap",
+                    "conflicting_dates": [day.isoformat() for day in overlap],
+                    "days_apart": 0,
+                    "severity": "high" if len(overlap) > 1 else "medium"
+                })
+            else:
+                clashes.append({
+                    "exams": [exam1, exam2],
+                    "type": "near_clash",
+                    "conflicting_dates": [],
+                    "days_apart": pair["days_apart"],
+                    "severity": "low"
+                })
+        return clashes
+
+    def clash_graph(self, db: Session) -> Dict[str, Dict[str, Dict]]:
+        """Whole-catalog clash graph, rebuilt only when the exam catalog changes"""
+        snapshot = exam_catalog.snapshot(db)
+        key = (snapshot.version, self.near_clash_days)
+        graph = self._graph_cache.get(key)
+        if graph is None:
+            graph = self.build_clash_graph(snapshot.exams)
+            ExamClashDetector._graph_cache = {key: graph}
+        return graph
+
+    def build_clash_graph(self, exams: List[Exam]) -> Dict[str, Dict[str, Dict]]:
+        """Adjacency map exam_code -> {other_code: clash} over the given exams"""
+        graph: Dict[str, Dict[str, Dict]] = {}
+        for clash in self.find_clashes(self._intervals(exams)):
+            exam1, exam2 = clash["exams"]
+            graph.setdefault(exam1, {})[exam2] = clash
+            graph.setdefault(exam2, {})[exam1] = clash
+        return graph
+
+    @staticmethod
+    def _intervals(exams: List[Exam]) -> List[Tuple[date, date, str]]:
+        return [
+            (start, end, exam.code)
+            for exam in exams
+            for start, end in exam_date_ranges(exam.important_dates)
+        ]
+
     def _generate_clash_resolutions(self, clashes: List, user_exams: List) -> List:
         """Generate resolution recommendations"""
         if not clashes:
@@ -286,6 +619,12 @@ class ExamClashDetector:
 
         for clash in clashes:
             exam1, exam2 = clash["exams"]
+            if clash.get("type") == "near_clash":
+                recommendations.append(
+                    f"{exam1} and {exam2} are only {clash['days_apart']} day(s) apart. "
+                    f"Plan travel and keep the final revision for both light."
+                )
+                continue
             recommendations.append(
                 f"Consider prioritizing {exam1} over {exam2} if your career goals align more closely with {exam1}."
             )
@@ -295,6 +634,177 @@ class ExamClashDetector:
 
         return recommendations
 
+class RecommendationMaterializer:
+    """
+    Precomputes career and clash recommendations into the recommendations table.
+
+    Rows are identified per user by `rec_key` and upserted, so re-running the
+    job never grows the table. Each row stores a hash of the inputs and
+    results it was built from; with `only_changed`, users whose hash still
+    matches and whose rows are not close to expiry are skipped.
+    """
+
+    BATCH_SIZE = 500
+    EXPIRY = {
+        "career_path": timedelta(days=90),
+        "clash_alert": timedelta(days=30)
+    }
+    REFRESH_BEFORE_EXPIRY = timedelta(days=1)
+
+    def __init__(self, db: Session, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.clash_detector = ExamClashDetector(use_global_graph=True)
+
+    def run(self, only_changed: bool = True) -> Dict:
+        """Materialize recommendations for every user, one batch at a time"""
+        stats = {"users": 0, "refreshed": 0, "skipped": 0, "rows_written": 0, "rows_deleted": 0}
+        last_id = 0
+
+        while True:
+            users = self.db.query(User).filter(User.id > last_id).order_by(User.id).limit(self.batch_size).all()
+            if not users:
+                break
+            last_id = users[-1].id
+
+            self.materialize_batch(users, only_changed, stats)
+            self.db.commit()
+            # Keep the identity map from growing with the user table
+            self.db.expunge_all()
+
+        logger.info("Recommendations materialized", extra=stats)
+        return stats
+
+    def materialize_user(self, user: User) -> List[Recommendation]:
+        """Recompute and store one user's recommendations, highest score first"""
+        rows = self.materialize_batch([user], only_changed=False)[user.id]
+        self.db.flush()
+        ids = [row.id for row in sorted(rows, key=lambda row: (-row.score, row.id))]
+        self.db.commit()
+
+        # The commit expired the rows; reload them with their exams in one query
+        # rather than one lazy load per attribute access
+        loaded = self.db.query(Recommendation).options(joinedload(Recommendation.exam)).filter(
+            Recommendation.id.in_(ids)
+        ).all() if ids else []
+        by_id = {row.id: row for row in loaded}
+        return [by_id[row_id] for row_id in ids]
+
+    def materialize_batch(
+        self,
+        users: List[User],
+        only_changed: bool,
+        stats: Optional[Dict] = None
+    ) -> Dict[int, List[Recommendation]]:
+        """Upsert recommendations for a batch of users; returns the current rows per user"""
+        stats = stats if stats is not None else {}
+        now = datetime.utcnow()
+
+        existing: Dict[int, Dict] = {user.id: {} for user in users}
+        # Rows written before rec_key existed cannot be matched to a recommendation; drop them all
+        legacy = self.db.query(Recommendation).filter(
+            Recommendation.user_id.in_(list(existing)), Recommendation.rec_key.is_(None)
+        )
+        legacy_users = {user_id for (user_id,) in legacy.with_entities(Recommendation.user_id).distinct()}
+        if legacy_users:
+            stats["rows_deleted"] = stats.get("rows_deleted", 0) + legacy.delete(synchronize_session="fetch")
+
+        rows = self.db.query(Recommendation).filter(Recommendation.user_id.in_(list(existing))).all()
+        for row in rows:
+            existing[row.user_id][row.rec_key] = row
+
+        computed = {user.id: self._compute(user) for user in users}
+        codes = {rec["exam_code"] for recs in computed.values() for rec in recs if rec["exam_code"]}
+        exam_ids = exam_catalog.snapshot(self.db).ids_by_code(codes)
+
+        result = {}
+        for user in users:
+            stats["users"] = stats.get("users", 0) + 1
+            current = existing[user.id]
+            recs = computed[user.id]
+            input_hash = self.input_hash(user, recs)
+
+            if only_changed and user.id not in legacy_users and self._fresh(current, recs, input_hash, now):
+                stats["skipped"] = stats.get("skipped", 0) + 1
+                result[user.id] = list(current.values())
+                continue
+
+            stored = []
+            for rec in recs:
+                row = current.pop(rec["rec_key"], None)
+                if row is None:
+                    row = Recommendation(user_id=user.id, rec_key=rec["rec_key"])
+                    self.db.add(row)
+                row.exam_id = exam_ids.get(rec["exam_code"])
+                row.recommendation_type = rec["type"]
+                row.score = rec["score"]
+                row.reasoning = rec["reasoning"]
+                row.input_hash = input_hash
+                row.created_at = now
+                row.expires_at = now + self.EXPIRY[rec["type"]]
+                stored.append(row)
+
+            # Whatever is left no longer applies
+            for row in current.values():
+                self.db.delete(row)
+
+            invalidate_recommendations(user.id)
+            stats["refreshed"] = stats.get("refreshed", 0) + 1
+            stats["rows_written"] = stats.get("rows_written", 0) + len(stored)
+            stats["rows_deleted"] = stats.get("rows_deleted", 0) + len(current)
+            result[user.id] = stored
+
+        return result
+
+    @staticmethod
+    def input_hash(user: User, recs: List[Dict]) -> str:
+        """Hash of everything a user's recommendations depend on"""
+        payload = json.dumps({
+            "stage": user.current_stage,
+            "career_paths": sorted(load_json(user.career_paths, []) or []),
+            "active_exams": sorted(user.active_exams or []),
+            "recommendations": recs
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _fresh(self, current: Dict, recs: List[Dict], input_hash: str, now: datetime) -> bool:
+        if set(current) != {rec["rec_key"] for rec in recs}:
+            return False
+        return all(
+            row.input_hash == input_hash and row.expires_at and row.expires_at > now + self.REFRESH_BEFORE_EXPIRY
+            for row in current.values()
+        )
+
+    def _compute(self, user: User) -> List[Dict]:
+        """Recommendations for one user, keyed but not yet stored"""
+        recs = []
+
+        # Stage-based exam recommendations
+        for rec in lifecycle_machine.recommend_exams_for(user):
+            recs.append({
+                "rec_key": f"career_path:{rec['exam']}",
+                "type": "career_path",
+                "exam_code": rec["exam"],
+                "score": 0.9 if rec["priority"] == "high" else 0.7,
+                "reasoning": rec["reason"]
+            })
+
+        # Clash detection
+        active_exams = user.active_exams or []
+        if len(active_exams) > 1:
+            clashes = self.clash_detector.detect_clashes(active_exams, self.db)
+            for clash in clashes["clashes"]:
+                recs.append({
+                    "rec_key": "clash_alert:" + "|".join(sorted(clash["exams"])),
+                    "type": "clash_alert",
+                    "exam_code": None,
+                    "score": 0.95,
+                    "reasoning": f"Exam clash detected between {', '.join(clash['exams'])}. {clashes['recommendations'][0]}"
+                })
+
+        return recs
+
+
 class AdaptiveMentor:
     """
     Main AI mentor that combines all components
@@ -304,51 +814,34 @@ class AdaptiveMentor:
         self.db = db
         self.topic_prioritizer = TopicPrioritizer(db)
         self.clash_detector = ExamClashDetector()
+        self.materializer = RecommendationMaterializer(db)
 
     def get_personalized_recommendations(self, user_id: int) -> Dict:
         """
-        Get comprehensive personalized recommendations
+        Get comprehensive personalized recommendations.
+
+        Serves the rows stored by `RecommendationMaterializer`; a user with no
+        live rows, or whose recommendation inputs changed since they were
+        written, is materialized on the spot. Input changes also drop the
+        cached response when they commit.
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
+        cached = get_cached_recommendations(user_id)
+        if cached is not None:
+            return cached
+
+        user = self.db.get(User, user_id)
         if not user:
             return {"error": "User not found"}
 
-        recommendations = []
-
-        # Stage-based exam recommendations
-        exam_recs = lifecycle_machine.recommend_next_exams(user_id)
-        for rec in exam_recs:
-            recommendation = Recommendation(
-                user_id=user_id,
-                exam_id=self._get_exam_id_by_code(rec["exam"]),
-                recommendation_type="career_path",
-                score=0.9 if rec["priority"] == "high" else 0.7,
-                reasoning=rec["reason"],
-                expires_at=datetime.utcnow() + timedelta(days=90)
-            )
-            recommendations.append(recommendation)
+        recommendations = self._live_recommendations(user_id)
 
-        # Clash detection
-        active_exams = user.active_exams or []
-        if len(active_exams) > 1:
-            clashes = self.clash_detector.detect_clashes(active_exams, self.db)
-            if clashes["has_clashes"]:
-                for clash in clashes["clashes"]:
-                    recommendation = Recommendation(
-                        user_id=user_id,
-                        recommendation_type="clash_alert",
-                        score=0.95,
-                        reasoning=f"Exam clash detected between {', '.join(clash['exams'])}. {clashes['recommendations'][0]}",
-                        expires_at=datetime.utcnow() + timedelta(days=30)
-                    )
-                    recommendations.append(recommendation)
-
-        # Save recommendations
-        for rec in recommendations:
-            self.db.add(rec)
-        self.db.commit()
+        # Not updated_at: that moves on every login
+        changed = user.inputs_updated_at
+        stale = changed and any(rec.created_at < changed for rec in recommendations)
+        if not recommendations or stale:
+            recommendations = self.materializer.materialize_user(user)
 
-        return {
+        response = {
             "user_stage": user.current_stage,
             "career_paths": user.career_paths,
             "recommendations": [
@@ -361,11 +854,16 @@ class AdaptiveMentor:
             ],
             "next_actions": self._generate_next_actions(user)
         }
-
-    def _get_exam_id_by_code(self, exam_code: str) -> Optional[int]:
-        """Get exam ID by code"""
-        exam = self.db.query(Exam).filter(Exam.code == exam_code).first()
-        return exam.id if exam else None
+        cache_user_recommendations(user_id, response)
+        return response
+
+    def _live_recommendations(self, user_id: int) -> List[Recommendation]:
+        """Unexpired rows with their exams, highest score first"""
+        return self.db.query(Recommendation).options(joinedload(Recommendation.exam)).filter(
+            Recommendation.user_id == user_id,
+            Recommendation.rec_key.isnot(None),
+            Recommendation.expires_at > datetime.utcnow()
+        ).order_by(Recommendation.score.desc(), Recommendation.id).all()
 
     def _generate_next_actions(self, user: User) -> List[str]:
         """Generate next action items"""
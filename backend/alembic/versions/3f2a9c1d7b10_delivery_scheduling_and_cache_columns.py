@@ -0,0 +1,170 @@
+"""delivery, scheduling and cache columns
+
+Adds what the app expects on top of the original create_tables() schema:
+token versions and recommendation input stamps on users, delivery state on
+notifications, keys and hashes for materialized recommendations and scraped
+exams, and the exam_events, scraped_pages, milestone_triggers and
+job_leases tables.
+
+Tables, columns and indexes that already exist are left alone, since
+create_tables() may have created the new tables before this ran. An empty
+database is skipped: create_tables() builds its whole schema.
+
+After upgrading, fill the new tables with
+    python jobs.py exam_events
+    python jobs.py milestone_backfill
+
+Revision ID: 3f2a9c1d7b10
+Revises:
+Create Date: 2025-01-24 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2a9c1d7b10"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def _new_columns():
+    """Columns added to existing tables, built fresh per call since a Column joins one table only"""
+    return {
+        "users": [
+            sa.Column("inputs_updated_at", sa.DateTime(), nullable=True),
+            sa.Column("token_version", sa.Integer(), nullable=True, server_default=sa.text("0")),
+            sa.Column("telegram_chat_id", sa.String(), nullable=True),
+        ],
+        "exams": [
+            sa.Column("content_hash", sa.String(), nullable=True),
+        ],
+        "notifications": [
+            sa.Column("dedupe_key", sa.String(), nullable=True),
+            sa.Column("status", sa.String(), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=True),
+            sa.Column("next_attempt_at", sa.DateTime(), nullable=True),
+            sa.Column("claimed_by", sa.String(), nullable=True),
+            sa.Column("claimed_at", sa.DateTime(), nullable=True),
+            sa.Column("sent_at", sa.DateTime(), nullable=True),
+            sa.Column("last_error", sa.Text(), nullable=True),
+        ],
+        "recommendations": [
+            sa.Column("rec_key", sa.String(), nullable=True),
+            sa.Column("input_hash", sa.String(), nullable=True),
+        ],
+    }
+
+
+# (table, index name, columns) on tables that existed before
+NEW_INDEXES = [
+    ("notifications", "ix_notifications_dedupe_key", ["dedupe_key"]),
+    ("notifications", "ix_notifications_delivery", ["sent", "status", "scheduled_at"]),
+    ("recommendations", "ix_recommendations_user_id", ["user_id"]),
+    ("bookmarks", "ix_bookmarks_exam_id", ["exam_id"]),
+]
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _create_new_tables(existing):
+    if "exam_events" not in existing:
+        op.create_table(
+            "exam_events",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("exam_id", sa.Integer(), sa.ForeignKey("exams.id"), nullable=False),
+            sa.Column("event_type", sa.String(), nullable=False),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("end_date", sa.Date(), nullable=False),
+        )
+        op.create_index("ix_exam_events_id", "exam_events", ["id"])
+        op.create_index("ix_exam_events_exam_id", "exam_events", ["exam_id"])
+        op.create_index("ix_exam_events_upcoming", "exam_events", ["end_date", "id"])
+        op.create_index("ix_exam_events_type_upcoming", "exam_events", ["event_type", "end_date", "id"])
+
+    if "scraped_pages" not in existing:
+        op.create_table(
+            "scraped_pages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("url", sa.String(), nullable=False, unique=True),
+            sa.Column("etag", sa.String(), nullable=True),
+            sa.Column("last_modified", sa.String(), nullable=True),
+            sa.Column("content_hash", sa.String(), nullable=True),
+            sa.Column("content_length", sa.Integer(), nullable=True),
+            sa.Column("parse_seconds", sa.Float(), nullable=True),
+            sa.Column("fetched_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_scraped_pages_id", "scraped_pages", ["id"])
+
+    if "milestone_triggers" not in existing:
+        op.create_table(
+            "milestone_triggers",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("trigger_date", sa.DateTime(), nullable=False),
+            sa.Column("fire_at", sa.DateTime(), nullable=False),
+            sa.Column("fired_at", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("user_id", "name"),
+        )
+        op.create_index("ix_milestone_triggers_id", "milestone_triggers", ["id"])
+        op.create_index("ix_milestone_triggers_user_id", "milestone_triggers", ["user_id"])
+        op.create_index("ix_milestone_triggers_due", "milestone_triggers", ["fired_at", "fire_at"])
+
+    if "job_leases" not in existing:
+        op.create_table(
+            "job_leases",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("job_name", sa.String(), nullable=False),
+            sa.Column("run_id", sa.String(), nullable=False),
+            sa.Column("shard", sa.Integer(), nullable=False),
+            sa.Column("start_id", sa.Integer(), nullable=False),
+            sa.Column("end_id", sa.Integer(), nullable=False),
+            sa.Column("checkpoint_id", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(), nullable=True),
+            sa.Column("owner", sa.String(), nullable=True),
+            sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=True),
+            sa.Column("stats", sa.JSON(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("job_name", "run_id", "shard"),
+        )
+        op.create_index("ix_job_leases_id", "job_leases", ["id"])
+
+
+def upgrade() -> None:
+    inspector = _inspector()
+    existing = set(inspector.get_table_names())
+    if "users" not in existing:
+        return
+
+    for table, columns in _new_columns().items():
+        present = {column["name"] for column in inspector.get_columns(table)}
+        for column in columns:
+            if column.name not in present:
+                op.add_column(table, column)
+
+    for table, name, columns in NEW_INDEXES:
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+    _create_new_tables(existing)
+
+
+def downgrade() -> None:
+    for table in ("job_leases", "milestone_triggers", "scraped_pages", "exam_events"):
+        op.drop_table(table)
+
+    for table, name, _ in NEW_INDEXES:
+        op.drop_index(name, table_name=table)
+
+    for table, columns in _new_columns().items():
+        with op.batch_alter_table(table) as batch:
+            for column in columns:
+                batch.drop_column(column.name)
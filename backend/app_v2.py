@@ -2,10 +2,10 @@
 ExamSensei API - Production-Ready Version
 Complete with authentication, logging, error handling, rate limiting, and monitoring
 """
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request, status
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
@@ -13,25 +13,35 @@ import time
 from typing import List, Optional, Dict, Any
 
 # Local imports
-from models import Exam, Topic, User, UserActivity, Recommendation, StudyPlan, Conversation, Gamification
-from database import get_db, create_tables
-from ai_models import AdaptiveMentor, CareerRecommender, TopicPrioritizer, ExamClashDetector
+from models import Topic, User, UserActivity, Recommendation, Conversation, Gamification
+from database import get_db, create_tables, engine, SessionLocal
+from listeners import install_listeners
+from ai_models import AdaptiveMentor, CareerRecommender, ExamClashDetector
 from chatbot import ExamSenseiChatbot
+from study_plans import StudyPlanManager
 from lifecycle import lifecycle_machine
+from catalog import exam_catalog
+from search import exam_search
+from exam_events import upcoming_events, encode_cursor, decode_cursor
 from auth import (
-    Token, UserLogin, UserRegister, authenticate_user, create_access_token,
-    create_refresh_token, get_current_active_user, create_user, get_password_hash
+    Token, UserLogin, UserRegister, RefreshRequest, LogoutRequest, authenticate_user_async,
+    get_current_active_user, create_user, password_hasher, oauth2_scheme,
+    decode_token, create_token_pair, rotate_refresh_token, revoke_token
 )
+from revocation import revocation_store
+from tracing import start_trace, end_trace, query_budget, query_problems
+from metrics import observe_request, render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
 from config import settings
-from logger import logger, log_api_request, log_error, log_user_activity
+from logger import logger, log_api_request, log_error, log_user_activity, request_log_sampler
 from exceptions import (
-    ExamSenseiException, AuthenticationError, ResourceNotFoundError,
+    ExamSenseiException, AuthenticationError, ResourceNotFoundError, QueryBudgetExceeded,
     not_found, unauthorized, bad_request, internal_error
 )
 
 # Pydantic models
 from pydantic import BaseModel, EmailStr
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
 
 
@@ -41,9 +51,13 @@ async def lifespan(app: FastAPI):
     """Manage application lifecycle"""
     # Startup
     logger.info("🚀 Starting ExamSensei API...")
+    install_listeners(engine, SessionLocal)
     create_tables()
     logger.info("✅ Database tables created/verified")
     
+    revocation_store.start_sync()
+    exam_catalog.start_sync()
+    
     # Initialize monitoring
     if settings.sentry_dsn:
         import sentry_sdk
@@ -92,32 +106,82 @@ if settings.environment == "production":
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log all API requests"""
-    start_time = time.time()
-    
-    # Generate request ID
-    request_id = f"{int(time.time() * 1000)}"
+    """
+    Trace and log API requests. Successes are sampled per route, errors always
+    logged; every response gets a unique X-Request-ID and a Server-Timing
+    breakdown of database, cache and LLM time.
+    """
+    checks = _query_checks()
+    trace, token = start_trace(repeat_threshold=settings.n_plus_one_threshold if checks != "off" else None)
+    start_time = time.perf_counter()
     
     # Process request
-    response = await call_next(request)
+    try:
+        response = await call_next(request)
+    except Exception:
+        observe_request(request.method, _route_label(request), 500, time.perf_counter() - start_time)
+        log_api_request(
+            method=request.method,
+            path=request.url.path,
+            status_code=500,
+            duration_ms=(time.perf_counter() - start_time) * 1000,
+            request_id=trace.request_id,
+            timings=trace.totals()
+        )
+        raise
+    finally:
+        end_trace(token)
     
     # Calculate duration
-    duration = time.time() - start_time
+    duration = time.perf_counter() - start_time
+    observe_request(request.method, _route_label(request), response.status_code, duration)
+    if checks != "off":
+        _check_queries(request, trace, checks)
     
     # Log request
-    log_api_request(
-        method=request.method,
-        path=request.url.path,
-        status_code=response.status_code
-    )
+    route = request.scope.get("route")
+    if request_log_sampler.should_log(route.path if route else request.url.path, response.status_code):
+        log_api_request(
+            method=request.method,
+            path=request.url.path,
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            request_id=trace.request_id,
+            timings=trace.totals()
+        )
     
     # Add custom headers
-    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Request-ID"] = trace.request_id
     response.headers["X-Process-Time"] = str(duration)
+    response.headers["Server-Timing"] = trace.server_timing()
     
     return response
 
 
+def _query_checks() -> str:
+    return settings.query_checks or ("off" if settings.environment == "production" else "log")
+
+
+def _check_queries(request: Request, trace, mode: str):
+    """Enforce the endpoint's query budget and flag N+1 loops"""
+    route = request.scope.get("route")
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+    problems = query_problems(trace, budget)
+    if not problems:
+        return
+    
+    message = f"Query check failed for {request.method} {_route_label(request)}:\n" + "\n".join(problems)
+    if mode == "raise":
+        raise QueryBudgetExceeded(message, {"queries": trace.query_count, "budget": budget})
+    logger.warning(message)
+
+
+def _route_label(request: Request) -> str:
+    """Path template of the matched route; unmatched paths share one label to bound cardinality"""
+    route = request.scope.get("route")
+    return route.path if route else "unmatched"
+
+
 # Global exception handler
 @app.exception_handler(ExamSenseiException)
 async def examsensei_exception_handler(request: Request, exc: ExamSenseiException):
@@ -174,6 +238,38 @@ class ExamResponse(BaseModel):
         from_attributes = True
 
 
+class ExamSearchResult(BaseModel):
+    id: int
+    name: str
+    code: str
+    body: Optional[str] = None
+    exam_type: Optional[str] = None
+    score: float
+
+
+class ExamEventResponse(BaseModel):
+    exam_id: int
+    exam_code: Optional[str] = None
+    exam_name: Optional[str] = None
+    event_type: str
+    start_date: date
+    end_date: date
+
+
+class UpcomingEventsResponse(BaseModel):
+    events: List[ExamEventResponse]
+    next_cursor: Optional[str] = None
+
+
+class ExamSuggestion(BaseModel):
+    id: int
+    name: str
+    code: str
+
+    class Config:
+        from_attributes = True
+
+
 class ChatMessage(BaseModel):
     message: str
     session_id: Optional[str] = None
@@ -184,11 +280,16 @@ class StudyPlanRequest(BaseModel):
     days_available: int = 90
 
 
+class JointStudyPlanRequest(BaseModel):
+    days_available: Optional[int] = None
+
+
 # ============================================================================
 # AUTHENTICATION ENDPOINTS
 # ============================================================================
 
 @app.post(f"{settings.api_prefix}/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@query_budget(4)
 async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     """Register new user"""
     try:
@@ -197,24 +298,28 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         if existing_user:
             raise bad_request("Email already registered")
         
-        # Create user
-        new_user = create_user(db, user_data)
+        # Create user; bcrypt runs on the hashing pool, not the event loop
+        hashed_password = await password_hasher.hash(user_data.password)
+        new_user = create_user(db, user_data, hashed_password=hashed_password)
         logger.info(f"New user registered: {new_user.email}")
         
         return new_user
     
+    except HTTPException:
+        raise
     except Exception as e:
         log_error(e)
         raise internal_error("Registration failed")
 
 
 @app.post(f"{settings.api_prefix}/auth/login", response_model=Token)
+@query_budget(4)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Login and get access token"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     
     if not user:
         logger.warning(f"Failed login attempt for: {form_data.username}")
@@ -224,20 +329,39 @@ async def login(
     user.last_login = datetime.utcnow()
     db.commit()
     
-    # Create tokens
-    access_token = create_access_token(data={"sub": user.id, "email": user.email})
-    refresh_token = create_refresh_token(data={"sub": user.id, "email": user.email})
-    
     logger.info(f"User logged in: {user.email}")
     
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer"
-    }
+    return create_token_pair(user)
+
+
+@app.post(f"{settings.api_prefix}/auth/refresh", response_model=Token)
+@query_budget(3)
+async def refresh(request: RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new token pair; the old refresh token stops working"""
+    return rotate_refresh_token(db, request.refresh_token)
+
+
+@app.post(f"{settings.api_prefix}/auth/logout")
+@query_budget(2)
+async def logout(
+    request: LogoutRequest,
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Revoke the access token and, if given, the refresh token"""
+    revoke_token(decode_token(token))
+    if request.refresh_token:
+        try:
+            revoke_token(decode_token(request.refresh_token, token_type="refresh"))
+        except HTTPException:
+            pass  # already expired or malformed: nothing to revoke
+    
+    logger.info(f"User logged out: {current_user.email}")
+    return {"message": "Logged out successfully"}
 
 
 @app.get(f"{settings.api_prefix}/auth/me", response_model=UserResponse)
+@query_budget(1)
 async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
     """Get current user information"""
     return current_user
@@ -248,24 +372,21 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
 # ============================================================================
 
 @app.get(f"{settings.api_prefix}/users/{{user_id}}", response_model=UserResponse)
+@query_budget(1)
 async def get_user(
     user_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user)
 ):
     """Get user by ID (must be authenticated)"""
     # Users can only access their own data unless admin
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise not_found("User", str(user_id))
-    
-    return user
+    return current_user
 
 
 @app.put(f"{settings.api_prefix}/users/{{user_id}}/profile")
+@query_budget(3)
 async def update_user_profile(
     user_id: int,
     profile_data: Dict[str, Any],
@@ -276,9 +397,7 @@ async def update_user_profile(
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise not_found("User", str(user_id))
+    user = current_user
     
     # Update preparation profile
     current_profile = json.loads(user.preparation_profile) if user.preparation_profile else {}
@@ -297,6 +416,7 @@ async def update_user_profile(
 # ============================================================================
 
 @app.get(f"{settings.api_prefix}/exams", response_model=List[ExamResponse])
+@query_budget(1)
 async def get_exams(
     skip: int = 0,
     limit: int = 100,
@@ -304,17 +424,72 @@ async def get_exams(
     db: Session = Depends(get_db)
 ):
     """Get list of exams (public endpoint)"""
-    query = db.query(Exam)
-    if exam_type:
-        query = query.filter(Exam.exam_type == exam_type)
-    exams = query.offset(skip).limit(limit).all()
-    return exams
+    exams = exam_catalog.snapshot(db).filter(exam_type=exam_type or None)
+    return list(exams[skip:skip + limit])
+
+
+@app.get(f"{settings.api_prefix}/exams/search", response_model=List[ExamSearchResult])
+@query_budget(1)
+async def search_exams(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    exam_type: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Search exams by name, code, body and syllabus, tolerating typos (public endpoint)"""
+    return [
+        ExamSearchResult(
+            id=exam.id, name=exam.name, code=exam.code, body=exam.body, exam_type=exam.exam_type, score=score
+        )
+        for exam, score in exam_search.search(db, q, limit, exam_type)
+    ]
+
+
+@app.get(f"{settings.api_prefix}/exams/autocomplete", response_model=List[ExamSuggestion])
+@query_budget(1)
+async def autocomplete_exams(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    """Exam name completions for a search box (public endpoint)"""
+    return exam_search.autocomplete(db, q, limit)
+
+
+@app.get(f"{settings.api_prefix}/exams/upcoming", response_model=UpcomingEventsResponse)
+@query_budget(2)
+async def get_upcoming_events(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    event_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Exam dates and deadlines still ahead on `since` (default today), soonest deadline first; pass next_cursor for the next page"""
+    events, next_cursor = upcoming_events(
+        db, since or date.today(), limit, after=decode_cursor(cursor), until=until, event_type=event_type
+    )
+    catalog = exam_catalog.snapshot(db)
+    results = []
+    for event in events:
+        exam = catalog.get(event.exam_id)
+        results.append(ExamEventResponse(
+            exam_id=event.exam_id,
+            exam_code=exam.code if exam else None,
+            exam_name=exam.name if exam else None,
+            event_type=event.event_type,
+            start_date=event.start_date,
+            end_date=event.end_date
+        ))
+    return UpcomingEventsResponse(events=results, next_cursor=encode_cursor(next_cursor))
 
 
 @app.get(f"{settings.api_prefix}/exams/{{exam_id}}", response_model=ExamResponse)
+@query_budget(1)
 async def get_exam(exam_id: int, db: Session = Depends(get_db)):
     """Get exam details"""
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+    exam = exam_catalog.snapshot(db).get(exam_id)
     if not exam:
         raise not_found("Exam", str(exam_id))
     return exam
@@ -325,6 +500,7 @@ async def get_exam(exam_id: int, db: Session = Depends(get_db)):
 # ============================================================================
 
 @app.post(f"{settings.api_prefix}/users/{{user_id}}/chat")
+@query_budget(25)
 async def chat_with_mentor(
     user_id: int,
     message: ChatMessage,
@@ -348,6 +524,7 @@ async def chat_with_mentor(
 
 
 @app.get(f"{settings.api_prefix}/users/{{user_id}}/recommendations")
+@query_budget(15)
 async def get_user_recommendations(
     user_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -368,6 +545,7 @@ async def get_user_recommendations(
 
 
 @app.post(f"{settings.api_prefix}/users/{{user_id}}/study-plan")
+@query_budget(6)
 async def generate_study_plan(
     user_id: int,
     plan_request: StudyPlanRequest,
@@ -379,25 +557,14 @@ async def generate_study_plan(
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     try:
-        prioritizer = TopicPrioritizer(db)
-        plan = prioritizer.generate_study_plan(
+        # Reuses the active plan, re-planning only the days a profile change affects
+        manager = StudyPlanManager(db)
+        plan = manager.get_or_update_plan(
             user_id,
             plan_request.exam_code,
             plan_request.days_available
         )
         
-        # Save study plan
-        exam = db.query(Exam).filter(Exam.code == plan_request.exam_code).first()
-        if exam:
-            study_plan = StudyPlan(
-                user_id=user_id,
-                exam_id=exam.id,
-                plan_data=json.dumps(plan),
-                is_active=True
-            )
-            db.add(study_plan)
-            db.commit()
-        
         log_user_activity(user_id, "study_plan_generated", {"exam": plan_request.exam_code})
         return plan
     
@@ -406,11 +573,36 @@ async def generate_study_plan(
         raise internal_error("Study plan generation failed")
 
 
+@app.post(f"{settings.api_prefix}/users/{{user_id}}/study-plan/joint")
+@query_budget(6)
+async def generate_joint_study_plan(
+    user_id: int,
+    plan_request: JointStudyPlanRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Generate one study plan across all of the user's active exams"""
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    
+    try:
+        manager = StudyPlanManager(db)
+        plan = manager.get_or_update_joint_plan(user_id, plan_request.days_available)
+        
+        log_user_activity(user_id, "joint_study_plan_generated", {"exams": plan.get("exam_codes")})
+        return plan
+    
+    except Exception as e:
+        log_error(e, {"user_id": user_id})
+        raise internal_error("Study plan generation failed")
+
+
 # ============================================================================
 # GAMIFICATION ENDPOINTS
 # ============================================================================
 
 @app.get(f"{settings.api_prefix}/users/{{user_id}}/gamification")
+@query_budget(4)
 async def get_gamification_status(
     user_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -439,6 +631,7 @@ async def get_gamification_status(
 # ============================================================================
 
 @app.get(f"{settings.api_prefix}/health")
+@query_budget(0)
 async def health_check():
     """Health check endpoint"""
     return {
@@ -449,7 +642,15 @@ async def health_check():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+@query_budget(2)
+async def metrics(db: Session = Depends(get_db)):
+    """Prometheus metrics, aggregated across worker processes"""
+    return Response(render_metrics(db), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/")
+@query_budget(0)
 async def root():
     """Root endpoint"""
     return {
@@ -2,22 +2,40 @@
 Authentication and authorization module
 Implements JWT-based authentication with refresh tokens
 """
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Any, Callable, Iterable, Optional, Dict, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Session, make_transient_to_detached
 from pydantic import BaseModel, EmailStr
 from models import User
 from database import get_db
 from config import settings
+from exceptions import service_overloaded
+from cache import cache
+from revocation import revocation_store
+from metrics import RATE_LIMIT_REJECTIONS
 import secrets
 
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing. Pinning min and max rounds to the configured cost makes
+# passlib flag hashes made with any other cost for rehashing on login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds
+)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.api_prefix}/auth/login")
@@ -32,6 +50,18 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: Optional[int] = None
     email: Optional[str] = None
+    version: int = 0
+    token_type: Optional[str] = None
+    jti: Optional[str] = None
+    expires_at: Optional[int] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 
 class UserLogin(BaseModel):
@@ -65,6 +95,52 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a bounded thread pool.
+
+    bcrypt releases the GIL, so the threads hash in parallel while the event
+    loop keeps serving other requests. At most `max_pending` operations may
+    be queued or running; beyond that callers are rejected straight away
+    with a 503 rather than piling up behind a login storm.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.password_hash_workers,
+        max_pending: int = settings.password_hash_max_pending,
+        context: CryptContext = pwd_context
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_pending
+        self.context = context
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    async def hash(self, password: str) -> str:
+        """Hash a password"""
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also returns a new hash when the stored one uses outdated parameters"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    async def _run(self, fn: Callable, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                RATE_LIMIT_REJECTIONS.labels("password_hash").inc()
+                raise service_overloaded("Too many sign-ins in progress. Please try again shortly.")
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+
+password_hasher = PasswordHasher()
+
+
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -74,7 +150,7 @@ def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "type": "access", "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
@@ -83,28 +159,35 @@ def create_refresh_token(data: Dict) -> str:
     """Create JWT refresh token"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
-def decode_token(token: str) -> TokenData:
-    """Decode and validate JWT token"""
+def decode_token(token: str, token_type: str = "access") -> TokenData:
+    """Decode and validate a JWT of the given type"""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id: int = payload.get("sub")
+        user_id = payload.get("sub")
         email: str = payload.get("email")
         
-        if user_id is None:
+        if user_id is None or payload.get("type") != token_type:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        return TokenData(user_id=user_id, email=email)
+        return TokenData(
+            user_id=int(user_id),
+            email=email,
+            version=payload.get("ver", 0),
+            token_type=token_type,
+            jti=payload.get("jti"),
+            expires_at=payload.get("exp")
+        )
     
-    except JWTError:
+    except (JWTError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
@@ -112,6 +195,177 @@ def decode_token(token: str) -> TokenData:
         )
 
 
+def token_claims(user: User) -> Dict:
+    """Claims identifying a user in access and refresh tokens"""
+    return {"sub": str(user.id), "email": user.email, "ver": user.token_version or 0}
+
+
+def create_token_pair(user: User) -> Dict:
+    """Access and refresh tokens for a user"""
+    claims = token_claims(user)
+    return {
+        "access_token": create_access_token(data=claims),
+        "refresh_token": create_refresh_token(data=claims),
+        "token_type": "bearer"
+    }
+
+
+def revoke_token(token_data: TokenData) -> bool:
+    """Revoke one token until it expires; False if it already was"""
+    if not token_data.jti:
+        return True
+    return revocation_store.revoke(token_data.jti, token_data.expires_at or time.time())
+
+
+def rotate_refresh_token(db: Session, refresh_token: str) -> Dict:
+    """
+    Exchange a refresh token for a new token pair. The presented token is
+    revoked; presenting it again means it leaked, so every token of the user
+    is revoked.
+    """
+    token_data = decode_token(refresh_token, token_type="refresh")
+    user = db.get(User, token_data.user_id)
+
+    if user is None or not user.is_active or (user.token_version or 0) != token_data.version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not revoke_token(token_data):
+        revoke_user_tokens(user)
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token reuse detected; please sign in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return create_token_pair(user)
+
+
+class PrincipalCache:
+    """
+    Short-lived cache of authenticated users.
+
+    Entries are keyed by user id and token version and kept both in this
+    process (L1) and in Redis, so a protected request resolves its user
+    without a database round-trip. Credentials are never cached. A cached
+    user is attached to the request's session without loading it; columns
+    left out of the cache are loaded on first access.
+    """
+
+    EXCLUDED = {"hashed_password", "reset_token", "reset_token_expires"}
+    # Columns whose changes leave a cached user good enough to authorize with
+    UNTRACKED = EXCLUDED | {"last_login", "updated_at"}
+    MAX_LOCAL_ENTRIES = 10000
+
+    def __init__(
+        self,
+        ttl: int = settings.principal_cache_ttl,
+        local_ttl: int = settings.principal_cache_local_ttl
+    ):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._local: "OrderedDict[Tuple[int, int], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int, version: int) -> Optional[User]:
+        """The cached user attached to `db`, or None on a miss"""
+        data = self._get_local(user_id, version)
+        if data is None:
+            data = cache.get(self._key(user_id, version))
+            if data is None:
+                return None
+            self._set_local(user_id, version, data)
+        return self._attach(db, data)
+
+    def set(self, user: User):
+        """Cache a user loaded from the database"""
+        data = self._serialize(user)
+        version = user.token_version or 0
+        self._set_local(user.id, version, data)
+        cache.set(self._key(user.id, version), data, self.ttl)
+
+    def invalidate(self, user_id: int, versions: Iterable[int]):
+        """Drop a user's cached copies at the given token versions"""
+        versions = set(versions)
+        with self._lock:
+            for version in versions:
+                self._local.pop((user_id, version), None)
+        for version in versions:
+            cache.delete(self._key(user_id, version))
+
+    def user_committed(self, user_id: int, changed: Set[str], versions: Set[int]):
+        """Invalidate a user whose row changed in a commit, unless only untracked columns changed"""
+        if changed - self.UNTRACKED:
+            self.invalidate(user_id, versions)
+
+    def clear(self):
+        """Drop this process's cached users"""
+        with self._lock:
+            self._local.clear()
+
+    def _get_local(self, user_id: int, version: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._local.get((user_id, version))
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                del self._local[(user_id, version)]
+                return None
+            return data
+
+    def _set_local(self, user_id: int, version: int, data: Dict):
+        with self._lock:
+            self._local[(user_id, version)] = (time.monotonic() + self.local_ttl, data)
+            self._local.move_to_end((user_id, version))
+            while len(self._local) > self.MAX_LOCAL_ENTRIES:
+                self._local.popitem(last=False)
+
+    @staticmethod
+    def _key(user_id: int, version: int) -> str:
+        return f"principal:{user_id}:{version}"
+
+    @classmethod
+    def _serialize(cls, user: User) -> Dict[str, Any]:
+        data = {}
+        for column in User.__table__.columns:
+            if column.key in cls.EXCLUDED:
+                continue
+            value = getattr(user, column.key)
+            data[column.key] = value.isoformat() if isinstance(value, datetime) else value
+        return data
+
+    @staticmethod
+    def _attach(db: Session, data: Dict[str, Any]) -> User:
+        fields = {}
+        for column in User.__table__.columns:
+            if column.key not in data:
+                continue
+            value = data[column.key]
+            if value is not None and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            fields[column.key] = value
+        user = User(**fields)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+
+principal_cache = PrincipalCache()
+
+
+def revoke_user_tokens(user: User):
+    """
+    Invalidate every token issued to a user, e.g. after a password change or
+    deactivation. Takes effect once the caller commits.
+    """
+    principal_cache.invalidate(user.id, [user.token_version or 0])
+    user.token_version = (user.token_version or 0) + 1
+
+
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
     user = db.query(User).filter(User.email == email).first()
@@ -128,13 +382,48 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     return user
 
 
+async def authenticate_user_async(db: Session, email: str, password: str) -> Optional[User]:
+    """
+    Authenticate user without blocking the event loop. A hash made with
+    outdated bcrypt parameters is replaced; the caller commits.
+    """
+    user = db.query(User).filter(User.email == email).first()
+
+    if not user or not user.hashed_password:
+        return None
+
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
+        return None
+
+    if new_hash:
+        user.hashed_password = new_hash
+
+    return user
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
-    """Get current authenticated user"""
+    """
+    Get current authenticated user. The user is attached to the request's
+    session, so endpoints use it directly instead of querying it again.
+    """
     token_data = decode_token(token)
     
+    # Bloom filter first: only a filter hit costs a Redis round-trip
+    if token_data.jti and revocation_store.is_revoked(token_data.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user = principal_cache.get(db, token_data.user_id, token_data.version)
+    if user is not None:
+        return user
+    
     user = db.query(User).filter(User.id == token_data.user_id).first()
     
     if user is None:
@@ -144,16 +433,23 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if (user.token_version or 0) != token_data.version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    principal_cache.set(user)
     return user
 
 
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
-    """Get current active user (can add is_active check)"""
-    # Add is_active field to User model if needed
-    # if not current_user.is_active:
-    #     raise HTTPException(status_code=400, detail="Inactive user")
+    """Get current active user"""
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
@@ -162,9 +458,9 @@ def generate_reset_token() -> str:
     return secrets.token_urlsafe(32)
 
 
-def create_user(db: Session, user_data: UserRegister) -> User:
+def create_user(db: Session, user_data: UserRegister, hashed_password: Optional[str] = None) -> User:
     """Create new user with hashed password"""
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = hashed_password or get_password_hash(user_data.password)
     
     db_user = User(
         email=user_data.email,
@@ -9,6 +9,9 @@ from functools import wraps
 from config import settings
 from logger import logger
 import hashlib
+import time
+from tracing import record
+from metrics import CACHE_REQUESTS, RATE_LIMIT_REJECTIONS, cache_prefix
 
 
 class CacheManager:
@@ -56,12 +59,17 @@ class CacheManager:
         if not self.enabled:
             return None
         
+        start = time.perf_counter()
         try:
             value = self.redis_client.get(key)
+            record("cache", time.perf_counter() - start, cache_hits=int(bool(value)), cache_misses=int(not value))
+            CACHE_REQUESTS.labels(cache_prefix(key), "hit" if value else "miss").inc()
             if value:
                 return json.loads(value)
             return None
         except Exception as e:
+            record("cache", time.perf_counter() - start, cache_errors=1)
+            CACHE_REQUESTS.labels(cache_prefix(key), "error").inc()
             logger.error(f"Cache get error: {e}")
             return None
     
@@ -70,11 +78,14 @@ class CacheManager:
         if not self.enabled:
             return False
         
+        start = time.perf_counter()
         try:
             serialized = json.dumps(value, default=str)
             self.redis_client.setex(key, ttl, serialized)
+            record("cache", time.perf_counter() - start)
             return True
         except Exception as e:
+            record("cache", time.perf_counter() - start, cache_errors=1)
             logger.error(f"Cache set error: {e}")
             return False
     
@@ -83,10 +94,13 @@ class CacheManager:
         if not self.enabled:
             return False
         
+        start = time.perf_counter()
         try:
             self.redis_client.delete(key)
+            record("cache", time.perf_counter() - start)
             return True
         except Exception as e:
+            record("cache", time.perf_counter() - start, cache_errors=1)
             logger.error(f"Cache delete error: {e}")
             return False
     
@@ -194,6 +208,8 @@ class RateLimiter:
             current = cache.increment(key, 1, window_seconds)
             remaining = max(0, max_requests - current)
             is_allowed = current <= max_requests
+            if not is_allowed:
+                RATE_LIMIT_REJECTIONS.labels("api").inc()
             
             return is_allowed, remaining
         except Exception as e:
@@ -228,6 +244,11 @@ def get_cached_recommendations(user_id: int) -> Optional[dict]:
     return cache.get(f"recommendations:{user_id}")
 
 
+def invalidate_recommendations(user_id: int):
+    """Drop cached recommendations for a user"""
+    cache.delete(f"recommendations:{user_id}")
+
+
 def invalidate_user_cache(user_id: int):
     """Invalidate all cache for a user"""
     invalidate_pattern(f"*:{user_id}")
@@ -0,0 +1,232 @@
+"""
+In-memory exam catalog for ExamSensei
+Read-only snapshot of the exams table with lookup indexes, reloaded when its version changes
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import Exam
+from cache import cache
+from logger import logger
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def name_tokens(text: str) -> List[str]:
+    """Lower-cased alphanumeric words of an exam name or query"""
+    return _TOKEN.findall((text or "").lower())
+
+
+class CatalogExam:
+    """Read-only copy of one Exam row; has the same attributes as the model's columns"""
+
+    __slots__ = tuple(attr.key for attr in inspect(Exam).column_attrs)
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            object.__setattr__(self, field, row[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Catalog exams are read-only")
+
+    def __repr__(self) -> str:
+        return f"<CatalogExam {self.id} {self.code}>"
+
+
+class CatalogSnapshot:
+    """Every exam at one catalog version, indexed by id, code, body, type and name token"""
+
+    def __init__(self, exams: Iterable[CatalogExam], version: int):
+        self.version = version
+        self.exams: Tuple[CatalogExam, ...] = tuple(sorted(exams, key=lambda exam: exam.id))
+        self.by_id: Dict[int, CatalogExam] = {exam.id: exam for exam in self.exams}
+        self.by_code: Dict[str, CatalogExam] = {exam.code: exam for exam in self.exams if exam.code}
+        self.by_body: Dict[str, Tuple[CatalogExam, ...]] = self._group(self.exams, lambda exam: exam.body)
+        self.by_type: Dict[str, Tuple[CatalogExam, ...]] = self._group(self.exams, lambda exam: exam.exam_type)
+
+        tokens: Dict[str, set] = {}
+        for exam in self.exams:
+            for token in name_tokens(exam.name):
+                tokens.setdefault(token, set()).add(exam.id)
+        self.by_token: Dict[str, frozenset] = {token: frozenset(ids) for token, ids in tokens.items()}
+
+    def get(self, exam_id: int) -> Optional[CatalogExam]:
+        return self.by_id.get(exam_id)
+
+    def get_by_code(self, code: str) -> Optional[CatalogExam]:
+        return self.by_code.get(code)
+
+    def get_many(self, codes: Iterable[str]) -> List[CatalogExam]:
+        """Exams for the known codes, once each, in the order given"""
+        return [self.by_code[code] for code in dict.fromkeys(codes) if code in self.by_code]
+
+    def ids_by_code(self, codes: Iterable[str]) -> Dict[str, int]:
+        return {exam.code: exam.id for exam in self.get_many(codes)}
+
+    def find_by_name(self, text: str) -> Optional[CatalogExam]:
+        """
+        First exam (by id) whose name contains `text`, ignoring case. Whole
+        words narrow the candidates through the token index; a partial word
+        falls back to scanning the snapshot.
+        """
+        needle = (text or "").strip().lower()
+        if not needle:
+            return None
+
+        candidates = self.exams
+        tokens = name_tokens(needle)
+        if tokens and all(token in self.by_token for token in tokens):
+            ids = frozenset.intersection(*(self.by_token[token] for token in tokens))
+            candidates = sorted((self.by_id[exam_id] for exam_id in ids), key=lambda exam: exam.id)
+        match = next((exam for exam in candidates if needle in (exam.name or "").lower()), None)
+        if match is None and candidates is not self.exams:
+            # Whole words found but not as one phrase; a partial word may still match
+            match = next((exam for exam in self.exams if needle in (exam.name or "").lower()), None)
+        return match
+
+    def filter(self, exam_type: Optional[str] = None, body: Optional[str] = None) -> Tuple[CatalogExam, ...]:
+        exams = self.exams
+        if exam_type is not None:
+            exams = self.by_type.get(exam_type, ())
+        if body is not None:
+            exams = tuple(exam for exam in exams if exam.body == body)
+        return exams
+
+    @staticmethod
+    def _group(exams: Iterable[CatalogExam], key) -> Dict[str, Tuple[CatalogExam, ...]]:
+        groups: Dict[str, List[CatalogExam]] = {}
+        for exam in exams:
+            groups.setdefault(key(exam), []).append(exam)
+        return {value: tuple(members) for value, members in groups.items()}
+
+
+class ExamCatalog:
+    """
+    Process-local exam catalog.
+
+    The exam table is small and read-mostly, so each process keeps an
+    immutable CatalogSnapshot and serves lookups from its dictionaries. Every
+    committed change to an Exam row bumps a version counter in Redis and
+    publishes it; processes following the channel mark their snapshot stale
+    and the next read loads a new one and swaps it in whole, so readers never
+    see a half-built catalog.
+
+    Without Redis the version is local, which is enough for a single process;
+    writers in other processes are only seen after `bump_version` or a restart.
+    """
+
+    VERSION_KEY = "catalog:version"
+    CHANNEL = "catalog-updates"
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._reload_lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self, db: Session) -> CatalogSnapshot:
+        """The current snapshot, loading it with `db` if the catalog changed since the last load"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+
+        with self._reload_lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != self._version:
+                snapshot = self._load(db, self._version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def bump_version(self):
+        """Mark every process's snapshot stale after exams were written"""
+        if cache.enabled:
+            try:
+                version = int(cache.redis_client.incr(self.VERSION_KEY))
+                cache.redis_client.publish(self.CHANNEL, version)
+                self._set_version(version)
+                return
+            except Exception as e:
+                logger.error(f"Catalog version bump error: {e}")
+        self._set_version(self._version + 1)
+
+    def start_sync(self):
+        """Adopt the shared version and follow other processes' bumps over pub/sub"""
+        if not cache.enabled or self._listener is not None:
+            return
+        self._sync_version()
+        self._listener = threading.Thread(target=self._listen, name="catalog-sync", daemon=True)
+        self._listener.start()
+
+    def clear(self):
+        """Drop the loaded snapshot"""
+        with self._reload_lock:
+            self._snapshot = None
+
+    def _load(self, db: Session, version: int) -> CatalogSnapshot:
+        start = time.perf_counter()
+        # Plain rows rather than entities, so the request session's identity map stays empty
+        rows = db.execute(select(Exam.__table__)).mappings().all()
+        snapshot = CatalogSnapshot((CatalogExam(row) for row in rows), version)
+        logger.info(
+            f"Exam catalog v{version} loaded with {len(snapshot.exams)} exams "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        return snapshot
+
+    def _set_version(self, version: int):
+        # Versions only move forward; a late message for an older bump is ignored
+        if version > self._version:
+            self._version = version
+
+    def _sync_version(self):
+        try:
+            self._set_version(int(cache.redis_client.get(self.VERSION_KEY) or 0))
+        except Exception as e:
+            logger.error(f"Catalog version sync error: {e}")
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = cache.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    self._set_version(int(message["data"]))
+            except Exception as e:
+                logger.warning(f"Catalog sync interrupted, resubscribing: {e}")
+                time.sleep(5)
+                # Bumps published while disconnected are read from the counter
+                self._sync_version()
+
+
+exam_catalog = ExamCatalog()
+
+
+# Any installed session that commits exam changes bumps the catalog version
+def _note_exam_changes(session, flush_context):
+    if any(isinstance(obj, Exam) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["exam_catalog_changed"] = True
+
+
+def _bump_after_commit(session):
+    if session.info.pop("exam_catalog_changed", False):
+        exam_catalog.bump_version()
+
+
+def _forget_after_rollback(session):
+    session.info.pop("exam_catalog_changed", None)
+
+
+def install(session_factory):
+    """Bump the catalog version after sessions from `session_factory` commit exam changes; installing twice is a no-op"""
+    if event.contains(session_factory, "after_commit", _bump_after_commit):
+        return
+    event.listen(session_factory, "after_flush", _note_exam_changes)
+    event.listen(session_factory, "after_commit", _bump_after_commit)
+    event.listen(session_factory, "after_rollback", _forget_after_rollback)
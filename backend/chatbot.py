@@ -1,11 +1,16 @@
 import json
+import time
 import requests
 from typing import Dict, List, Optional
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy.orm import Session
-from models import User, Conversation, Exam, Topic
-from ai_models import AdaptiveMentor, TopicPrioritizer
+from models import User, Conversation, Topic, load_json
+from ai_models import AdaptiveMentor, TopicPrioritizer, JointStudyPlanner
 from lifecycle import lifecycle_machine
+from search import exam_search
+from exam_events import upcoming_events
+from tracing import span
+from metrics import LLM_IN_FLIGHT, LLM_LATENCY
 
 class ExamSenseiChatbot:
     """
@@ -17,6 +22,7 @@ class ExamSenseiChatbot:
         self.ollama_url = ollama_url
         self.mentor = AdaptiveMentor(db)
         self.topic_prioritizer = TopicPrioritizer(db)
+        self.joint_planner = JointStudyPlanner(db)
 
         # System prompt for the chatbot
         self.system_prompt = """
@@ -86,7 +92,7 @@ class ExamSenseiChatbot:
 
     def _get_user_context(self, user_id: int) -> Dict:
         """Get comprehensive user context for personalization"""
-        user = self.db.query(User).filter(User.id == user_id).first()
+        user = self.db.get(User, user_id)
 
         if not user:
             return {"error": "User not found"}
@@ -96,7 +102,7 @@ class ExamSenseiChatbot:
             "current_stage": user.current_stage,
             "career_paths": user.career_paths or [],
             "active_exams": user.active_exams or [],
-            "preparation_profile": user.preparation_profile or {},
+            "preparation_profile": load_json(user.preparation_profile, {}),
             "education_level": user.education_level,
             "state": user.state,
             "category": user.category,
@@ -148,6 +154,20 @@ class ExamSenseiChatbot:
             ollama_intent = self._ollama_intent_analysis(message, context)
             return ollama_intent
 
+    def _ollama_generate(self, payload: Dict, timeout: int) -> requests.Response:
+        """POST to Ollama's generate API, timed as an llm span of the request"""
+        start = time.perf_counter()
+        outcome = "error"
+        LLM_IN_FLIGHT.inc()
+        try:
+            with span("llm"):
+                response = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=timeout)
+            outcome = "ok" if response.status_code == 200 else "http_error"
+            return response
+        finally:
+            LLM_IN_FLIGHT.dec()
+            LLM_LATENCY.labels(outcome).observe(time.perf_counter() - start)
+
     def _ollama_intent_analysis(self, message: str, context: Dict) -> Dict:
         """Use Ollama for intent analysis when pattern matching fails"""
         try:
@@ -170,16 +190,12 @@ class ExamSenseiChatbot:
             {{"intent": "category", "confidence": 0.8, "reasoning": "brief explanation", "entities": {{"key": "value"}}}}
             """
 
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": "llama2",  # or whichever model you have
-                    "prompt": prompt,
-                    "format": "json",
-                    "stream": False
-                },
-                timeout=10
-            )
+            response = self._ollama_generate({
+                "model": "llama2",  # or whichever model you have
+                "prompt": prompt,
+                "format": "json",
+                "stream": False
+            }, timeout=10)
 
             if response.status_code == 200:
                 result = response.json()
@@ -258,20 +274,24 @@ class ExamSenseiChatbot:
                 "actions": ["Tell me your target exam", "Share how many hours you study daily"]
             }
 
-        # Generate study plan for primary exam
-        exam_code = active_exams[0]
         days_available = entities.get("days", 90)  # Default 3 months
 
         try:
-            plan = self.topic_prioritizer.generate_study_plan(context["user_id"], exam_code, days_available)
+            if len(active_exams) > 1:
+                # One schedule across every exam, shared topics studied once
+                plan = self.joint_planner.generate_joint_plan(context["user_id"], days_available)
+                exam_label = " + ".join(code.upper() for code in plan.get("exam_codes", active_exams))
+            else:
+                plan = self.topic_prioritizer.generate_study_plan(context["user_id"], active_exams[0], days_available)
+                exam_label = active_exams[0].upper()
 
-            response_text = f"Here's your personalized {days_available}-day study plan for {exam_code.upper()}:\n\n"
+            response_text = f"Here's your personalized {days_available}-day study plan for {exam_label}:\n\n"
 
             # Show top 3 priorities
             priorities = plan.get("prioritized_topics", [])[:3]
             for i, topic_data in enumerate(priorities, 1):
                 topic = topic_data["topic"]
-                response_text += f"{i}. **{topic.name.title()}** (Weightage: {topic_data['weightage']}%, Difficulty: {topic_data['difficulty']})\n"
+                response_text += f"{i}. **{topic['name'].title()}** (Weightage: {topic_data['weightage']}%, Difficulty: {topic_data['difficulty']})\n"
 
             response_text += f"\nEstimated success probability: {plan.get('success_probability', 0)*100:.0f}%\n\n"
             response_text += "Focus on your weak areas while maintaining strengths. Consistency is key! 💪"
@@ -368,7 +388,9 @@ class ExamSenseiChatbot:
             }
 
         # Query exam information
-        exam = self.db.query(Exam).filter(Exam.name.ilike(f"%{exam_name}%")).first()
+        # Best ranked match, so a misspelt or partial name still finds the exam
+        results = exam_search.search(self.db, exam_name, limit=1)
+        exam = results[0][0] if results else None
 
         if exam:
             dates = json.loads(exam.important_dates) if exam.important_dates else {}
@@ -381,6 +403,15 @@ class ExamSenseiChatbot:
             if dates.get("exam_dates"):
                 response_text += f"**Exam Dates**: {', '.join(dates['exam_dates'])}\n"
 
+            events, _ = upcoming_events(self.db, date.today(), limit=3, exam_id=exam.id)
+            if events:
+                response_text += "**Coming Up**: " + "; ".join(
+                    f"{event.event_type.replace('_', ' ').title()} "
+                    + (f"until {event.end_date.strftime('%d %b %Y')}" if event.start_date < date.today()
+                       else f"on {event.start_date.strftime('%d %b %Y')}")
+                    for event in events
+                ) + "\n"
+
             if pattern:
                 response_text += f"**Pattern**: {pattern.get('total_questions', 'N/A')} questions, {pattern.get('marks_per_question', 'N/A')} marks each\n"
 
@@ -409,15 +440,11 @@ class ExamSenseiChatbot:
             Focus on Indian competitive exams and practical advice.
             """
 
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": "llama2",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=15
-            )
+            response = self._ollama_generate({
+                "model": "llama2",
+                "prompt": prompt,
+                "stream": False
+            }, timeout=15)
 
             if response.status_code == 200:
                 result = response.json()
@@ -456,15 +483,11 @@ class ExamSenseiChatbot:
             Keep it concise and student-friendly.
             """
 
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": "llama2",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=15
-            )
+            response = self._ollama_generate({
+                "model": "llama2",
+                "prompt": prompt,
+                "stream": False
+            }, timeout=15)
 
             if response.status_code == 200:
                 result = response.json()
@@ -3,7 +3,7 @@ Configuration management for ExamSensei
 Loads environment variables and provides typed configuration
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 from functools import lru_cache
 
 
@@ -16,8 +16,14 @@ class Settings(BaseSettings):
     # Security
     secret_key: str = "dev-secret-key-change-in-production"
     algorithm: str = "HS256"
-    access_token_expire_minutes: int = 30
+    access_token_expire_minutes: int = 15  # short-lived; clients renew through /auth/refresh
     refresh_token_expire_days: int = 7
+    bcrypt_rounds: int = 12  # existing hashes are upgraded on next login when this changes
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 64  # queued + running hashes before logins are rejected
+    principal_cache_ttl: int = 60  # seconds an authenticated user is cached in Redis
+    principal_cache_local_ttl: int = 10  # seconds it is cached in each process
+    revocation_filter_capacity: int = 100000  # revoked tokens per Bloom filter before it grows
     
     # Ollama
     ollama_url: str = "http://localhost:11434"
@@ -37,10 +43,21 @@ class Settings(BaseSettings):
     smtp_password: str = ""
     from_email: str = "noreply@examsensei.com"
     
+    # Notification delivery
+    push_api_url: str = ""
+    push_api_key: str = ""
+    telegram_bot_token: str = ""
+    notification_batch_size: int = 200
+    notification_max_attempts: int = 5
+    notification_concurrency: Dict[str, int] = {"email": 4, "push": 32, "telegram": 10}
+    
     # Scraping
-    scraper_user_agent: str = "ExamSensei-Bot/1.0"
+    scraper_user_agent: str = "ExamSensei-Bot/1.0 (+https://examsensei.com/bot)"
     scraper_delay: int = 2
     scraper_max_retries: int = 3
+    scraper_concurrency_per_domain: int = 2  # parallel requests to one site
+    scraper_cache_dir: str = "httpcache"  # on-disk HTTP cache, under .scrapy/ when relative
+    scraper_cache_expiry: int = 1800  # seconds a downloaded page is reused without asking the site
     
     # Rate Limiting
     rate_limit_per_minute: int = 60
@@ -49,6 +66,9 @@ class Settings(BaseSettings):
     # Logging
     log_level: str = "INFO"
     log_file: str = "logs/examsensei.log"
+    log_async: bool = True  # format and write logs on a background thread
+    log_sample_rate: float = 1.0  # share of successful requests logged
+    log_route_sample_rates: Dict[str, float] = {"/api/v1/health": 0.0}  # per route template
     
     # Environment
     environment: str = "development"
@@ -59,6 +79,9 @@ class Settings(BaseSettings):
     
     # Monitoring
     sentry_dsn: str = ""
+    prometheus_multiproc_dir: str = ""  # shared directory aggregating metrics across worker processes
+    query_checks: str = ""  # off | log | raise; defaults to log, or off in production
+    n_plus_one_threshold: int = 5  # same statement this often in one request is flagged
     
     class Config:
         env_file = ".env"
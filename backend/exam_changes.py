@@ -0,0 +1,117 @@
+"""
+Exam change events for ExamSensei
+Field-level notices of scraped exam changes, fanned out to caches, the catalog and users following the exam
+"""
+from datetime import datetime
+from typing import Callable, Iterable, List
+from sqlalchemy.orm import Session
+from models import Bookmark, Notification
+from cache import cache
+from catalog import exam_catalog
+from logger import logger
+
+# Changes worth telling the users who bookmarked an exam about
+NOTIFY_FIELDS = {
+    "important_dates": "important dates",
+    "notification_url": "official notification",
+    "application_url": "application link",
+    "result_url": "result link",
+    "fees": "fees",
+    "eligibility": "eligibility",
+}
+
+
+class ExamChange:
+    """One exam's real changes from a scrape: the fields whose canonical value differs"""
+
+    __slots__ = ("exam_id", "code", "name", "fields", "content_hash", "inserted")
+
+    def __init__(self, exam_id: int, code: str, name: str, fields: Iterable[str], content_hash: str, inserted: bool = False):
+        self.exam_id = exam_id
+        self.code = code
+        self.name = name
+        self.fields = tuple(sorted(fields))
+        self.content_hash = content_hash
+        self.inserted = inserted
+
+
+class ExamChangeFeed:
+    """
+    In-process subscribers to committed exam changes. A failing subscriber
+    is logged and skipped, so one consumer can never undo a scrape.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[List[ExamChange]], None]] = []
+
+    def subscribe(self, callback: Callable[[List[ExamChange]], None]):
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, changes: List[ExamChange]):
+        if not changes:
+            return
+        for change in changes:
+            logger.info(
+                f"Exam {change.code} {'added' if change.inserted else 'changed'}: {', '.join(change.fields)}",
+                extra={"exam_id": change.exam_id, "fields": list(change.fields)}
+            )
+        for callback in self._subscribers:
+            try:
+                callback(changes)
+            except Exception as e:
+                logger.error(f"Exam change subscriber {getattr(callback, '__name__', callback)} failed: {e}")
+
+
+exam_changes = ExamChangeFeed()
+
+
+@exam_changes.subscribe
+def _refresh_catalog(changes: List[ExamChange]):
+    # Core upserts bypass the session hook that bumps the catalog
+    exam_catalog.bump_version()
+
+
+@exam_changes.subscribe
+def _drop_cached_exams(changes: List[ExamChange]):
+    for change in changes:
+        cache.delete(f"exam:{change.exam_id}")
+
+
+def queue_update_notifications(db: Session, changes: List[ExamChange]) -> int:
+    """
+    Queue an exam_update notification for every user who bookmarked a
+    changed exam, in the caller's transaction. The dedupe key carries the
+    content hash, so the same change is never announced twice.
+    """
+    notable = {
+        change.exam_id: change for change in changes
+        if not change.inserted and any(field in NOTIFY_FIELDS for field in change.fields)
+    }
+    if not notable:
+        return 0
+
+    now = datetime.utcnow()
+    keys = {exam_id: f"exam_update:{change.code}:{change.content_hash[:16]}" for exam_id, change in notable.items()}
+    sent = set(db.query(Notification.user_id, Notification.dedupe_key).filter(
+        Notification.exam_id.in_(list(notable)),
+        Notification.dedupe_key.in_(list(keys.values()))
+    ).all())
+
+    notifications = []
+    for user_id, exam_id in db.query(Bookmark.user_id, Bookmark.exam_id).filter(Bookmark.exam_id.in_(list(notable))).distinct():
+        if (user_id, keys[exam_id]) in sent:
+            continue
+        change = notable[exam_id]
+        labels = [NOTIFY_FIELDS[field] for field in change.fields if field in NOTIFY_FIELDS]
+        notifications.append(Notification(
+            user_id=user_id,
+            exam_id=exam_id,
+            notification_type="exam_update",
+            message=f"{change.name}: {', '.join(labels)} updated",
+            dedupe_key=keys[exam_id],
+            scheduled_at=now,
+            channel="push"
+        ))
+    db.add_all(notifications)
+    return len(notifications)
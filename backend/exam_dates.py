@@ -0,0 +1,144 @@
+"""
+Exam date parsing for ExamSensei
+Normalizes the free-form dates found in Exam.important_dates into date ranges
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from dateutil import parser as date_parser
+from models import load_json
+
+DateRange = Tuple[date, date]
+
+# "24-31 Jan 2025", "24 – 31 January, 2025"
+_DAY_SPAN = re.compile(r"^(\d{1,2})\s*[-–]\s*(\d{1,2})\s+([A-Za-z]+\.?,?\s*\d{4})$")
+# "2025-01-24 to 2025-01-31", "24 Jan 2025 - 2 Feb 2025"
+_RANGE_SEPARATORS = re.compile(r"\s+(?:to|till|until)\s+|\s+[-–]\s+", re.IGNORECASE)
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_YEAR = re.compile(r"\d{4}")
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Parse a single date in any of the formats the scrapers produce"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+
+    text = value.strip()
+    try:
+        if _ISO_DATE.match(text):
+            return datetime.fromisoformat(text[:10]).date()
+        if not _YEAR.search(text):
+            return None
+        # Indian sources write day first: 05/01/2025 is 5 January
+        return date_parser.parse(text, dayfirst=True, default=datetime(1900, 1, 1)).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_date_range(value: Any) -> Optional[DateRange]:
+    """Parse a single date or a date span into an inclusive (start, end) range"""
+    if isinstance(value, dict):
+        start = parse_date(value.get("start") or value.get("from") or value.get("date"))
+        end = parse_date(value.get("end") or value.get("to")) or start
+        return _ordered(start, end)
+
+    if isinstance(value, str):
+        text = value.strip()
+        span = _DAY_SPAN.match(text)
+        if span:
+            first, last, month_year = span.groups()
+            return _ordered(parse_date(f"{first} {month_year}"), parse_date(f"{last} {month_year}"))
+
+        parts = _RANGE_SEPARATORS.split(text)
+        if len(parts) == 2:
+            end = parse_date(parts[1])
+            start = parse_date(parts[0])
+            if start is None and end is not None:
+                # "24 Jan - 2 Feb 2025": borrow the year from the end date
+                start = parse_date(f"{parts[0]} {end.year}")
+            return _ordered(start, end)
+
+    single = parse_date(value)
+    return (single, single) if single else None
+
+
+def parse_date_ranges(value: Any) -> List[DateRange]:
+    """
+    Parse a date field that may be a string, a range, or arbitrarily nested
+    lists of either. Overlapping and back-to-back days are merged.
+    """
+    ranges = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (list, tuple)):
+            stack.extend(item)
+            continue
+        parsed = parse_date_range(item)
+        if parsed:
+            ranges.append(parsed)
+    return merge_ranges(ranges)
+
+
+def merge_ranges(ranges: List[DateRange]) -> List[DateRange]:
+    """Merge overlapping or consecutive-day ranges"""
+    merged: List[List[date]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def exam_date_ranges(important_dates: Any) -> List[DateRange]:
+    """Exam-day ranges from an Exam.important_dates value (dict or JSON string)"""
+    dates = load_json(important_dates, {}) or {}
+    if not isinstance(dates, dict):
+        return []
+    return parse_date_ranges(dates.get("exam_dates", []))
+
+
+# important_dates keys that name an event differently, or are not events at all
+_EVENT_TYPES = {"exam_dates": "exam", "exam_date": "exam", "notification": "notification"}
+_NOT_EVENTS = {"last_updated"}
+
+
+def exam_events(important_dates: Any) -> List[Tuple[str, date, date]]:
+    """
+    Every dated entry of an Exam.important_dates value as (event_type,
+    start, end), soonest first. `application_start`/`application_end` style
+    pairs become one `application` range; anything unparseable is skipped.
+    """
+    dates = load_json(important_dates, {}) or {}
+    if not isinstance(dates, dict):
+        return []
+
+    events = []
+    bounds: Dict[str, Dict[str, date]] = {}
+    for key, value in dates.items():
+        if key in _NOT_EVENTS:
+            continue
+        if key.endswith(("_start", "_end")):
+            name, _, bound = key.rpartition("_")
+            parsed = parse_date_range(value)
+            if parsed:
+                bounds.setdefault(name, {})[bound] = parsed[0] if bound == "start" else parsed[1]
+            continue
+        event_type = _EVENT_TYPES.get(key, key)
+        events.extend((event_type, start, end) for start, end in parse_date_ranges(value))
+
+    for name, bound in bounds.items():
+        start, end = bound.get("start") or bound["end"], bound.get("end") or bound["start"]
+        events.append((name, *_ordered(start, end)))
+    return sorted(events, key=lambda event: (event[1], event[0]))
+
+
+def _ordered(start: Optional[date], end: Optional[date]) -> Optional[DateRange]:
+    if start is None or end is None:
+        return None
+    return (start, end) if start <= end else (end, start)
@@ -0,0 +1,122 @@
+"""
+Exam timeline for ExamSensei
+Keeps the exam_events table in step with Exam.important_dates and pages through upcoming events
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, event, inspect, or_
+from sqlalchemy.orm import Session
+from models import Exam, ExamEvent
+from exam_dates import exam_events
+from exceptions import ValidationError
+
+Cursor = Tuple[date, int]
+
+
+def build_events(exam: Exam) -> List[ExamEvent]:
+    """Event rows for an exam's current important_dates"""
+    return [
+        ExamEvent(event_type=event_type, start_date=start, end_date=end)
+        for event_type, start, end in exam_events(exam.important_dates)
+    ]
+
+
+def replace_events(db: Session, important_dates: Dict[int, Any]):
+    """
+    Rewrite the events of exams written with Core statements (bulk upserts),
+    which bypass the flush hook below. Takes exam_id -> important_dates.
+    """
+    if not important_dates:
+        return
+    db.query(ExamEvent).filter(ExamEvent.exam_id.in_(list(important_dates))).delete(synchronize_session=False)
+    db.add_all(
+        ExamEvent(exam_id=exam_id, event_type=event_type, start_date=start, end_date=end)
+        for exam_id, dates in important_dates.items()
+        for event_type, start, end in exam_events(dates)
+    )
+
+
+def backfill_exam_events(db: Session, batch_size: int = 500) -> Dict:
+    """Rebuild the events of every exam, e.g. for exams written before the table existed"""
+    stats = {"exams": 0, "events": 0}
+    last_id = 0
+    while True:
+        exams = db.query(Exam).filter(Exam.id > last_id).order_by(Exam.id).limit(batch_size).all()
+        if not exams:
+            break
+        last_id = exams[-1].id
+        for exam in exams:
+            exam.events = build_events(exam)
+            stats["exams"] += 1
+            stats["events"] += len(exam.events)
+        db.commit()
+        db.expunge_all()
+    return stats
+
+
+def upcoming_events(
+    db: Session,
+    since: date,
+    limit: int = 20,
+    after: Optional[Cursor] = None,
+    until: Optional[date] = None,
+    event_type: Optional[str] = None,
+    exam_id: Optional[int] = None
+) -> Tuple[List[ExamEvent], Optional[Cursor]]:
+    """
+    Events still running on or after `since`, ordered by (end_date, id),
+    plus the cursor of the next page. Ranges are matched by their end, so an
+    application window that opened last week still shows until its
+    deadline; `until` keeps events starting by then. Paging by cursor rather
+    than offset keeps every page an index range scan however deep the
+    reader goes.
+    """
+    query = db.query(ExamEvent).filter(ExamEvent.end_date >= since)
+    if until is not None:
+        query = query.filter(ExamEvent.start_date <= until)
+    if event_type is not None:
+        query = query.filter(ExamEvent.event_type == event_type)
+    if exam_id is not None:
+        query = query.filter(ExamEvent.exam_id == exam_id)
+    if after is not None:
+        after_date, after_id = after
+        query = query.filter(or_(
+            ExamEvent.end_date > after_date,
+            and_(ExamEvent.end_date == after_date, ExamEvent.id > after_id)
+        ))
+
+    rows = query.order_by(ExamEvent.end_date, ExamEvent.id).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].end_date, rows[-1].id)
+
+
+def encode_cursor(cursor: Optional[Cursor]) -> Optional[str]:
+    return f"{cursor[0].isoformat()}:{cursor[1]}" if cursor else None
+
+
+def decode_cursor(value: Optional[str]) -> Optional[Cursor]:
+    if not value:
+        return None
+    try:
+        day, _, event_id = value.partition(":")
+        return date.fromisoformat(day), int(event_id)
+    except ValueError:
+        raise ValidationError("Invalid cursor", {"cursor": value})
+
+
+# Exams written through an installed session get their events rewritten in the same flush
+def _sync_exam_events(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, Exam) or obj in session.deleted:
+                continue
+            if obj in session.new or inspect(obj).attrs.important_dates.history.has_changes():
+                obj.events = build_events(obj)
+
+
+def install(session_factory):
+    """Keep events in step with exams written through sessions from `session_factory`; installing twice is a no-op"""
+    if not event.contains(session_factory, "before_flush", _sync_exam_events):
+        event.listen(session_factory, "before_flush", _sync_exam_events)
@@ -38,6 +38,13 @@ class ExternalServiceError(ExamSenseiException):
     pass
 
 
+class DeliveryError(ExternalServiceError):
+    """A notification could not be delivered; permanent errors are not retried"""
+    def __init__(self, message: str, permanent: bool = False, details: dict = None):
+        self.permanent = permanent
+        super().__init__(message, details)
+
+
 class DatabaseError(ExamSenseiException):
     """Database operation failed"""
     pass
@@ -48,6 +55,16 @@ class RateLimitError(ExamSenseiException):
     pass
 
 
+class LeaseLostError(ExamSenseiException):
+    """A job shard lease expired and was taken over by another worker"""
+    pass
+
+
+class QueryBudgetExceeded(ExamSenseiException):
+    """A request issued more queries than its endpoint allows, or repeated one in a loop"""
+    pass
+
+
 # HTTP Exception helpers
 def http_exception(status_code: int, message: str, details: dict = None):
     """Create HTTP exception with details"""
@@ -100,6 +117,15 @@ def service_unavailable(service: str):
     )
 
 
+def service_overloaded(message: str = "Server is busy. Please try again shortly.", retry_after: int = 1):
+    """503 Service Unavailable, retry soon"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=message,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
 def rate_limit_exceeded():
     """429 Too Many Requests"""
     return HTTPException(
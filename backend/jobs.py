@@ -0,0 +1,327 @@
+"""
+Batch jobs for ExamSensei
+Run from cron or a worker: python jobs.py <job> [options]
+"""
+import argparse
+import json
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+from models import User, JobLease, load_json
+from ai_models import RecommendationMaterializer
+from lifecycle import LifecycleStateMachine, MilestoneScheduler
+from notifications import DeliveryWorker
+from exam_events import backfill_exam_events
+from exceptions import LeaseLostError
+from listeners import install_listeners
+from logger import logger, log_error, stop_logging
+from metrics import observe_job
+
+
+def materialize_recommendations(only_changed: bool = True) -> Dict:
+    """Precompute recommendations for every user (or only users whose inputs changed)"""
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        stats = RecommendationMaterializer(db).run(only_changed=only_changed)
+        observe_job("recommendations", stats["users"], time.perf_counter() - start)
+        return stats
+    finally:
+        db.close()
+
+
+def daily_checks_shard(db: Session, start_id: int, end_id: int, on_batch: Callable) -> Dict:
+    """Lifecycle daily checks over one user id range"""
+    return LifecycleStateMachine(db).run_daily_checks(start_id=start_id, end_id=end_id, on_batch=on_batch)
+
+
+def milestone_backfill_shard(db: Session, start_id: int, end_id: int, on_batch: Callable) -> Dict:
+    """Move one user id range's JSON milestone triggers into the trigger table"""
+    return LifecycleStateMachine(db).backfill_milestones(start_id=start_id, end_id=end_id, on_batch=on_batch)
+
+
+def fire_milestones(loop: bool = False) -> Dict:
+    """Send due milestone reminders once, or keep polling every minute"""
+    scheduler = MilestoneScheduler()
+    if loop:
+        scheduler.run_forever()
+    return scheduler.fire_due()
+
+
+def rebuild_exam_events() -> Dict:
+    """Rebuild the exam timeline from every exam's important_dates"""
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        stats = backfill_exam_events(db)
+        observe_job("exam_events", stats["exams"], time.perf_counter() - start)
+        return stats
+    finally:
+        db.close()
+
+
+def deliver_notifications(loop: bool = False) -> Dict:
+    """Send due notifications through every configured channel"""
+    worker = DeliveryWorker()
+    if loop:
+        worker.run_forever()
+    return worker.run_once()
+
+
+# Jobs that can be split by user id: fn(db, start_id, end_id, on_batch) -> stats
+SHARDED_JOBS: Dict[str, Callable] = {
+    "daily_checks": daily_checks_shard,
+    "milestone_backfill": milestone_backfill_shard,
+}
+
+
+class ShardedJobRunner:
+    """
+    Runs a job over the user id space in shards.
+
+    A run is split into contiguous id ranges stored as JobLease rows.
+    Workers, in a local process pool or on other nodes sharing the database,
+    claim a shard by atomically taking its lease, process it with their own
+    session and checkpoint the last committed user id with every batch. A
+    shard whose worker dies is reclaimed once its lease expires and resumes
+    from its checkpoint, so re-running the same run_id continues the run
+    instead of restarting it.
+    """
+
+    LEASE_SECONDS = 600  # renewed with every batch
+    MAX_ATTEMPTS = 3  # failed shards are retried up to this many claims
+
+    def __init__(self, job_name: str, session_factory: Callable = SessionLocal, lease_seconds: int = LEASE_SECONDS):
+        if job_name not in SHARDED_JOBS:
+            raise ValueError(f"Unknown sharded job: {job_name}")
+        self.job_name = job_name
+        self.job = SHARDED_JOBS[job_name]
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds
+
+    def run(self, run_id: Optional[str] = None, shards: int = 8, workers: Optional[int] = None) -> Dict:
+        """
+        Plan a run and work through it with a pool of `workers` processes.
+
+        Process workers always use the default SessionLocal; pass workers=1
+        to run in this process with a custom session factory.
+        """
+        run_id = run_id or datetime.utcnow().date().isoformat()
+        self.plan(run_id, shards)
+        workers = workers if workers is not None else min(shards, os.cpu_count() or 1)
+
+        if workers <= 1:
+            self.run_worker(run_id)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_process) as pool:
+                futures = [
+                    pool.submit(_run_worker_process, self.job_name, run_id, self.lease_seconds)
+                    for _ in range(workers)
+                ]
+                for future in futures:
+                    future.result()
+
+        return self.progress(run_id)
+
+    def plan(self, run_id: str, shard_count: int) -> int:
+        """Create the shard leases for a run if they do not exist yet; returns the shard count"""
+        db = self.session_factory()
+        try:
+            existing = self._leases(db, run_id).count()
+            if existing:
+                return existing
+
+            low, high = db.query(func.min(User.id), func.max(User.id)).one()
+            if high is None:
+                return 0
+
+            size = -(-(high - low + 1) // max(shard_count, 1))
+            start, shard = low - 1, 0
+            while start < high:
+                end = min(start + size, high)
+                db.add(JobLease(
+                    job_name=self.job_name,
+                    run_id=run_id,
+                    shard=shard,
+                    start_id=start,
+                    end_id=end,
+                    checkpoint_id=start,
+                    status="pending",
+                    attempts=0,
+                    stats=json.dumps({})
+                ))
+                start, shard = end, shard + 1
+
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another node planned the same run first
+                db.rollback()
+                return self._leases(db, run_id).count()
+            return shard
+        finally:
+            db.close()
+
+    def run_worker(self, run_id: str, owner: Optional[str] = None) -> Dict:
+        """Claim and process shards of a planned run until none are left"""
+        owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        totals: Dict = {}
+        db = self.session_factory()
+        try:
+            while True:
+                lease = self.claim(db, run_id, owner)
+                if lease is None:
+                    break
+                totals = _add_counters(totals, self._run_shard(db, lease, owner))
+        finally:
+            db.close()
+        return totals
+
+    def claim(self, db: Session, run_id: str, owner: str) -> Optional[JobLease]:
+        """
+        Take the lease on the next available shard. The conditional UPDATE is
+        a compare-and-set, so two workers can never hold the same shard.
+        """
+        now = datetime.utcnow()
+        claimable = or_(
+            JobLease.status == "pending",
+            and_(JobLease.status == "running", JobLease.lease_expires_at < now),
+            and_(JobLease.status == "failed", JobLease.attempts < self.MAX_ATTEMPTS)
+        )
+
+        candidates = self._leases(db, run_id).filter(claimable).order_by(JobLease.shard).with_entities(JobLease.id).all()
+        for (lease_id,) in candidates:
+            claimed = db.query(JobLease).filter(JobLease.id == lease_id, claimable).update({
+                JobLease.status: "running",
+                JobLease.owner: owner,
+                JobLease.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+                JobLease.attempts: JobLease.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.get(JobLease, lease_id)
+        return None
+
+    def progress(self, run_id: str) -> Dict:
+        """Shard counts by status plus the counters summed over all shards"""
+        db = self.session_factory()
+        try:
+            leases = self._leases(db, run_id).all()
+            progress = {"run_id": run_id, "shards": len(leases), "pending": 0, "running": 0, "done": 0, "failed": 0}
+            totals: Dict = {}
+            for lease in leases:
+                progress[lease.status] += 1
+                totals = _add_counters(totals, load_json(lease.stats, {}) or {})
+            progress.update(totals)
+            return progress
+        finally:
+            db.close()
+
+    def _run_shard(self, db: Session, lease: JobLease, owner: str) -> Dict:
+        lease_id, shard = lease.id, lease.shard
+        start_id, end_id = lease.checkpoint_id, lease.end_id
+        previous = load_json(lease.stats, {}) or {}
+        logger.info(f"{self.job_name} {lease.run_id}: shard {shard} ({start_id}, {end_id}] claimed by {owner}")
+
+        def checkpoint(last_id: int, stats: Dict):
+            # Runs inside the batch transaction, so the batch and its checkpoint commit together
+            renewed = db.query(JobLease).filter(
+                JobLease.id == lease_id,
+                JobLease.owner == owner,
+                JobLease.status == "running"
+            ).update({
+                JobLease.checkpoint_id: last_id,
+                JobLease.lease_expires_at: datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                JobLease.stats: json.dumps(_add_counters(previous, stats))
+            }, synchronize_session=False)
+            if not renewed:
+                raise LeaseLostError(f"Lease on shard {shard} was taken over", {"lease_id": lease_id})
+
+        start = time.perf_counter()
+        try:
+            stats = self.job(db, start_id, end_id, checkpoint)
+        except LeaseLostError as e:
+            db.rollback()
+            logger.warning(e.message)
+            return {}
+        except Exception as e:
+            db.rollback()
+            log_error(e, {"job": self.job_name, "shard": shard})
+            db.query(JobLease).filter(JobLease.id == lease_id, JobLease.owner == owner).update(
+                {JobLease.status: "failed"}, synchronize_session=False
+            )
+            db.commit()
+            return {}
+
+        db.query(JobLease).filter(JobLease.id == lease_id, JobLease.owner == owner).update({
+            JobLease.status: "done",
+            JobLease.checkpoint_id: end_id,
+            JobLease.lease_expires_at: None,
+            JobLease.stats: json.dumps(_add_counters(previous, stats))
+        }, synchronize_session=False)
+        db.commit()
+        observe_job(self.job_name, stats.get("users", 0), time.perf_counter() - start)
+        return stats
+
+    def _leases(self, db: Session, run_id: str):
+        return db.query(JobLease).filter(JobLease.job_name == self.job_name, JobLease.run_id == run_id)
+
+
+def _add_counters(totals: Dict, stats: Dict) -> Dict:
+    """Sum integer counters; rates and timings are per attempt and are dropped"""
+    merged = dict(totals)
+    for key, value in stats.items():
+        if isinstance(value, int) and not isinstance(value, bool):
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _init_worker_process():
+    # Pooled connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    # Pool workers exit without running atexit hooks, so drain this process's log queue on the way out
+    Finalize(None, stop_logging, exitpriority=10)
+
+
+def _run_worker_process(job_name: str, run_id: str, lease_seconds: int) -> Dict:
+    return ShardedJobRunner(job_name, lease_seconds=lease_seconds).run_worker(run_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an ExamSensei batch job")
+    parser.add_argument("job", choices=["recommendations", "milestones", "notifications", "exam_events", *SHARDED_JOBS])
+    parser.add_argument("--all", action="store_true", help="recommendations: recompute every user")
+    parser.add_argument("--loop", action="store_true", help="milestones, notifications: keep running")
+    parser.add_argument("--run-id", help="sharded jobs: run to start or resume (default: today)")
+    parser.add_argument("--shards", type=int, default=8, help="sharded jobs: number of user id ranges")
+    parser.add_argument("--workers", type=int, help="sharded jobs: local worker processes")
+    parser.add_argument("--join", action="store_true", help="sharded jobs: only work on an existing run")
+    args = parser.parse_args()
+    install_listeners(engine, SessionLocal)
+
+    if args.job == "recommendations":
+        result = materialize_recommendations(only_changed=not args.all)
+    elif args.job == "milestones":
+        result = fire_milestones(loop=args.loop)
+    elif args.job == "notifications":
+        result = deliver_notifications(loop=args.loop)
+    elif args.job == "exam_events":
+        result = rebuild_exam_events()
+    elif args.join:
+        runner = ShardedJobRunner(args.job)
+        run_id = args.run_id or datetime.utcnow().date().isoformat()
+        runner.run_worker(run_id)
+        result = runner.progress(run_id)
+    else:
+        result = ShardedJobRunner(args.job).run(run_id=args.run_id, shards=args.shards, workers=args.workers)
+
+    logger.info(f"Job {args.job} finished: {result}")
+    print(result)
@@ -1,9 +1,13 @@
 import json
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 from sqlalchemy.orm import Session
-from models import User, Exam, UserActivity, Notification
+from models import User, Exam, UserActivity, Notification, MilestoneTrigger, load_json
 from database import SessionLocal
+from logger import logger
+from metrics import observe_job
 
 class LifecycleStateMachine:
     """
@@ -31,123 +35,228 @@ class LifecycleStateMachine:
         "defense": ["nda", "cds", "afcat"]
     }
 
-    def __init__(self):
-        self.db = SessionLocal()
+    # Stage transitions: (from stage, milestone that must have passed, to stage).
+    # The first matching row for a stage wins.
+    TRANSITIONS = [
+        ("class_12_started", "board_exam_date", "class_12_completed"),
+        ("entrance_exams_preparing", "jee_result_date", "college_admission_phase"),
+        ("entrance_exams_preparing", "neet_result_date", "college_admission_phase"),
+        ("college_admission_phase", "college_start_date", "undergraduate_started"),
+    ]
 
-    def check_stage_progression(self, user_id: int) -> Optional[str]:
-        """
-        Check if user should progress to next stage based on activities and exam dates
-        """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return None
+    # Milestones set on entering a stage: (required career path or None, {milestone: days from now})
+    STAGE_MILESTONES = {
+        "class_12_completed": [
+            (None, {
+                "jee_application_start": 30,
+                "neet_application_start": 60,
+                "jee_exam_date": 120,
+                "neet_exam_date": 150
+            })
+        ],
+        "college_admission_phase": [
+            (None, {"college_start_date": 90, "semester_exam_date": 120})
+        ],
+        "undergraduate_started": [
+            ("engineering", {"gate_preparation_start": 365 * 2, "internship_season": 365 * 2 + 180})
+        ],
+    }
 
-        current_stage = user.current_stage
-        current_time = datetime.utcnow()
+    BATCH_SIZE = 1000  # users per page in run_daily_checks
+    REMINDER_LEAD = timedelta(days=7)  # remind this long before a milestone
 
-        # Check for milestone triggers
-        milestone_triggers = user.milestone_triggers or {}
+    def __init__(self, db: Optional[Session] = None, session_factory: Callable[[], Session] = SessionLocal):
+        """
+        With `db`, every call uses that session. Otherwise each call opens
+        its own session from `session_factory` (or uses the one passed in)
+        and closes it afterwards, so a shared instance holds no state.
+        """
+        self.db = db
+        self.session_factory = session_factory
+        self._transitions = self.compile_transitions(self.TRANSITIONS)
+
+    @contextmanager
+    def session(self, db: Optional[Session] = None) -> Iterator[Session]:
+        """The session passed in or bound at construction, else a fresh one closed on exit"""
+        if db is not None or self.db is not None:
+            yield db if db is not None else self.db
+            return
 
-        # Class 12 completion check
-        if current_stage == "class_12_started":
-            board_exam_date = milestone_triggers.get("board_exam_date")
-            if board_exam_date and datetime.fromisoformat(board_exam_date) < current_time:
-                return "class_12_completed"
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def compile_transitions(transitions: List[Tuple[str, str, str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Index transition rows by from-stage, keeping their order"""
+        table: Dict[str, List[Tuple[str, str]]] = {}
+        for from_stage, milestone, to_stage in transitions:
+            table.setdefault(from_stage, []).append((milestone, to_stage))
+        return table
+
+    def check_stage_progression(self, user_id: int, db: Optional[Session] = None) -> Optional[str]:
+        """
+        Check if user should progress to next stage based on activities and exam dates
+        """
+        with self.session(db) as db:
+            user = db.get(User, user_id)
+            if not user:
+                return None
 
-        # Entrance exam results check
-        if current_stage == "entrance_exams_preparing":
-            jee_result_date = milestone_triggers.get("jee_result_date")
-            neet_result_date = milestone_triggers.get("neet_result_date")
+            return self.next_stage(user)
 
-            if jee_result_date and datetime.fromisoformat(jee_result_date) < current_time:
-                return "college_admission_phase"
-            if neet_result_date and datetime.fromisoformat(neet_result_date) < current_time:
-                return "college_admission_phase"
+    def next_stage(self, user: User, now: Optional[datetime] = None) -> Optional[str]:
+        """
+        Stage an already-loaded user should progress to, if any
+        """
+        triggers = dict(self._parse_triggers(user.milestone_triggers))
+        return self.evaluate_stage(user.current_stage, triggers, now or datetime.utcnow())
 
-        # College start check
-        if current_stage == "college_admission_phase":
-            college_start_date = milestone_triggers.get("college_start_date")
-            if college_start_date and datetime.fromisoformat(college_start_date) < current_time:
-                return "undergraduate_started"
+    def next_stages(self, users: List[User], now: Optional[datetime] = None) -> Dict[int, str]:
+        """
+        Batch form of next_stage: {user id: new stage} for users that progress
+        """
+        now = now or datetime.utcnow()
+        progressions = {}
+        for user in users:
+            if user.current_stage not in self._transitions:
+                continue
+            new_stage = self.next_stage(user, now)
+            if new_stage:
+                progressions[user.id] = new_stage
+        return progressions
 
+    def evaluate_stage(self, stage: Optional[str], triggers: Dict[str, datetime], now: datetime) -> Optional[str]:
+        """
+        Pure transition function: the stage after `stage` given parsed milestone dates
+        """
+        for milestone, to_stage in self._transitions.get(stage, ()):
+            milestone_date = triggers.get(milestone)
+            if milestone_date and milestone_date < now:
+                return to_stage
         return None
 
-    def progress_user_stage(self, user_id: int, new_stage: str) -> bool:
+    def progress_user_stage(self, user_id: int, new_stage: str, db: Optional[Session] = None) -> bool:
         """
         Progress user to new stage and update related data
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return False
+        with self.session(db) as db:
+            user = db.get(User, user_id)
+            if not user:
+                return False
 
-        # Update user stage
+            db.add_all(self._stage_change(db, user, new_stage, datetime.utcnow()))
+            db.commit()
+            return True
+
+    def _stage_change(self, db: Session, user: User, new_stage: str, now: datetime) -> List:
+        """
+        Move a loaded user to a new stage; returns the notification and
+        activity rows to insert
+        """
+        from_stage = user.current_stage
         user.current_stage = new_stage
-        user.updated_at = datetime.utcnow()
+        user.updated_at = now
 
         # Generate new milestone triggers based on stage
-        self._generate_milestone_triggers(user, new_stage)
+        self._generate_milestone_triggers(db, user, new_stage, now)
 
         # Create notification for stage change
         notification = Notification(
-            user_id=user_id,
+            user_id=user.id,
             notification_type="stage_progression",
             message=f"Congratulations! You've progressed to {new_stage.replace('_', ' ').title()} stage.",
-            scheduled_at=datetime.utcnow(),
+            scheduled_at=now,
             channel="push"
         )
-        self.db.add(notification)
 
         # Log activity
         activity = UserActivity(
-            user_id=user_id,
+            user_id=user.id,
             activity_type="stage_progression",
-            details=json.dumps({"from_stage": user.current_stage, "to_stage": new_stage}),
-            timestamp=datetime.utcnow()
+            details=json.dumps({"from_stage": from_stage, "to_stage": new_stage}),
+            timestamp=now
         )
-        self.db.add(activity)
 
-        self.db.commit()
-        return True
+        return [notification, activity]
 
-    def _generate_milestone_triggers(self, user: User, new_stage: str):
+    def _generate_milestone_triggers(self, db: Session, user: User, new_stage: str, now: datetime):
         """
         Generate appropriate milestone triggers for the new stage
         """
+        career_paths = user.career_paths or []
         triggers = {}
-
-        if new_stage == "class_12_completed":
-            # Set entrance exam preparation triggers
-            triggers.update({
-                "jee_application_start": (datetime.utcnow() + timedelta(days=30)).isoformat(),
-                "neet_application_start": (datetime.utcnow() + timedelta(days=60)).isoformat(),
-                "jee_exam_date": (datetime.utcnow() + timedelta(days=120)).isoformat(),
-                "neet_exam_date": (datetime.utcnow() + timedelta(days=150)).isoformat()
-            })
-
-        elif new_stage == "college_admission_phase":
-            triggers.update({
-                "college_start_date": (datetime.utcnow() + timedelta(days=90)).isoformat(),
-                "semester_exam_date": (datetime.utcnow() + timedelta(days=120)).isoformat()
-            })
-
-        elif new_stage == "undergraduate_started":
-            career_paths = user.career_paths or []
-            if "engineering" in career_paths:
+        for career_path, offsets in self.STAGE_MILESTONES.get(new_stage, []):
+            if career_path is None or career_path in career_paths:
                 triggers.update({
-                    "gate_preparation_start": (datetime.utcnow() + timedelta(days=365*2)).isoformat(),
-                    "internship_season": (datetime.utcnow() + timedelta(days=365*2 + 180)).isoformat()
+                    name: (now + timedelta(days=days)).isoformat() for name, days in offsets.items()
                 })
 
         user.milestone_triggers = json.dumps(triggers)
+        self.schedule_milestones(db, user, triggers)
+
+    def schedule_milestones(self, db: Session, user: User, triggers: Dict[str, str]):
+        """
+        Mirror a user's milestone triggers into the time-indexed
+        milestone_triggers table read by MilestoneScheduler.
 
-    def recommend_next_exams(self, user_id: int) -> List[Dict]:
+        Pending triggers that are no longer listed are dropped; a trigger
+        whose date moved is re-armed, one whose date is unchanged is kept as is.
+        """
+        existing = {
+            row.name: row for row in
+            db.query(MilestoneTrigger).filter(MilestoneTrigger.user_id == user.id).all()
+        }
+
+        for name, trigger_date in self._parse_triggers(triggers):
+            row = existing.pop(name, None)
+            if row is None:
+                db.add(self._trigger_row(user.id, name, trigger_date))
+            elif row.trigger_date != trigger_date:
+                row.trigger_date = trigger_date
+                row.fire_at = trigger_date - self.REMINDER_LEAD
+                row.fired_at = None
+
+        for row in existing.values():
+            if row.fired_at is None:
+                db.delete(row)
+
+    def _trigger_row(self, user_id: int, name: str, trigger_date: datetime, fired_at: Optional[datetime] = None):
+        return MilestoneTrigger(
+            user_id=user_id,
+            name=name,
+            trigger_date=trigger_date,
+            fire_at=trigger_date - self.REMINDER_LEAD,
+            fired_at=fired_at
+        )
+
+    @staticmethod
+    def _parse_triggers(triggers) -> List[Tuple[str, datetime]]:
+        parsed = []
+        for name, value in (load_json(triggers, {}) or {}).items():
+            try:
+                parsed.append((name, datetime.fromisoformat(value)))
+            except (TypeError, ValueError):
+                continue
+        return parsed
+
+    def recommend_next_exams(self, user_id: int, db: Optional[Session] = None) -> List[Dict]:
         """
         Recommend next exams based on user stage and career path
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return []
+        with self.session(db) as db:
+            user = db.get(User, user_id)
+            if not user:
+                return []
+
+            return self.recommend_exams_for(user)
 
+    def recommend_exams_for(self, user: User) -> List[Dict]:
+        """
+        Exam recommendations for an already-loaded user
+        """
         career_paths = user.career_paths or []
         current_stage = user.current_stage
 
@@ -175,15 +284,21 @@ class LifecycleStateMachine:
 
         return recommendations
 
-    def update_user_profile(self, user_id: int, profile_data: Dict):
+    def update_user_profile(self, user_id: int, profile_data: Dict, db: Optional[Session] = None):
         """
         Update user preparation profile based on activities
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return
+        with self.session(db) as db:
+            user = db.get(User, user_id)
+            if not user:
+                return
+
+            self._apply_profile_update(user, profile_data)
+            db.commit()
 
-        current_profile = user.preparation_profile or {}
+    @staticmethod
+    def _apply_profile_update(user: User, profile_data: Dict):
+        current_profile = load_json(user.preparation_profile, {})
 
         # Update study hours, strengths, weaknesses
         if "study_hours" in profile_data:
@@ -208,72 +323,258 @@ class LifecycleStateMachine:
 
         user.preparation_profile = json.dumps(current_profile)
         user.updated_at = datetime.utcnow()
-        self.db.commit()
 
-    def run_daily_checks(self):
-        """
-        Run daily lifecycle checks for all users
+    def run_daily_checks(
+        self,
+        batch_size: int = BATCH_SIZE,
+        start_id: int = 0,
+        end_id: Optional[int] = None,
+        on_batch: Optional[Callable[[int, Dict], None]] = None,
+        db: Optional[Session] = None
+    ) -> Dict:
         """
-        users = self.db.query(User).all()
+        Run daily stage progression checks for all users, or those with
+        start_id < id <= end_id. Milestone reminders are sent by
+        MilestoneScheduler as they fall due.
 
-        for user in users:
-            # Check for stage progression
-            new_stage = self.check_stage_progression(user.id)
-            if new_stage:
-                self.progress_user_stage(user.id, new_stage)
-
-            # Check milestone triggers
-            self._check_milestone_triggers(user)
-
-    def _check_milestone_triggers(self, user: User):
+        `on_batch(last_id, stats)` runs just before each batch commits, so a
+        checkpoint written there is atomic with the batch. Returns progress
+        and throughput metrics.
         """
-        Check and trigger milestone-based notifications
+        stats = {"users": 0, "batches": 0, "progressed": 0}
+        with self.session(db) as db:
+            return self._for_each_batch(
+                db, "Daily checks", self._check_batch, stats, batch_size, start_id, end_id, on_batch
+            )
+
+    def backfill_milestones(
+        self,
+        batch_size: int = BATCH_SIZE,
+        start_id: int = 0,
+        end_id: Optional[int] = None,
+        on_batch: Optional[Callable[[int, Dict], None]] = None,
+        db: Optional[Session] = None
+    ) -> Dict:
         """
-        triggers = user.milestone_triggers or {}
-        current_time = datetime.utcnow()
-
-        for trigger_name, trigger_date_str in triggers.items():
-            trigger_date = datetime.fromisoformat(trigger_date_str)
-
-            # Trigger notification 7 days before milestone
-            notification_date = trigger_date - timedelta(days=7)
+        Create milestone_triggers rows for users whose triggers only exist in
+        User.milestone_triggers. Reminders already sent, and those whose fire
+        time has passed, are marked as fired.
+        """
+        stats = {"users": 0, "batches": 0, "scheduled": 0}
+        with self.session(db) as db:
+            return self._for_each_batch(
+                db, "Milestone backfill", self._backfill_batch, stats, batch_size, start_id, end_id, on_batch
+            )
+
+    def _for_each_batch(
+        self,
+        db: Session,
+        label: str,
+        handle_batch: Callable[[Session, List[User], datetime, Dict], None],
+        stats: Dict,
+        batch_size: int,
+        start_id: int,
+        end_id: Optional[int],
+        on_batch: Optional[Callable[[int, Dict], None]]
+    ) -> Dict:
+        """
+        Page users by id so memory stays flat as the table grows, with one
+        commit per batch.
+        """
+        started = time.perf_counter()
+        last_id = start_id
+
+        while True:
+            query = db.query(User).filter(User.id > last_id)
+            if end_id is not None:
+                query = query.filter(User.id <= end_id)
+            users = query.order_by(User.id).limit(batch_size).all()
+            if not users:
+                break
+            last_id = users[-1].id
+
+            handle_batch(db, users, datetime.utcnow(), stats)
+            stats["users"] += len(users)
+            stats["batches"] += 1
+            if on_batch:
+                on_batch(last_id, stats)
+            db.commit()
+            # Drop the batch from the identity map before loading the next one
+            db.expunge_all()
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"{label}: {stats['users']} users in {elapsed:.1f}s "
+                f"({stats['users'] / max(elapsed, 1e-9):.0f} users/s), last user id {last_id}"
+            )
+
+        elapsed = time.perf_counter() - started
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["users_per_second"] = round(stats["users"] / max(elapsed, 1e-9), 1)
+        return stats
+
+    def _check_batch(self, db: Session, users: List[User], now: datetime, stats: Dict):
+        """
+        Stage progression for one batch of users
+        """
+        progressions = self.next_stages(users, now)
+        rows = []
+        for user in users:
+            if user.id in progressions:
+                rows.extend(self._stage_change(db, user, progressions[user.id], now))
 
-            if current_time >= notification_date:
-                # Check if notification already exists
-                existing = self.db.query(Notification).filter(
-                    Notification.user_id == user.id,
-                    Notification.notification_type == "milestone_reminder",
-                    Notification.message.contains(trigger_name)
-                ).first()
+        db.bulk_save_objects(rows)
+        stats["progressed"] += len(progressions)
 
-                if not existing:
-                    message = self._generate_milestone_message(trigger_name, trigger_date)
-                    notification = Notification(
-                        user_id=user.id,
-                        notification_type="milestone_reminder",
-                        message=message,
-                        scheduled_at=current_time,
-                        channel="push"
-                    )
-                    self.db.add(notification)
+    def _backfill_batch(self, db: Session, users: List[User], now: datetime, stats: Dict):
+        user_ids = [user.id for user in users]
+        scheduled = set(
+            db.query(MilestoneTrigger.user_id, MilestoneTrigger.name)
+            .filter(MilestoneTrigger.user_id.in_(user_ids)).all()
+        )
+        sent = self._sent_reminders(db, user_ids)
 
-        self.db.commit()
+        rows = []
+        for user in users:
+            for name, trigger_date in self._parse_triggers(user.milestone_triggers):
+                if (user.id, name) in scheduled:
+                    continue
+                # The daily check sent reminders without a dedupe key once the lead time
+                # began, so any trigger already past its fire time counts as sent
+                done = (
+                    trigger_date - self.REMINDER_LEAD <= now
+                    or (user.id, self.reminder_key(name, trigger_date)) in sent
+                )
+                rows.append(self._trigger_row(user.id, name, trigger_date, now if done else None))
+
+        db.bulk_save_objects(rows)
+        stats["scheduled"] += len(rows)
+
+    @staticmethod
+    def _sent_reminders(db: Session, user_ids: List[int]) -> Set[Tuple[int, str]]:
+        """
+        (user_id, dedupe_key) of milestone reminders already created for these users
+        """
+        rows = db.query(Notification.user_id, Notification.dedupe_key).filter(
+            Notification.user_id.in_(user_ids),
+            Notification.notification_type == "milestone_reminder",
+            Notification.dedupe_key.isnot(None)
+        ).all()
+        return {(user_id, key) for user_id, key in rows}
+
+    @staticmethod
+    def reminder_key(trigger_name: str, trigger_date: datetime) -> str:
+        """
+        Identifies a reminder, so a milestone moved to a new date is reminded again
+        """
+        return f"{trigger_name}:{trigger_date.date().isoformat()}"
 
-    def _generate_milestone_message(self, trigger_name: str, trigger_date: datetime) -> str:
+    @staticmethod
+    def milestone_message(trigger_name: str, trigger_date: datetime, now: Optional[datetime] = None) -> str:
         """
-        Generate appropriate milestone reminder message
+        Generate appropriate milestone reminder message, counting the days left from `now`
         """
+        days = (trigger_date.date() - (now or datetime.utcnow()).date()).days
+        when = "tomorrow" if days == 1 else f"in {days} days"
         messages = {
-            "jee_application_start": f"JEE Main applications open in 7 days ({trigger_date.strftime('%B %d')}). Start preparing your documents!",
-            "neet_application_start": f"NEET applications open in 7 days ({trigger_date.strftime('%B %d')}). Ensure you have all required certificates!",
-            "jee_exam_date": f"JEE Main exam in 7 days ({trigger_date.strftime('%B %d')}). Final revision phase begins now!",
-            "neet_exam_date": f"NEET exam in 7 days ({trigger_date.strftime('%B %d')}). Focus on high-weightage topics!",
-            "college_start_date": f"College starts in 7 days ({trigger_date.strftime('%B %d')}). Get ready for your academic journey!",
+            "jee_application_start": f"JEE Main applications open {when} ({trigger_date.strftime('%B %d')}). Start preparing your documents!",
+            "neet_application_start": f"NEET applications open {when} ({trigger_date.strftime('%B %d')}). Ensure you have all required certificates!",
+            "jee_exam_date": f"JEE Main exam {when} ({trigger_date.strftime('%B %d')}). Final revision phase begins now!",
+            "neet_exam_date": f"NEET exam {when} ({trigger_date.strftime('%B %d')}). Focus on high-weightage topics!",
+            "college_start_date": f"College starts {when} ({trigger_date.strftime('%B %d')}). Get ready for your academic journey!",
             "gate_preparation_start": f"Time to start GATE preparation! Exam is in 2 years.",
             "internship_season": "Internship season approaching. Start building your resume and projects!"
         }
 
         return messages.get(trigger_name, f"Milestone approaching: {trigger_name.replace('_', ' ').title()}")
 
-# Global instance
+
+class MilestoneScheduler:
+    """
+    Sends milestone reminders from the time-ordered milestone_triggers table.
+
+    Each tick reads only the triggers whose fire time has passed, via the
+    (fired_at, fire_at) index, so work is proportional to the reminders sent
+    rather than to the number of users. Run it every minute:
+    python jobs.py milestones --loop
+    """
+
+    BATCH_SIZE = 500
+    INTERVAL_SECONDS = 60
+
+    def __init__(
+        self,
+        db: Optional[Session] = None,
+        batch_size: int = BATCH_SIZE,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+
+    def fire_due(self, now: Optional[datetime] = None) -> Dict:
+        """Create notifications for every trigger due by `now`"""
+        if self.db is not None:
+            return self._fire_due(self.db, now or datetime.utcnow())
+
+        db = self.session_factory()
+        try:
+            return self._fire_due(db, now or datetime.utcnow())
+        finally:
+            db.close()
+
+    def _fire_due(self, db: Session, now: datetime) -> Dict:
+        stats = {"fired": 0, "expired": 0, "max_lag_seconds": 0.0}
+
+        while True:
+            # SKIP LOCKED lets several schedulers share the queue on PostgreSQL
+            due = db.query(MilestoneTrigger).filter(
+                MilestoneTrigger.fired_at.is_(None),
+                MilestoneTrigger.fire_at <= now
+            ).order_by(MilestoneTrigger.fire_at).limit(self.batch_size).with_for_update(skip_locked=True).all()
+            if not due:
+                break
+
+            notifications = []
+            for trigger in due:
+                trigger.fired_at = now
+                if trigger.trigger_date.date() <= now.date():
+                    # Too late to remind: the milestone is today or already past
+                    stats["expired"] += 1
+                    continue
+                notifications.append(Notification(
+                    user_id=trigger.user_id,
+                    notification_type="milestone_reminder",
+                    message=LifecycleStateMachine.milestone_message(trigger.name, trigger.trigger_date, now),
+                    dedupe_key=LifecycleStateMachine.reminder_key(trigger.name, trigger.trigger_date),
+                    scheduled_at=now,
+                    channel="push"
+                ))
+                stats["max_lag_seconds"] = max(stats["max_lag_seconds"], (now - trigger.fire_at).total_seconds())
+
+            db.bulk_save_objects(notifications)
+            db.commit()
+            stats["fired"] += len(notifications)
+            observe_job("milestones", len(notifications))
+
+        if stats["fired"] or stats["expired"]:
+            logger.info(
+                f"Milestone reminders sent: {stats['fired']}, expired: {stats['expired']}, "
+                f"max lag {stats['max_lag_seconds']:.0f}s"
+            )
+        return stats
+
+    def run_forever(self, interval: int = INTERVAL_SECONDS):
+        """Fire due reminders every `interval` seconds"""
+        while True:
+            try:
+                self.fire_due()
+            except Exception as e:
+                if self.db is not None:
+                    self.db.rollback()
+                logger.error(f"Milestone scheduler tick failed: {e}", exc_info=True)
+            time.sleep(interval)
+
+
+# Global instance; opens a session per call unless one is passed in
 lifecycle_machine = LifecycleStateMachine()
@@ -0,0 +1,26 @@
+"""
+Database listeners for ExamSensei
+Installs query tracing, metrics and the exam and user change hooks on an engine and its sessions
+"""
+from sqlalchemy.engine import Engine
+from auth import principal_cache
+import catalog
+import exam_events
+import metrics
+import tracing
+import user_changes
+
+
+def install_listeners(engine: Engine, session_factory):
+    """
+    Register every listener on `engine` and the sessions `session_factory`
+    makes. Called once by each entry point (the API lifespan, jobs, the
+    scraper, seeding); installing twice is a no-op.
+    """
+    tracing.install(engine)
+    metrics.install(engine)
+    catalog.install(session_factory)
+    exam_events.install(session_factory)
+    user_changes.install(session_factory)
+    # Cached principals go stale when their user row changes
+    user_changes.on_user_commit(principal_cache.user_committed)
@@ -2,21 +2,40 @@
 Centralized logging configuration for ExamSensei
 Provides structured logging with rotation and different levels
 """
+import atexit
+import copy
 import logging
+import os
+import queue
+import random
 import sys
 from pathlib import Path
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
+from typing import Dict, Optional
 from config import settings
+from tracing import current_trace
 import json
 from datetime import datetime
 
+try:
+    import orjson
+
+    def _dumps(data: dict) -> str:
+        return orjson.dumps(data, default=str).decode()
+except ImportError:  # optional speedup
+    def _dumps(data: dict) -> str:
+        return json.dumps(data, default=str)
+
 
 class JSONFormatter(logging.Formatter):
     """Custom JSON formatter for structured logging"""
     
+    EXTRA_FIELDS = ("user_id", "request_id", "method", "path", "status_code", "duration_ms", "timings")
+    
     def format(self, record):
         log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # The record's own time: formatting may happen later on the listener thread
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -28,29 +47,69 @@ class JSONFormatter(logging.Formatter):
         # Add exception info if present
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
         
         # Add extra fields
-        if hasattr(record, "user_id"):
-            log_data["user_id"] = record.user_id
-        if hasattr(record, "request_id"):
-            log_data["request_id"] = record.request_id
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                log_data[field] = getattr(record, field)
         
-        return json.dumps(log_data)
+        return _dumps(log_data)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records logged while serving a request with its request id"""
+    
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            trace = current_trace()
+            if trace is not None:
+                record.request_id = trace.request_id
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The stock QueueHandler formats every record on the calling thread. Here
+    only the message arguments are merged and any traceback is rendered to
+    text (both need the caller's objects); JSON encoding and file writes
+    happen in the background.
+    """
+    
+    def prepare(self, record):
+        record = copy.copy(record)  # other handlers still see the original
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
 
 
 def setup_logging():
     """Configure application logging"""
     
     # Create logs directory if it doesn't exist
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
+    log_dir = Path(settings.log_file).parent
+    log_dir.mkdir(parents=True, exist_ok=True)
     
     # Root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, settings.log_level.upper()))
     
     # Remove existing handlers
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
     root_logger.handlers.clear()
+    handlers = []
     
     # Console handler (human-readable)
     console_handler = logging.StreamHandler(sys.stdout)
@@ -60,7 +119,7 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # File handler (JSON format for production)
     if settings.environment == "production":
@@ -71,7 +130,7 @@ def setup_logging():
         )
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(JSONFormatter())
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
     else:
         # Development: human-readable file logs
         file_handler = RotatingFileHandler(
@@ -81,17 +140,28 @@ def setup_logging():
         )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(console_formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
     
     # Error log file (separate file for errors)
     error_handler = RotatingFileHandler(
-        "logs/errors.log",
+        log_dir / "errors.log",
         maxBytes=10 * 1024 * 1024,
         backupCount=5
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(JSONFormatter() if settings.environment == "production" else console_formatter)
-    root_logger.addHandler(error_handler)
+    handlers.append(error_handler)
+    
+    if settings.log_async:
+        # Request threads only enqueue; a background thread formats and writes
+        _listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+        _listener.start()
+        handlers = [DeferredQueueHandler(_listener.queue)]
+    
+    # Filters run in the caller, where the request's context is still visible
+    for handler in handlers:
+        handler.addFilter(RequestContextFilter())
+        root_logger.addHandler(handler)
     
     # Suppress noisy third-party loggers
     logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -101,15 +171,73 @@ def setup_logging():
     return root_logger
 
 
+def flush_logs():
+    """Write out everything queued so far"""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def stop_logging():
+    """Write out everything queued and stop the listener thread, e.g. before a process exits"""
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork_in_child():
+    # Forked processes inherit the queue handler but not the listener thread;
+    # records already queued belong to the parent, which writes them itself
+    global _listener
+    if _listener is not None:
+        _listener = None
+        setup_logging()
+
+
 # Create logger instance
 logger = setup_logging()
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class RequestLogSampler:
+    """
+    Decides which request logs to keep.
+
+    Successful requests are kept with a per-route probability (routes matched
+    by their path template, e.g. "/api/v1/users/{user_id}"); client and
+    server errors are always kept.
+    """
+    
+    def __init__(self, default_rate: float = None, route_rates: Dict[str, float] = None):
+        self.default_rate = settings.log_sample_rate if default_rate is None else default_rate
+        self.route_rates = settings.log_route_sample_rates if route_rates is None else route_rates
+    
+    def should_log(self, route: str, status_code: int) -> bool:
+        if status_code >= 400:
+            return True
+        rate = self.route_rates.get(route, self.default_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+request_log_sampler = RequestLogSampler()
 
 
 # Convenience functions
-def log_api_request(method: str, path: str, user_id: int = None, status_code: int = None):
-    """Log API request"""
-    extra = {"user_id": user_id} if user_id else {}
-    logger.info(f"API {method} {path} - Status: {status_code}", extra=extra)
+def log_api_request(method: str, path: str, user_id: int = None, status_code: int = None,
+                    duration_ms: float = None, request_id: str = None, timings: dict = None):
+    """Log API request (errors at warning/error level)"""
+    extra = {"method": method, "path": path, "status_code": status_code}
+    if user_id:
+        extra["user_id"] = user_id
+    if duration_ms is not None:
+        extra["duration_ms"] = round(duration_ms, 2)
+    if request_id:
+        extra["request_id"] = request_id
+    if timings:
+        extra["timings"] = timings
+    
+    level = logging.ERROR if status_code and status_code >= 500 else logging.WARNING if status_code and status_code >= 400 else logging.INFO
+    logger.log(level, f"API {method} {path} - Status: {status_code}", extra=extra)
 
 
 def log_error(error: Exception, context: dict = None):
@@ -0,0 +1,168 @@
+"""
+Prometheus metrics for ExamSensei
+Request, database, cache, LLM, rate-limit and background job metrics served at /metrics
+"""
+import os
+import time
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from config import settings
+from logger import logger
+
+# prometheus_client picks its storage when imported: with a multiprocess
+# directory every worker writes its samples to files there and /metrics
+# aggregates them, so any worker can answer a scrape.
+if settings.prometheus_multiproc_dir:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.prometheus_multiproc_dir)
+
+from prometheus_client import (  # noqa: E402
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+
+# Database
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed")
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "SQL statement latency", buckets=LATENCY_BUCKETS)
+DB_CONNECTIONS_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Pooled connections checked out", multiprocess_mode="livesum"
+)
+DB_CONNECTIONS_OPENED = Counter("db_pool_connections_opened_total", "New database connections opened")
+
+# Cache
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by key prefix and result (hit, miss, error)", ["prefix", "result"]
+)
+
+# LLM
+LLM_IN_FLIGHT = Gauge(
+    "ollama_requests_in_flight", "Ollama requests waiting for a response", multiprocess_mode="livesum"
+)
+LLM_LATENCY = Histogram(
+    "ollama_request_duration_seconds", "Ollama request latency", ["outcome"], buckets=LLM_BUCKETS
+)
+
+# Rate limiting and load shedding
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests rejected by a limiter", ["limiter"]
+)
+
+# Background jobs
+JOB_ITEMS = Counter("job_items_total", "Items processed by background jobs", ["job"])
+JOB_DURATION = Histogram(
+    "job_duration_seconds", "Duration of one job unit (shard, batch or run)", ["job"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+NOTIFICATIONS = Counter(
+    "notifications_total", "Notification delivery attempts", ["channel", "outcome"]
+)
+
+
+def observe_request(method: str, route: str, status_code: int, seconds: float):
+    HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+    HTTP_LATENCY.labels(method, route).observe(seconds)
+
+
+def observe_job(job: str, items: int, seconds: Optional[float] = None):
+    JOB_ITEMS.labels(job).inc(items)
+    if seconds is not None:
+        JOB_DURATION.labels(job).observe(seconds)
+
+
+def cache_prefix(key: str) -> str:
+    """Metric label for a cache key: its first segment, e.g. `principal` for `principal:7:0`"""
+    return key.split(":", 1)[0]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.inc()
+    DB_QUERY_LATENCY.observe(time.perf_counter() - conn.info["metrics_query_start"].pop())
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("metrics_query_start"):
+        connection.info["metrics_query_start"].pop()
+
+
+def _pool_connect(dbapi_connection, connection_record):
+    DB_CONNECTIONS_OPENED.inc()
+
+
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_CONNECTIONS_IN_USE.inc()
+
+
+def _pool_checkin(dbapi_connection, connection_record):
+    DB_CONNECTIONS_IN_USE.dec()
+
+
+def install(engine: Engine):
+    """Count the queries and pooled connections of `engine`; installing twice is a no-op"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    event.listen(engine, "connect", _pool_connect)
+    event.listen(engine, "checkout", _pool_checkout)
+    event.listen(engine, "checkin", _pool_checkin)
+
+
+class _QueueCollector:
+    """Notification backlog read at scrape time, so every worker reports the same value"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            "notification_queue_pending", "Due notifications not yet delivered", value=self.stats["pending"]
+        )
+        yield GaugeMetricFamily(
+            "notification_queue_oldest_lag_seconds", "Age of the oldest due notification",
+            value=self.stats["oldest_lag_seconds"]
+        )
+
+
+def render_metrics(db: Session) -> bytes:
+    """Metrics exposition for /metrics, aggregated over every worker process in multiprocess mode"""
+    from notifications import DeliveryWorker
+
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    output = generate_latest(registry)
+
+    try:
+        queue = CollectorRegistry()
+        queue.register(_QueueCollector(DeliveryWorker.queue_stats(db)))
+        output += generate_latest(queue)
+    except Exception as e:
+        logger.warning(f"Notification queue metrics unavailable: {e}")
+    return output
+
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges; call from gunicorn's child_exit hook"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
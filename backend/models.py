@@ -1,10 +1,24 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Float, ARRAY
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Boolean, ForeignKey, JSON, Float, ARRAY, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import json
 
 Base = declarative_base()
 
+
+def load_json(value, default=None):
+    """Read a JSON column that may hold either a decoded value or a JSON string"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+    return value
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -26,6 +40,9 @@ class User(Base):
     reset_token = Column(String, nullable=True)  # Password reset
     reset_token_expires = Column(DateTime, nullable=True)
     last_login = Column(DateTime, nullable=True)
+    inputs_updated_at = Column(DateTime, nullable=True)  # last change to what recommendations depend on, see user_changes
+    token_version = Column(Integer, default=0)  # bumped to revoke every issued token
+    telegram_chat_id = Column(String, nullable=True)  # for telegram notifications
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -56,6 +73,7 @@ class Exam(Base):
     application_url = Column(String)
     result_url = Column(String)
     subjects = Column(JSON)  # ["physics", "chemistry", "maths"]
+    content_hash = Column(String, nullable=True)  # canonical hash of the fields above, see scrape_pipeline
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -65,6 +83,35 @@ class Exam(Base):
     topics = relationship("Topic", back_populates="exam")
     activities = relationship("UserActivity", back_populates="exam")
     study_plans = relationship("StudyPlan", back_populates="exam")
+    events = relationship("ExamEvent", back_populates="exam", cascade="all, delete-orphan")
+
+class ExamEvent(Base):
+    __tablename__ = "exam_events"
+    __table_args__ = (
+        Index("ix_exam_events_upcoming", "end_date", "id"),
+        Index("ix_exam_events_type_upcoming", "event_type", "end_date", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    exam_id = Column(Integer, ForeignKey("exams.id"), index=True, nullable=False)
+    event_type = Column(String, nullable=False)  # exam, application, result, admit_card
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # same as start_date for one-day events
+
+    # Relationships
+    exam = relationship("Exam", back_populates="events")
+
+class ScrapedPage(Base):
+    __tablename__ = "scraped_pages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, unique=True, nullable=False)
+    etag = Column(String, nullable=True)  # validators sent back as If-None-Match / If-Modified-Since
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)  # sha256 of the last parsed body
+    content_length = Column(Integer, default=0)
+    parse_seconds = Column(Float, default=0.0)  # time the spider spent parsing the body
+    fetched_at = Column(DateTime, default=datetime.utcnow)  # last time the body was parsed
 
 class Topic(Base):
     __tablename__ = "topics"
@@ -89,7 +136,7 @@ class Bookmark(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    exam_id = Column(Integer, ForeignKey("exams.id"))
+    exam_id = Column(Integer, ForeignKey("exams.id"), index=True)  # followers of an exam, see exam_changes
     added_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -98,21 +145,45 @@ class Bookmark(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (Index("ix_notifications_delivery", "sent", "status", "scheduled_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     exam_id = Column(Integer, ForeignKey("exams.id"))
     notification_type = Column(String)  # application_deadline, admit_card, result
     message = Column(Text)
+    dedupe_key = Column(String, index=True)  # e.g. jee_exam_date:2025-04-10, one reminder per key
     scheduled_at = Column(DateTime)
     sent = Column(Boolean, default=False)
     channel = Column(String)  # email, push, telegram
+    status = Column(String, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=True)  # retry backoff
+    claimed_by = Column(String, nullable=True)  # delivery worker holding the row
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     user = relationship("User", back_populates="notifications")
     exam = relationship("Exam", back_populates="notifications")
 
+class MilestoneTrigger(Base):
+    __tablename__ = "milestone_triggers"
+    __table_args__ = (
+        UniqueConstraint("user_id", "name"),
+        Index("ix_milestone_triggers_due", "fired_at", "fire_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    name = Column(String, nullable=False)  # e.g. jee_exam_date
+    trigger_date = Column(DateTime, nullable=False)  # the milestone itself
+    fire_at = Column(DateTime, nullable=False)  # when the reminder goes out
+    fired_at = Column(DateTime, nullable=True)  # null until the reminder is created
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class UserActivity(Base):
     __tablename__ = "user_activities"
 
@@ -131,9 +202,11 @@ class Recommendation(Base):
     __tablename__ = "recommendations"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     exam_id = Column(Integer, ForeignKey("exams.id"))
     recommendation_type = Column(String)  # career_path, study_topic, clash_alert
+    rec_key = Column(String)  # stable identity per user, e.g. career_path:jee_main
+    input_hash = Column(String)  # hash of the user inputs it was computed from
     score = Column(Float)  # confidence score
     reasoning = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -157,6 +230,24 @@ class StudyPlan(Base):
     user = relationship("User", back_populates="study_plans")
     exam = relationship("Exam", back_populates="study_plans")
 
+class JobLease(Base):
+    __tablename__ = "job_leases"
+    __table_args__ = (UniqueConstraint("job_name", "run_id", "shard"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False)  # e.g. daily_checks
+    run_id = Column(String, nullable=False)  # one run per job per day, e.g. 2025-01-24
+    shard = Column(Integer, nullable=False)
+    start_id = Column(Integer, nullable=False)  # exclusive lower bound of the user id range
+    end_id = Column(Integer, nullable=False)  # inclusive upper bound
+    checkpoint_id = Column(Integer, nullable=False)  # last user id committed
+    status = Column(String, default="pending")  # pending, running, done, failed
+    owner = Column(String, nullable=True)  # host:pid holding the lease
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    stats = Column(JSON)  # counters accumulated across attempts
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
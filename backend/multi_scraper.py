@@ -1,14 +1,10 @@
 import scrapy
 from scrapy.crawler import CrawlerProcess
-import json
 from datetime import datetime
-from sqlalchemy.orm import sessionmaker
-from models import Exam, Topic
-from database import engine
-
-# Create session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-db = SessionLocal()
+from config import settings
+from database import SessionLocal, engine
+from listeners import install_listeners
+from scrape_pipeline import ExamUpserter, merge_item
 
 class MultiSourceScraper:
     """
@@ -38,134 +34,135 @@ class MultiSourceScraper:
         }
     }
 
-    def scrape_all_sources(self):
-        """Scrape all configured sources"""
-        for source_name, config in self.SOURCES.items():
-            print(f"Starting scrape for {source_name}")
-            try:
-                if source_name == "nta":
-                    self.scrape_nta(config)
-                elif source_name == "upsc":
-                    self.scrape_upsc(config)
-                elif source_name == "ssc":
-                    self.scrape_ssc(config)
-                elif source_name == "ibps":
-                    self.scrape_ibps(config)
-                print(f"Completed scrape for {source_name}")
-            except Exception as e:
-                print(f"Error scraping {source_name}: {e}")
-
-    def scrape_nta(self, config):
-        """Scrape NTA website"""
-        process = CrawlerProcess({
-            'USER_AGENT': 'ExamSensei-Bot/1.0 (+https://examsensei.com/bot)',
-            'FEEDS': [{'format': 'json', 'name': 'nta_data.json'}],
-        })
-
-        process.crawl(NTASpider, config=config)
-        process.start()
-
-    def scrape_upsc(self, config):
-        """Scrape UPSC website"""
-        process = CrawlerProcess({
-            'USER_AGENT': 'ExamSensei-Bot/1.0 (+https://examsensei.com/bot)',
-            'FEEDS': [{'format': 'json', 'name': 'upsc_data.json'}],
-        })
+    def __init__(self, upserter=None):
+        self.upserter = upserter or ExamUpserter()
+
+    def scrape_all_sources(self, force=False):
+        """Crawl every configured source concurrently; returns per-source stats"""
+        return self.scrape_sources(list(self.SOURCES), force=force)
+
+    def scrape_sources(self, source_names, force=False):
+        """
+        Crawl the given sources concurrently in one CrawlerProcess.
+
+        Twisted's reactor can only be started once per process, so every
+        spider is scheduled on the same process before it starts. Politeness
+        is per domain: each government site gets its own download slot,
+        delay and AutoThrottle, so crawling them together is no harder on
+        any one site than crawling it alone.
+
+        Pages unchanged since the last crawl are skipped before parsing;
+        `force` re-parses every page, e.g. after a spider was changed.
+        """
+        process = CrawlerProcess(self.crawl_settings(force=force))
+        crawlers = {}
+        for source_name in source_names:
+            crawler = process.create_crawler(SPIDERS[source_name])
+            process.crawl(crawler, config=self.SOURCES[source_name])
+            crawlers[source_name] = crawler
+            print(f"Scheduled scrape for {source_name}")
 
-        process.crawl(UPSCSpider, config=config)
         process.start()
 
-    def scrape_ssc(self, config):
-        """Scrape SSC website"""
-        process = CrawlerProcess({
-            'USER_AGENT': 'ExamSensei-Bot/1.0 (+https://examsensei.com/bot)',
-            'FEEDS': [{'format': 'json', 'name': 'ssc_data.json'}],
-        })
+        report = {name: self.crawl_report(crawler.stats.get_stats()) for name, crawler in crawlers.items()}
+        for name, stats in report.items():
+            print(
+                f"{name}: {stats['status']} in {stats['elapsed_seconds']}s, "
+                f"{stats['items']} items from {stats['responses']} responses, {stats['errors']} errors; "
+                f"exams {stats['exams_inserted']} inserted, {stats['exams_changed']} changed, "
+                f"{stats['exams_unchanged']} unchanged; "
+                f"{stats['pages_not_modified'] + stats['pages_unchanged']} pages skipped, "
+                f"{stats['bytes_saved']} bytes and {stats['parse_seconds_saved']}s parsing saved"
+            )
+        return report
+
+    @staticmethod
+    def crawl_settings(force=False):
+        """Scrapy settings shared by every spider of a run"""
+        return {
+            'USER_AGENT': settings.scraper_user_agent,
+            'ROBOTSTXT_OBEY': True,
+            # Items go straight to the database, merged per exam and written in batches
+            'ITEM_PIPELINES': {'scrape_pipeline.ExamUpsertPipeline': 300},
+            'EXAM_PIPELINE_BATCH_SIZE': 100,
+            'CONCURRENT_REQUESTS': 16,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': settings.scraper_concurrency_per_domain,
+            'DOWNLOAD_DELAY': settings.scraper_delay,
+            'RANDOMIZE_DOWNLOAD_DELAY': True,
+            'AUTOTHROTTLE_ENABLED': True,
+            'AUTOTHROTTLE_START_DELAY': settings.scraper_delay,
+            'AUTOTHROTTLE_MAX_DELAY': settings.scraper_delay * 10,
+            'AUTOTHROTTLE_TARGET_CONCURRENCY': 1.0,
+            'RETRY_ENABLED': True,
+            'RETRY_TIMES': settings.scraper_max_retries,
+            # Pages fetched within the expiry are served from disk; older ones are
+            # revalidated with the ETag/Last-Modified of the last parsed copy
+            'HTTPCACHE_ENABLED': True,
+            'HTTPCACHE_DIR': settings.scraper_cache_dir,
+            'HTTPCACHE_EXPIRATION_SECS': settings.scraper_cache_expiry,
+            'HTTPCACHE_POLICY': 'scrapy.extensions.httpcache.DummyPolicy',
+            'HTTPCACHE_IGNORE_HTTP_CODES': [304] + list(range(400, 600)),
+            'DOWNLOADER_MIDDLEWARES': {'scrape_cache.ConditionalFetchMiddleware': 950},
+            'SPIDER_MIDDLEWARES': {'scrape_cache.PageTimingMiddleware': 950},
+            'PAGE_CACHE_FORCE': force,
+        }
 
-        process.crawl(SSCSpider, config=config)
-        process.start()
+    @staticmethod
+    def crawl_report(stats):
+        """Summary of one spider's Scrapy stats"""
+        # log_count/ERROR counts every crawler in the process, so count this spider's failures directly
+        errors = stats.get('downloader/exception_count', 0) + sum(
+            value for key, value in stats.items() if key.startswith('spider_exceptions/')
+        )
+        reason = stats.get('finish_reason')
+        responses = stats.get('downloader/response_count', 0)
+        if reason != 'finished' or (errors and not responses):
+            status = 'failed'
+        elif errors:
+            status = 'partial'
+        else:
+            status = 'success'
+        return {
+            'status': status,
+            'finish_reason': reason,
+            'elapsed_seconds': round(stats.get('elapsed_time_seconds', 0.0), 2),
+            'requests': stats.get('downloader/request_count', 0),
+            'responses': responses,
+            'bytes': stats.get('downloader/response_bytes', 0),
+            'items': stats.get('item_scraped_count', 0),
+            'retries': stats.get('retry/count', 0),
+            'errors': errors,
+            'exams_inserted': stats.get('exams/inserted', 0),
+            'exams_changed': stats.get('exams/changed', 0),
+            'exams_unchanged': stats.get('exams/unchanged', 0),
+            'pages_parsed': stats.get('pagecache/parsed', 0),
+            'pages_not_modified': stats.get('pagecache/not_modified', 0),
+            'pages_unchanged': stats.get('pagecache/unchanged', 0),
+            'cache_hits': stats.get('pagecache/cache_hits', 0),
+            'bytes_saved': stats.get('pagecache/bytes_saved', 0),
+            'parse_seconds_saved': round(stats.get('pagecache/parse_seconds_saved', 0.0), 3),
+        }
 
-    def scrape_ibps(self, config):
-        """Scrape IBPS website"""
-        process = CrawlerProcess({
-            'USER_AGENT': 'ExamSensei-Bot/1.0 (+https://examsensei.com/bot)',
-            'FEEDS': [{'format': 'json', 'name': 'ibps_data.json'}],
-        })
+    def update_database(self, scraped_data, source_name, batch_size=100):
+        """Write items scraped earlier (e.g. a JSON feed file) through the same batched upsert as a crawl"""
+        merged = {}
+        for item in scraped_data:
+            if item.get("code"):
+                merged[item["code"]] = merge_item(merged.get(item["code"]), item)
 
-        process.crawl(IBPSSpider, config=config)
-        process.start()
+        items = list(merged.values())
+        totals = {"inserted": 0, "changed": 0, "unchanged": 0}
+        for i in range(0, len(items), batch_size):
+            for key, value in self.upserter.write(items[i:i + batch_size], source_name).items():
+                totals[key] += value
 
-    def update_database(self, scraped_data, source_name):
-        """Update database with scraped data"""
-        for exam_data in scraped_data:
-            # Check if exam exists
-            exam = db.query(Exam).filter(Exam.code == exam_data.get("code")).first()
-
-            if exam:
-                # Update existing exam
-                for key, value in exam_data.items():
-                    if hasattr(exam, key) and key != "id":
-                        if isinstance(value, (dict, list)):
-                            setattr(exam, key, json.dumps(value))
-                        else:
-                            setattr(exam, key, value)
-                exam.updated_at = datetime.utcnow()
-            else:
-                # Create new exam
-                exam_dict = exam_data.copy()
-                exam_dict["body"] = source_name.upper()
-
-                # Handle JSON fields
-                for json_field in ['eligibility', 'fees', 'important_dates', 'pattern', 'centers', 'subjects']:
-                    if json_field in exam_dict and isinstance(exam_dict[json_field], dict):
-                        exam_dict[json_field] = json.dumps(exam_dict[json_field])
-
-                exam = Exam(**exam_dict)
-                db.add(exam)
-
-            db.commit()
-
-            # Update topics if provided
-            if "topics" in exam_data:
-                self.update_topics(exam.id, exam_data["topics"])
-
-        print(f"Database updated with {len(scraped_data)} exams from {source_name}")
-
-    def update_topics(self, exam_id, topics_data):
-        """Update exam topics"""
-        for topic_data in topics_data:
-            topic = db.query(Topic).filter(
-                Topic.exam_id == exam_id,
-                Topic.subject == topic_data.get("subject"),
-                Topic.name == topic_data.get("name")
-            ).first()
-
-            if topic:
-                # Update existing topic
-                for key, value in topic_data.items():
-                    if hasattr(topic, key) and key not in ["id", "exam_id"]:
-                        if isinstance(value, (dict, list)):
-                            setattr(topic, key, json.dumps(value))
-                        else:
-                            setattr(topic, key, value)
-            else:
-                # Create new topic
-                topic_dict = topic_data.copy()
-                topic_dict["exam_id"] = exam_id
-
-                # Handle JSON fields
-                for json_field in ['weightage_history', 'difficulty_distribution', 'correlation_topics', 'previous_patterns']:
-                    if json_field in topic_dict and isinstance(topic_dict[json_field], dict):
-                        topic_dict[json_field] = json.dumps(topic_dict[json_field])
-
-                topic = Topic(**topic_dict)
-                db.add(topic)
-
-        db.commit()
+        print(f"Database updated from {source_name}: {totals}")
+        return totals
 
 
 class NTASpider(scrapy.Spider):
     name = "nta_spider"
+    source = "nta"
 
     def __init__(self, config=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -291,6 +288,7 @@ class NTASpider(scrapy.Spider):
 
 class UPSCSpider(scrapy.Spider):
     name = "upsc_spider"
+    source = "upsc"
 
     def __init__(self, config=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -350,6 +348,7 @@ class UPSCSpider(scrapy.Spider):
 
 class SSCSpider(scrapy.Spider):
     name = "ssc_spider"
+    source = "ssc"
 
     def __init__(self, config=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -409,6 +408,7 @@ class SSCSpider(scrapy.Spider):
 
 class IBPSSpider(scrapy.Spider):
     name = "ibps_spider"
+    source = "ibps"
 
     def __init__(self, config=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -447,6 +447,16 @@ class IBPSSpider(scrapy.Spider):
                 }
 
 
+# Source name -> spider, one per entry of MultiSourceScraper.SOURCES
+SPIDERS = {
+    "nta": NTASpider,
+    "upsc": UPSCSpider,
+    "ssc": SSCSpider,
+    "ibps": IBPSSpider,
+}
+
+
 if __name__ == "__main__":
+    install_listeners(engine, SessionLocal)
     scraper = MultiSourceScraper()
     scraper.scrape_all_sources()
@@ -0,0 +1,448 @@
+"""
+Notification delivery for ExamSensei
+Claims due notifications in batches and sends them through channel adapters
+"""
+import asyncio
+import os
+import random
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+import httpx
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+from models import Notification, User
+from exceptions import DeliveryError
+from logger import logger
+from metrics import NOTIFICATIONS
+
+
+class ChannelAdapter:
+    """
+    Base class for delivery channels.
+
+    `send` raises DeliveryError on failure; permanent errors (bad address,
+    rejected request) are not retried.
+    """
+
+    name = ""
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = concurrency or settings.notification_concurrency.get(self.name, 4)
+
+    async def open(self):
+        """Acquire shared resources; called inside the worker's event loop"""
+
+    async def close(self):
+        """Release resources acquired in `open`"""
+
+    async def end_batch(self):
+        """Release resources held for the batch just delivered"""
+
+    async def send(self, notification: Notification, user: User):
+        raise NotImplementedError
+
+
+class EmailAdapter(ChannelAdapter):
+    """
+    Email through the SMTP server in settings.smtp_*.
+
+    Connections are logged in once and reused for the rest of the batch,
+    at most one per concurrent send; a connection the server dropped is
+    replaced and the message retried once. They are closed at the end of
+    every batch, so none sits idle between polls.
+    """
+
+    name = "email"
+
+    def __init__(self, concurrency: Optional[int] = None):
+        super().__init__(concurrency)
+        self._idle: List[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+
+    async def send(self, notification: Notification, user: User):
+        if not user.email:
+            raise DeliveryError("User has no email address", permanent=True)
+        # smtplib blocks, so each message goes out on a worker thread
+        await asyncio.to_thread(self._send_sync, user.email, notification)
+
+    async def end_batch(self):
+        await asyncio.to_thread(self._quit_idle)
+
+    async def close(self):
+        await self.end_batch()
+
+    def _send_sync(self, to_address: str, notification: Notification):
+        message = EmailMessage()
+        message["Subject"] = f"ExamSensei: {(notification.notification_type or 'update').replace('_', ' ').title()}"
+        message["From"] = settings.from_email
+        message["To"] = to_address
+        message.set_content(notification.message or "")
+
+        smtp = None
+        try:
+            smtp, reused = self._checkout()
+            try:
+                smtp.send_message(message)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                if not reused:
+                    raise
+                # The server dropped an idle connection; reconnect once
+                self._discard(smtp)
+                smtp = None
+                smtp = self._connect()
+                smtp.send_message(message)
+        except smtplib.SMTPRecipientsRefused as e:
+            self._checkin(smtp)
+            raise DeliveryError(f"Recipient refused: {e}", permanent=True)
+        except (smtplib.SMTPException, OSError) as e:
+            self._discard(smtp)
+            raise DeliveryError(f"SMTP error: {e}")
+        self._checkin(smtp)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=30)
+        try:
+            smtp.starttls()
+            if settings.smtp_user:
+                smtp.login(settings.smtp_user, settings.smtp_password)
+        except Exception:
+            self._discard(smtp)
+            raise
+        return smtp
+
+    def _checkout(self):
+        """An idle logged-in connection, or a new one; returns (connection, reused)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, smtp: Optional[smtplib.SMTP]):
+        if smtp is not None:
+            with self._lock:
+                self._idle.append(smtp)
+
+    @staticmethod
+    def _discard(smtp: Optional[smtplib.SMTP]):
+        if smtp is not None:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _quit_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp in idle:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+
+class HTTPChannelAdapter(ChannelAdapter):
+    """Shared client and error mapping for HTTP-based channels"""
+
+    TIMEOUT_SECONDS = 10
+
+    def __init__(self, concurrency: Optional[int] = None):
+        super().__init__(concurrency)
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def open(self):
+        self.client = httpx.AsyncClient(timeout=self.TIMEOUT_SECONDS)
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def _post(self, url: str, **kwargs):
+        try:
+            response = await self.client.post(url, **kwargs)
+        except httpx.HTTPError as e:
+            raise DeliveryError(f"{self.name} request failed: {e}")
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise DeliveryError(f"{self.name} returned HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise DeliveryError(
+                f"{self.name} rejected the message: HTTP {response.status_code} {response.text[:200]}",
+                permanent=True
+            )
+
+
+class PushAdapter(HTTPChannelAdapter):
+    """Push notifications through the gateway at settings.push_api_url"""
+
+    name = "push"
+
+    async def send(self, notification: Notification, user: User):
+        await self._post(
+            settings.push_api_url,
+            headers={"Authorization": f"Bearer {settings.push_api_key}"},
+            json={
+                "user_id": user.id,
+                "title": (notification.notification_type or "update").replace("_", " ").title(),
+                "body": notification.message
+            }
+        )
+
+
+class TelegramAdapter(HTTPChannelAdapter):
+    """Telegram messages through the bot in settings.telegram_bot_token"""
+
+    name = "telegram"
+
+    async def send(self, notification: Notification, user: User):
+        if not user.telegram_chat_id:
+            raise DeliveryError("User has not linked Telegram", permanent=True)
+        await self._post(
+            f"https://api.telegram.org/bot{settings.telegram_bot_token}/sendMessage",
+            json={"chat_id": user.telegram_chat_id, "text": notification.message}
+        )
+
+
+class FakeChannelAdapter(ChannelAdapter):
+    """
+    Records messages instead of sending them, for tests and local runs.
+    The first `fail_times` sends fail (permanently if `permanent`).
+    """
+
+    def __init__(self, name: str, concurrency: int = 4, fail_times: int = 0, permanent: bool = False, delay: float = 0):
+        self.name = name
+        super().__init__(concurrency)
+        self.fail_times = fail_times
+        self.permanent = permanent
+        self.delay = delay
+        self.sent: List[Dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send(self, notification: Notification, user: User):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise DeliveryError(f"Fake {self.name} failure", permanent=self.permanent)
+            self.sent.append({"user_id": user.id, "message": notification.message})
+        finally:
+            self.in_flight -= 1
+
+
+def default_adapters() -> List[ChannelAdapter]:
+    """Adapters for every channel configured in settings"""
+    adapters: List[ChannelAdapter] = []
+    if settings.smtp_user:
+        adapters.append(EmailAdapter())
+    if settings.push_api_url:
+        adapters.append(PushAdapter())
+    if settings.telegram_bot_token:
+        adapters.append(TelegramAdapter())
+    return adapters
+
+
+class DeliveryWorker:
+    """
+    Claims due notifications in batches and delivers them channel by channel.
+
+    Claiming uses SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL and one
+    conditional UPDATE on SQLite, which serializes writers, so several
+    workers can share the queue. Each channel has its own concurrency limit.
+    Transient failures are retried with exponential backoff up to
+    `max_attempts`; permanent ones fail straight away. Rows left in
+    "sending" by a crashed worker are reclaimed after CLAIM_TIMEOUT.
+    """
+
+    BACKOFF_BASE_SECONDS = 30
+    BACKOFF_MAX_SECONDS = 3600
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+    IDLE_SECONDS = 5
+
+    def __init__(
+        self,
+        adapters: Optional[List[ChannelAdapter]] = None,
+        session_factory: Callable = SessionLocal,
+        batch_size: int = settings.notification_batch_size,
+        max_attempts: int = settings.notification_max_attempts
+    ):
+        self.adapters = {adapter.name: adapter for adapter in (adapters if adapters is not None else default_adapters())}
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.metrics = {"batches": 0, "sent": 0, "retried": 0, "failed": 0, "max_lag_seconds": 0.0, "channels": {}}
+
+    def run_once(self) -> Dict:
+        """Deliver everything currently due, then return the metrics"""
+        return asyncio.run(self._run(forever=False))
+
+    def run_forever(self):
+        """Keep delivering, polling every IDLE_SECONDS when the queue is empty"""
+        asyncio.run(self._run(forever=True))
+
+    async def _run(self, forever: bool) -> Dict:
+        if not self.adapters:
+            logger.warning("No notification channels configured")
+            return self.metrics
+
+        self.semaphores = {name: asyncio.Semaphore(adapter.concurrency) for name, adapter in self.adapters.items()}
+        for adapter in self.adapters.values():
+            await adapter.open()
+
+        db = self.session_factory()
+        try:
+            while True:
+                if not await self.deliver_batch(db):
+                    if not forever:
+                        break
+                    await asyncio.sleep(self.IDLE_SECONDS)
+        finally:
+            db.close()
+            for adapter in self.adapters.values():
+                await adapter.close()
+        return self.metrics
+
+    async def deliver_batch(self, db: Session) -> int:
+        """Claim one batch and deliver it; returns the number of notifications handled"""
+        batch = self.claim(db, datetime.utcnow())
+        if not batch:
+            return 0
+
+        users = {user.id: user for user in db.query(User).filter(User.id.in_({n.user_id for n in batch})).all()}
+        by_channel: Dict[str, List[Notification]] = {}
+        for notification in batch:
+            by_channel.setdefault(notification.channel, []).append(notification)
+
+        # Every channel sends at once; each channel's semaphore caps its own concurrency
+        started = time.perf_counter()
+        try:
+            errors = await asyncio.gather(*(self._deliver(n, users.get(n.user_id)) for n in batch))
+        finally:
+            for adapter in self.adapters.values():
+                await adapter.end_batch()
+        finished = datetime.utcnow()
+        for notification, error in zip(batch, errors):
+            self._record(notification, error, finished)
+        db.commit()
+
+        self.metrics["batches"] += 1
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Delivered batch of {len(batch)} in {elapsed:.2f}s "
+            f"({len(batch) / max(elapsed, 1e-9):.0f}/s): "
+            + ", ".join(f"{channel}={len(items)}" for channel, items in by_channel.items())
+        )
+        return len(batch)
+
+    def claim(self, db: Session, now: datetime) -> List[Notification]:
+        """Atomically take up to batch_size due notifications for this worker"""
+        token = f"{self.worker_id}:{uuid.uuid4().hex[:12]}"
+        claimable = and_(
+            Notification.sent == False,  # noqa: E712
+            Notification.channel.in_(list(self.adapters)),
+            # Rows queued before scheduling existed have no scheduled_at and are due now
+            or_(Notification.scheduled_at.is_(None), Notification.scheduled_at <= now),
+            or_(
+                and_(
+                    or_(Notification.status == "pending", Notification.status.is_(None)),
+                    or_(Notification.next_attempt_at.is_(None), Notification.next_attempt_at <= now)
+                ),
+                and_(Notification.status == "sending", Notification.claimed_at < now - self.CLAIM_TIMEOUT)
+            )
+        )
+        due = select(Notification.id).where(claimable).order_by(Notification.scheduled_at, Notification.id).limit(self.batch_size)
+
+        if db.get_bind().dialect.name == "postgresql":
+            ids = db.execute(due.with_for_update(skip_locked=True)).scalars().all()
+            if not ids:
+                db.rollback()
+                return []
+            target = Notification.id.in_(ids)
+        else:
+            target = and_(Notification.id.in_(due), claimable)
+
+        db.query(Notification).filter(target).update({
+            Notification.status: "sending",
+            Notification.claimed_by: token,
+            Notification.claimed_at: now
+        }, synchronize_session=False)
+        db.commit()
+
+        return db.query(Notification).filter(
+            Notification.claimed_by == token,
+            Notification.status == "sending"
+        ).all()
+
+    async def _deliver(self, notification: Notification, user: Optional[User]) -> Optional[DeliveryError]:
+        if user is None:
+            return DeliveryError("User not found", permanent=True)
+
+        async with self.semaphores[notification.channel]:
+            try:
+                await self.adapters[notification.channel].send(notification, user)
+            except DeliveryError as e:
+                return e
+            except Exception as e:
+                return DeliveryError(f"Unexpected {notification.channel} error: {e}")
+        return None
+
+    def _record(self, notification: Notification, error: Optional[DeliveryError], now: datetime):
+        channel = self.metrics["channels"].setdefault(notification.channel, {"sent": 0, "retried": 0, "failed": 0})
+        notification.attempts = (notification.attempts or 0) + 1
+        notification.claimed_by = None
+        notification.claimed_at = None
+
+        if error is None:
+            notification.status = "sent"
+            notification.sent = True
+            notification.sent_at = now
+            notification.last_error = None
+            outcome = "sent"
+            lag = (now - (notification.scheduled_at or notification.created_at or now)).total_seconds()
+            self.metrics["max_lag_seconds"] = max(self.metrics["max_lag_seconds"], lag)
+        elif error.permanent or notification.attempts >= self.max_attempts:
+            notification.status = "failed"
+            notification.last_error = error.message
+            outcome = "failed"
+        else:
+            notification.status = "pending"
+            notification.next_attempt_at = now + self.backoff(notification.attempts)
+            notification.last_error = error.message
+            outcome = "retried"
+
+        self.metrics[outcome] += 1
+        channel[outcome] += 1
+        NOTIFICATIONS.labels(notification.channel, outcome).inc()
+
+    def backoff(self, attempts: int) -> timedelta:
+        """Exponential backoff with jitter after `attempts` failed tries"""
+        delay = min(self.BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), self.BACKOFF_MAX_SECONDS)
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    @staticmethod
+    def queue_stats(db: Session) -> Dict:
+        """Undelivered notifications that are due, and how long the oldest has waited"""
+        now = datetime.utcnow()
+        due_since = func.coalesce(Notification.scheduled_at, Notification.created_at)
+        pending, oldest = db.query(func.count(Notification.id), func.min(due_since)).filter(
+            Notification.sent == False,  # noqa: E712
+            or_(Notification.status.in_(["pending", "sending"]), Notification.status.is_(None)),
+            or_(Notification.scheduled_at.is_(None), Notification.scheduled_at <= now)
+        ).one()
+        return {
+            "pending": pending,
+            "oldest_lag_seconds": (now - oldest).total_seconds() if oldest else 0.0
+        }
@@ -0,0 +1,177 @@
+"""
+Token revocation store for ExamSensei
+Revoked token ids live in Redis with a TTL; a Bloom filter in each process answers most checks
+"""
+import hashlib
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+from config import settings
+from cache import cache
+from logger import logger
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives, tunable false positives)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+
+class RevocationStore:
+    """
+    Revoked token ids (jti).
+
+    Every revocation is written to Redis as `revoked:{jti}` with a TTL equal to
+    the token's remaining lifetime, added to this process's Bloom filter and
+    published so other processes add it to theirs. A token whose id is not in
+    the filter is certainly not revoked, which settles almost every check
+    without a network call; only filter hits are confirmed against Redis.
+
+    Without Redis the store keeps exact revocations in memory, which is enough
+    for a single process.
+    """
+
+    KEY_PREFIX = "revoked:"
+    CHANNEL = "token-revocations"
+
+    def __init__(self, capacity: int = settings.revocation_filter_capacity, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        self._local: Dict[str, float] = {}  # jti -> expiry, used when Redis is unavailable
+        self._pending: Optional[List[str]] = None
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def revoke(self, jti: str, expires_at: float) -> bool:
+        """
+        Revoke a token id until `expires_at` (unix time). Returns False if it
+        was already revoked, so concurrent refreshes of one token can't both win.
+        """
+        ttl = max(1, int(expires_at - time.time()))
+        if cache.enabled:
+            try:
+                first = bool(cache.redis_client.set(self._key(jti), 1, ex=ttl, nx=True))
+                cache.redis_client.publish(self.CHANNEL, jti)
+            except Exception as e:
+                logger.error(f"Token revocation error: {e}")
+                first = self._revoke_local(jti, expires_at)
+        else:
+            first = self._revoke_local(jti, expires_at)
+
+        self._add(jti)
+        return first
+
+    def is_revoked(self, jti: str) -> bool:
+        """Whether a token id has been revoked"""
+        with self._lock:
+            if jti not in self.filter:
+                return False
+
+        if cache.enabled:
+            try:
+                if cache.redis_client.exists(self._key(jti)):
+                    return True
+            except Exception as e:
+                # Fail closed: a filter hit is most likely a real revocation
+                logger.error(f"Token revocation check error: {e}")
+                return True
+
+        with self._lock:
+            expires_at = self._local.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def rebuild(self):
+        """Recreate the filter from live revocations, dropping expired ones"""
+        now = time.time()
+        with self._lock:
+            self._local = {jti: exp for jti, exp in self._local.items() if exp > now}
+            live = list(self._local)
+            self._pending = []  # revocations arriving while Redis is scanned
+
+        if cache.enabled:
+            try:
+                live.extend(key[len(self.KEY_PREFIX):] for key in cache.redis_client.scan_iter(f"{self.KEY_PREFIX}*", count=1000))
+            except Exception as e:
+                logger.error(f"Revocation filter rebuild error: {e}")
+
+        with self._lock:
+            # Grow rather than rebuild again on the next revocation
+            self.capacity = max(self.capacity, 2 * len(live))
+            fresh = BloomFilter(self.capacity, self.error_rate)
+            for jti in live + self._pending:
+                fresh.add(jti)
+            self.filter = fresh
+            self._pending = None
+        logger.info(f"Revocation filter rebuilt with {fresh.count} token ids")
+
+    def start_sync(self):
+        """Load current revocations and follow other processes' revocations over pub/sub"""
+        self.rebuild()
+        if not cache.enabled or self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="revocation-sync", daemon=True)
+        self._listener.start()
+
+    def clear(self):
+        """Forget this process's revocations"""
+        with self._lock:
+            self._local.clear()
+            self.filter = BloomFilter(self.capacity, self.error_rate)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = cache.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    self._add(message["data"])
+            except Exception as e:
+                logger.warning(f"Revocation sync interrupted, resubscribing: {e}")
+                time.sleep(5)
+                # Revocations published while disconnected are picked up from Redis
+                self.rebuild()
+
+    def _add(self, jti: str):
+        with self._lock:
+            self.filter.add(jti)
+            if self._pending is not None:
+                self._pending.append(jti)
+            full = self.filter.count > self.capacity
+        if full:
+            self.rebuild()
+
+    def _revoke_local(self, jti: str, expires_at: float) -> bool:
+        with self._lock:
+            current = self._local.get(jti)
+            if current is not None and current > time.time():
+                return False
+            self._local[jti] = expires_at
+            return True
+
+    def _key(self, jti: str) -> str:
+        return f"{self.KEY_PREFIX}{jti}"
+
+
+revocation_store = RevocationStore()
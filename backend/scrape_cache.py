@@ -0,0 +1,213 @@
+"""
+Conditional fetching for ExamSensei scrapers
+Remembers validators and content hashes per URL so unchanged pages are neither re-downloaded nor re-parsed
+"""
+import hashlib
+import time
+import weakref
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from database import SessionLocal
+from models import ScrapedPage
+
+PAGE_FIELDS = ("etag", "last_modified", "content_hash", "content_length", "parse_seconds")
+
+
+class NotModified(IgnoreRequest):
+    """Raised for pages that did not change since they were last parsed"""
+
+
+class PageStore:
+    """
+    The scraped_pages rows of one crawler, loaded when its spider opens and
+    written back when it closes. Shared by the downloader middleware, which
+    reads the validators, and the spider middleware, which records pages
+    once they are parsed.
+
+    Nothing is written if a batch of scraped exams failed to commit: the
+    items of a recorded page may have been lost with it, and a recorded
+    page would be skipped as unchanged next crawl.
+    """
+
+    _stores = weakref.WeakKeyDictionary()
+
+    def __init__(self, session_factory: Callable = SessionLocal):
+        self.session_factory = session_factory
+        self.pages: Dict[str, Dict] = {}
+        self.updated: Dict[str, Dict] = {}
+        self.failed = False
+
+    @classmethod
+    def for_crawler(cls, crawler) -> "PageStore":
+        store = cls._stores.get(crawler)
+        if store is None:
+            store = cls._stores[crawler] = cls()
+            crawler.signals.connect(store.load, signal=signals.spider_opened)
+            crawler.signals.connect(store.save, signal=signals.spider_closed)
+        return store
+
+    def load(self, spider=None):
+        db = self.session_factory()
+        try:
+            self.pages = {
+                page.url: {field: getattr(page, field) for field in PAGE_FIELDS}
+                for page in db.query(ScrapedPage)
+            }
+        finally:
+            db.close()
+
+    def get(self, url: str) -> Optional[Dict]:
+        return self.pages.get(url)
+
+    def update(self, url: str, page: Dict):
+        if not self.failed:
+            self.pages[url] = self.updated[url] = page
+
+    def discard(self):
+        """Forget this crawl's pages after scraped items were lost, so they are parsed again next crawl"""
+        self.failed = True
+        self.updated = {}
+
+    def save(self, spider=None):
+        """Write the pages updated during the crawl in one transaction"""
+        if self.failed or not self.updated:
+            return
+        db = self.session_factory()
+        try:
+            rows = {page.url: page for page in db.query(ScrapedPage).filter(ScrapedPage.url.in_(list(self.updated)))}
+            now = datetime.utcnow()
+            for url, page in self.updated.items():
+                row = rows.get(url)
+                if row is None:
+                    row = ScrapedPage(url=url)
+                    db.add(row)
+                for field in PAGE_FIELDS:
+                    setattr(row, field, page.get(field))
+                row.fetched_at = now
+            db.commit()
+            self.updated = {}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class ConditionalFetchMiddleware:
+    """
+    Downloader middleware sending If-None-Match / If-Modified-Since for
+    pages parsed before, and dropping a response before it reaches the
+    spider when the site answers 304 or the body hashes the same as last
+    time.
+
+    It sits below HttpCacheMiddleware, so only requests missing from the
+    on-disk cache are made conditional, and a 304 is never cached; fresh
+    cache hits still pass through the hash check. Savings land in the crawl
+    stats under pagecache/.
+    """
+
+    def __init__(self, store: PageStore, stats, force: bool = False):
+        self.store = store
+        self.stats = stats
+        self.force = force  # re-parse every page, e.g. after a spider changed
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(PageStore.for_crawler(crawler), crawler.stats, crawler.settings.getbool("PAGE_CACHE_FORCE"))
+
+    def process_request(self, request, spider):
+        page = self._known_page(request)
+        if page is None:
+            return None
+        if page.get("etag"):
+            request.headers.setdefault("If-None-Match", page["etag"])
+        if page.get("last_modified"):
+            request.headers.setdefault("If-Modified-Since", page["last_modified"])
+        return None
+
+    def process_response(self, request, response, spider):
+        if self._skipped(request):
+            return response
+        page = self._known_page(request)
+
+        if "cached" in response.flags:
+            self.stats.inc_value("pagecache/cache_hits", spider=spider)
+            self.stats.inc_value("pagecache/bytes_saved", len(response.body), spider=spider)
+
+        if response.status == 304 and page is not None:
+            self.stats.inc_value("pagecache/not_modified", spider=spider)
+            self.stats.inc_value("pagecache/bytes_saved", page.get("content_length") or 0, spider=spider)
+            self._parse_saved(page, spider)
+            raise NotModified(f"Not modified: {request.url}")
+        if response.status != 200:
+            return response
+
+        content_hash = hashlib.sha256(response.body).hexdigest()
+        if page is not None and page.get("content_hash") == content_hash:
+            self.stats.inc_value("pagecache/unchanged", spider=spider)
+            self._parse_saved(page, spider)
+            raise NotModified(f"Unchanged: {request.url}")
+
+        # Recorded by PageTimingMiddleware once the spider has parsed the page
+        request.meta["scraped_page"] = {
+            "etag": self._header(response, "ETag"),
+            "last_modified": self._header(response, "Last-Modified"),
+            "content_hash": content_hash,
+            "content_length": len(response.body),
+        }
+        return response
+
+    def _known_page(self, request) -> Optional[Dict]:
+        if self.force or self._skipped(request):
+            return None
+        return self.store.get(request.url)
+
+    @staticmethod
+    def _skipped(request) -> bool:
+        # robots.txt and requests opting out are fetched as usual
+        return request.meta.get("dont_obey_robotstxt", False) or request.meta.get("dont_revalidate", False)
+
+    def _parse_saved(self, page: Dict, spider):
+        self.stats.inc_value("pagecache/parse_seconds_saved", page.get("parse_seconds") or 0.0, spider=spider)
+
+    @staticmethod
+    def _header(response, name: str) -> Optional[str]:
+        value = response.headers.get(name)
+        return value.decode("latin-1") if value else None
+
+
+class PageTimingMiddleware:
+    """
+    Spider middleware timing each page's callback and recording the page,
+    with its validators and hash, only after the callback finished, so a
+    page whose parse failed is fetched and parsed again next crawl.
+    """
+
+    def __init__(self, store: PageStore, stats):
+        self.store = store
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(PageStore.for_crawler(crawler), crawler.stats)
+
+    def process_spider_output(self, response, result, spider):
+        page = response.meta.get("scraped_page")
+        iterator = iter(result)
+        elapsed = 0.0
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield output
+
+        if page is not None:
+            self.stats.inc_value("pagecache/parsed", spider=spider)
+            self.stats.inc_value("pagecache/parse_seconds", elapsed, spider=spider)
+            self.store.update(response.url, dict(page, parse_seconds=round(elapsed, 6)))
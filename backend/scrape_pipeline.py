@@ -0,0 +1,269 @@
+"""
+Scraped exam pipeline for ExamSensei
+Merges scraped items per exam code and writes them to the database in batched upserts
+"""
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Exam, Topic, load_json
+from exam_changes import ExamChange, exam_changes, queue_update_notifications
+from exam_events import replace_events
+from scrape_cache import PageStore
+from logger import logger
+
+JSON_FIELDS = ("eligibility", "fees", "important_dates", "pattern", "centers", "subjects")
+TOPIC_JSON_FIELDS = ("weightage_history", "difficulty_distribution", "correlation_topics", "previous_patterns")
+# Columns a scraped item may set; ids, timestamps and the content hash are managed here
+EXAM_FIELDS = frozenset(
+    column.key for column in Exam.__table__.columns
+    if column.key not in ("id", "created_at", "updated_at", "content_hash")
+)
+# Keys restamped on every scrape, left out of comparisons so they never count as a change
+VOLATILE_KEYS = {"important_dates": ("last_updated",)}
+
+
+def merge_item(current: Optional[Dict], item: Dict) -> Dict:
+    """
+    Fold a partial item into what is known about the same exam. Dict fields
+    are merged key by key, so the notification date from one page and the
+    exam dates from another both survive; other fields are replaced.
+    """
+    merged = dict(current or {})
+    for key, value in item.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def canonical_value(field: str, value):
+    """A field's value as compared and hashed: JSON decoded, volatile keys dropped"""
+    if field in JSON_FIELDS:
+        value = load_json(value)
+    if isinstance(value, dict) and field in VOLATILE_KEYS:
+        value = {key: item for key, item in value.items() if key not in VOLATILE_KEYS[field]}
+    return value
+
+
+def content_hash(fields: Dict) -> str:
+    """sha256 over the canonical value of every exam field, absent ones as null"""
+    canonical = {field: canonical_value(field, fields.get(field)) for field in sorted(EXAM_FIELDS)}
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ExamUpserter:
+    """
+    Writes merged exam items in batches.
+
+    Each batch reads the existing rows for its codes in one query, sorts the
+    items into inserted, changed and unchanged, and writes only the first two
+    with one multi-row upsert per column set: INSERT ... ON CONFLICT (code)
+    DO UPDATE on SQLite and PostgreSQL, a multi-row INSERT plus an UPDATE per
+    changed row elsewhere. Every batch is its own transaction.
+
+    Dict fields (important_dates, fees, ...) are merged key by key into the
+    stored value, since a crawl that skips unchanged pages only carries the
+    keys scraped from pages that changed. An item whose merge into the
+    stored row hashes to the stored content_hash is unchanged and never
+    touches the row, whatever volatile keys it restamped. Otherwise only the
+    fields whose canonical value differs are written, and the committed
+    changes are published on exam_changes with the fields that changed.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal):
+        self.session_factory = session_factory
+
+    def write(self, items: Iterable[Dict], source: str) -> Dict:
+        """Upsert one batch of items (at most one per code); returns inserted/changed/unchanged counts"""
+        items = {item["code"]: item for item in items if item.get("code")}
+        stats = {"inserted": 0, "changed": 0, "unchanged": 0}
+        if not items:
+            return stats
+
+        db = self.session_factory()
+        try:
+            existing = {
+                row["code"]: row
+                for row in db.execute(select(Exam.__table__).where(Exam.code.in_(list(items)))).mappings()
+            }
+
+            now = datetime.utcnow()
+            groups: Dict[tuple, List[Dict]] = {}
+            changed: Dict[str, tuple] = {}  # code -> (changed fields, new hash, inserted)
+            written: Dict[str, Dict] = {}  # code -> fields as written
+            for code, item in items.items():
+                fields = {key: value for key, value in item.items() if key in EXAM_FIELDS}
+                current = existing.get(code)
+                written[code] = fields
+                if current is None:
+                    fields.setdefault("body", source.upper())
+                    digest = content_hash(fields)
+                    row = dict(fields)
+                    changed[code] = (sorted(fields), digest, True)
+                    stats["inserted"] += 1
+                else:
+                    # A crawl only sees the pages that changed, so dict fields are merged key by
+                    # key into what is stored; keys from skipped pages must survive
+                    for key, value in fields.items():
+                        stored = load_json(current[key]) if key in JSON_FIELDS else None
+                        if isinstance(value, dict) and isinstance(stored, dict):
+                            fields[key] = merge_item(stored, value)
+                    digest = content_hash({**current, **fields})
+                    if digest == current["content_hash"]:
+                        stats["unchanged"] += 1
+                        continue
+                    row = {
+                        key: value for key, value in fields.items()
+                        if canonical_value(key, value) != canonical_value(key, current[key])
+                    }
+                    if row:
+                        changed[code] = (sorted(row), digest, False)
+                        stats["changed"] += 1
+                    else:
+                        # Rows written before content hashes existed just get theirs
+                        stats["unchanged"] += 1
+                    row["code"] = code
+
+                row = {key: self._column_value(key, value) for key, value in row.items()}
+                row["content_hash"] = digest
+                row["updated_at"] = now if code in changed else current["updated_at"]
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+
+            for rows in groups.values():
+                self._upsert(db, rows, existing, now)
+
+            ids = dict(db.execute(select(Exam.code, Exam.id).where(Exam.code.in_(list(items)))).all())
+            changes = [
+                ExamChange(ids[code], code, items[code].get("name") or (existing.get(code) or {}).get("name") or code,
+                           fields, digest, inserted)
+                for code, (fields, digest, inserted) in changed.items()
+            ]
+            replace_events(db, {
+                change.exam_id: written[change.code]["important_dates"]
+                for change in changes if "important_dates" in change.fields
+            })
+            self._write_topics(db, {ids[code]: item["topics"] for code, item in items.items() if item.get("topics")})
+            queue_update_notifications(db, changes)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        exam_changes.publish(changes)
+        return stats
+
+    def _upsert(self, db: Session, rows: List[Dict], existing: Dict, now: datetime):
+        """Write rows that share one column set"""
+        table = Exam.__table__
+        dialect = db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            statement = insert(table).values([dict(row, created_at=now) for row in rows])
+            updates = {column: statement.excluded[column] for column in rows[0] if column != "code"}
+            db.execute(statement.on_conflict_do_update(index_elements=[table.c.code], set_=updates))
+            return
+
+        new = [dict(row, created_at=now) for row in rows if row["code"] not in existing]
+        if new:
+            db.execute(table.insert(), new)
+        for row in rows:
+            if row["code"] in existing:
+                db.execute(table.update().where(table.c.code == row["code"]).values(row))
+
+    def _write_topics(self, db: Session, topics_by_exam: Dict[int, List[Dict]]):
+        """Add or update scraped topics, matched by (exam, subject, name) against one query's results"""
+        if not topics_by_exam:
+            return
+        current = {
+            (topic.exam_id, topic.subject, topic.name): topic
+            for topic in db.query(Topic).filter(Topic.exam_id.in_(list(topics_by_exam)))
+        }
+        for exam_id, topics in topics_by_exam.items():
+            for data in topics:
+                topic = current.get((exam_id, data.get("subject"), data.get("name")))
+                if topic is None:
+                    topic = Topic(exam_id=exam_id)
+                    db.add(topic)
+                    current[(exam_id, data.get("subject"), data.get("name"))] = topic
+                for key, value in data.items():
+                    if hasattr(topic, key) and key not in ("id", "exam_id"):
+                        if key in TOPIC_JSON_FIELDS and isinstance(value, (dict, list)):
+                            value = json.dumps(value)
+                        setattr(topic, key, value)
+
+    @staticmethod
+    def _column_value(key: str, value):
+        if key in JSON_FIELDS and isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+
+
+class ExamUpsertPipeline:
+    """
+    Scrapy item pipeline streaming scraped exams into the database.
+
+    Items are merged per exam code for the whole crawl and flushed through
+    ExamUpserter every EXAM_PIPELINE_BATCH_SIZE distinct codes and when the
+    spider closes. A code seen again after its batch was written is
+    re-written from the merged item, so late partial updates never drop
+    fields written earlier in the crawl. Counts land in the crawl stats as
+    exams/inserted, exams/changed and exams/unchanged.
+    """
+
+    def __init__(self, batch_size: int = 100, upserter: Optional[ExamUpserter] = None):
+        self.batch_size = batch_size
+        self.upserter = upserter or ExamUpserter()
+        self.merged: Dict[str, Dict] = {}
+        self.pending: Dict[str, Dict] = {}
+        self.stats = None  # the crawler's stats collector
+        self.pages: Optional[PageStore] = None  # the crawl's parsed pages, forgotten if a batch fails
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(batch_size=crawler.settings.getint("EXAM_PIPELINE_BATCH_SIZE", 100))
+        pipeline.stats = crawler.stats
+        pipeline.pages = PageStore.for_crawler(crawler)
+        return pipeline
+
+    def process_item(self, item, spider):
+        data = dict(item)
+        code = data.get("code")
+        if code:
+            self.merged[code] = merge_item(self.merged.get(code), data)
+            self.pending[code] = self.merged[code]
+            if len(self.pending) >= self.batch_size:
+                self.flush(spider)
+        return item
+
+    def close_spider(self, spider):
+        self.flush(spider)
+
+    def flush(self, spider):
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        batch, self.pending = list(self.pending.values()), {}
+        try:
+            counts = self.upserter.write(batch, getattr(spider, "source", spider.name))
+        except Exception:
+            if self.pages is not None:
+                self.pages.discard()
+            raise
+        if self.stats is not None:
+            for key, value in counts.items():
+                self.stats.inc_value(f"exams/{key}", value, spider=spider)
+        logger.info(
+            f"{spider.name}: wrote {len(batch)} exams in {(time.perf_counter() - start) * 1000:.0f}ms",
+            extra=counts
+        )
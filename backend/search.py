@@ -0,0 +1,194 @@
+"""
+Exam search for ExamSensei
+In-process inverted index with BM25 ranking, trigram fuzzy matching and prefix autocomplete
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from catalog import exam_catalog, name_tokens
+from logger import logger
+
+# Too common in syllabus text to tell exams apart
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+    "the", "to", "with"
+})
+
+
+def trigrams(term: str) -> Set[str]:
+    """Padded character trigrams of a word, as pg_trgm computes them"""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted index over exam name, code, body and syllabus.
+
+    Documents are scored with BM25F: each field's term frequency is
+    normalized by that field's length, weighted by the field boost and
+    summed before saturation, so words in a long syllabus weigh less than
+    the same words in a short name. Query words missing from the vocabulary are replaced by the
+    vocabulary words sharing enough trigrams with them, scaled by their
+    similarity, which absorbs typos such as "jee mian". Autocomplete expands
+    the last word as a prefix over name words only.
+    """
+
+    FIELDS = {"name": 3.0, "code": 2.0, "body": 1.0, "syllabus": 0.5}
+    K1 = 1.2
+    B = 0.75
+    FUZZY_THRESHOLD = 0.3  # pg_trgm's default similarity threshold
+    FUZZY_EXPANSIONS = 5  # closest vocabulary words tried per unknown query word
+    PREFIX_EXPANSIONS = 50  # completions tried for the last autocomplete word
+
+    def __init__(self, exams: Iterable, version: int = 0):
+        self.version = version
+        self.exams: Dict[int, object] = {}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.name_postings: Dict[str, Set[int]] = {}
+
+        fields: Dict[int, Dict[str, List[str]]] = {}
+        totals = {field: 0 for field in self.FIELDS}
+        for exam in exams:
+            self.exams[exam.id] = exam
+            tokens = {field: self.tokenize(getattr(exam, field, None)) for field in self.FIELDS}
+            fields[exam.id] = tokens
+            for field, words in tokens.items():
+                totals[field] += len(words)
+
+        count = max(len(fields), 1)
+        average = {field: max(total / count, 1.0) for field, total in totals.items()}
+
+        for exam_id, tokens in fields.items():
+            weights: Dict[str, float] = {}
+            for field, words in tokens.items():
+                if not words:
+                    continue
+                norm = self.FIELDS[field] / (1 - self.B + self.B * len(words) / average[field])
+                for word in words:
+                    weights[word] = weights.get(word, 0.0) + norm
+            for word, weight in weights.items():
+                # Saturation does not depend on the query, so postings hold the final term score
+                self.postings.setdefault(word, {})[exam_id] = weight * (self.K1 + 1) / (weight + self.K1)
+            for word in tokens["name"]:
+                self.name_postings.setdefault(word, set()).add(exam_id)
+
+        self.idf = {
+            word: math.log(1 + (len(fields) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for word, docs in self.postings.items()
+        }
+        self.name_vocabulary = sorted(self.name_postings)
+        self.trigram_index: Dict[str, List[str]] = {}
+        for word in self.postings:
+            for gram in trigrams(word):
+                self.trigram_index.setdefault(gram, []).append(word)
+
+    @staticmethod
+    def tokenize(text: Optional[str]) -> List[str]:
+        return [word for word in name_tokens(text) if word not in STOPWORDS]
+
+    def search(self, query: str, limit: int = 10, exam_type: Optional[str] = None) -> List[Tuple[object, float]]:
+        """Best matching exams with their scores, highest first"""
+        scores: Dict[int, float] = {}
+        for word in dict.fromkeys(self.tokenize(query)):
+            for term, similarity in self._expand(word):
+                idf = self.idf[term] * similarity
+                for exam_id, term_score in self.postings[term].items():
+                    scores[exam_id] = scores.get(exam_id, 0.0) + idf * term_score
+
+        if exam_type is not None:
+            scores = {exam_id: score for exam_id, score in scores.items() if self.exams[exam_id].exam_type == exam_type}
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.exams[exam_id], round(score, 4)) for exam_id, score in best]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[object]:
+        """
+        Exams whose name has every complete word of `prefix` and a word
+        starting with its last one, the most distinctive matches first
+        """
+        words = name_tokens(prefix)
+        if not words:
+            return []
+        *complete, last = words
+
+        candidates: Optional[Set[int]] = None
+        for word in complete:
+            docs = self.name_postings.get(word, set())
+            candidates = docs if candidates is None else candidates & docs
+            if not candidates:
+                return []
+
+        start = bisect.bisect_left(self.name_vocabulary, last)
+        scores: Dict[int, float] = {}
+        for term in self.name_vocabulary[start:start + self.PREFIX_EXPANSIONS]:
+            if not term.startswith(last):
+                break
+            for exam_id in self.name_postings[term]:
+                if candidates is None or exam_id in candidates:
+                    # An exact last word outranks a longer completion
+                    score = self.idf[term] * (2.0 if term == last else 1.0)
+                    scores[exam_id] = max(scores.get(exam_id, 0.0), score)
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.exams[exam_id] for exam_id, _ in best]
+
+    def _expand(self, word: str) -> List[Tuple[str, float]]:
+        """The word itself if indexed, else its closest vocabulary words by trigram similarity"""
+        if word in self.postings:
+            return [(word, 1.0)]
+
+        grams = trigrams(word)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for term in self.trigram_index.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+
+        similar = []
+        for term, common in shared.items():
+            similarity = common / (len(grams) + len(trigrams(term)) - common)
+            if similarity >= self.FUZZY_THRESHOLD:
+                similar.append((term, similarity))
+        return heapq.nlargest(self.FUZZY_EXPANSIONS, similar, key=lambda item: (item[1], item[0]))
+
+
+class ExamSearch:
+    """Search index over the exam catalog, rebuilt whenever a new catalog snapshot is loaded"""
+
+    def __init__(self):
+        self._index: Optional[SearchIndex] = None
+        self._source = None  # the catalog snapshot the index was built from
+        self._lock = threading.Lock()
+
+    def index(self, db: Session) -> SearchIndex:
+        snapshot = exam_catalog.snapshot(db)
+        if self._source is snapshot:
+            return self._index
+
+        with self._lock:
+            if self._source is not snapshot:
+                start = time.perf_counter()
+                self._index = SearchIndex(snapshot.exams, snapshot.version)
+                self._source = snapshot
+                logger.info(
+                    f"Exam search index v{snapshot.version} built over {len(self._index.exams)} exams "
+                    f"and {len(self._index.postings)} terms in {(time.perf_counter() - start) * 1000:.1f}ms"
+                )
+            return self._index
+
+    def search(self, db: Session, query: str, limit: int = 10, exam_type: Optional[str] = None) -> List[Tuple[object, float]]:
+        return self.index(db).search(query, limit, exam_type)
+
+    def autocomplete(self, db: Session, prefix: str, limit: int = 10) -> List[object]:
+        return self.index(db).autocomplete(prefix, limit)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._source = None
+
+
+exam_search = ExamSearch()
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import sessionmaker
 from models import Exam, Topic, Base
 from database import engine
+from listeners import install_listeners
 import json
 
 # Create session
@@ -166,4 +167,5 @@ def seed_exam_data():
     print("Exam knowledge base seeded successfully!")
 
 if __name__ == "__main__":
+    install_listeners(engine, SessionLocal)
     seed_exam_data()
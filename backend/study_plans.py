@@ -0,0 +1,233 @@
+"""
+Study plan persistence and incremental re-planning
+Keeps one active plan per user and exam, rescheduling only affected days
+"""
+import json
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from models import User, StudyPlan, load_json
+from ai_models import TopicPrioritizer, JointStudyPlanner
+from catalog import exam_catalog
+
+
+def find_replan_day(plan: Dict, topics: List[Dict], inputs: Dict, current_day: int) -> Optional[int]:
+    """
+    First day (>= current_day) whose schedule is affected by new topic
+    priorities or profile inputs, or None when the stored days still hold.
+
+    Within each subject, topics are studied in priority order, so a subject
+    is affected from the first position where the old and new order (or a
+    topic's estimated hours) differ. The plan diverges on the first remaining
+    day that studies any topic from that position onwards.
+    """
+    if plan["inputs"].get("study_hours_per_day") != inputs.get("study_hours_per_day"):
+        return current_day
+
+    old_orders = _subject_orders(plan["topics"])
+    new_orders = _subject_orders(topics)
+
+    affected = set()
+    for subject, old_order in old_orders.items():
+        new_order = new_orders.get(subject, [])
+        first_diff = next(
+            (i for i, (old, new) in enumerate(zip(old_order, new_order)) if old != new),
+            min(len(old_order), len(new_order))
+        )
+        affected.update(name for name, _ in old_order[first_diff:])
+        affected.update(name for name, _ in new_order[first_diff:])
+
+    # Subjects that only exist in the new topic list
+    for subject, new_order in new_orders.items():
+        if subject not in old_orders:
+            affected.update(name for name, _ in new_order)
+
+    if not affected:
+        return None
+
+    spare_day = None
+    for day in plan["days"][current_day - 1:]:
+        for session in day["sessions"]:
+            if session["type"] == "study" and session["topic"] in affected:
+                return day["day_number"]
+            if spare_day is None and session["type"] in ("practice", "mock_test"):
+                spare_day = day["day_number"]
+
+    # Affected topics were never scheduled; they can only move into spare capacity
+    if any(name in plan["unscheduled_topics"] or name not in _topic_names(plan["topics"]) for name in affected):
+        return spare_day
+    return None
+
+
+def _subject_orders(topics: List[Dict]) -> Dict[str, List]:
+    orders: Dict[str, List] = {}
+    for t in topics:
+        subject = t["topic"].get("subject") or "general"
+        orders.setdefault(subject, []).append((t["topic"]["name"], t["estimated_hours"]))
+    return orders
+
+
+def _topic_names(topics: List[Dict]) -> set:
+    return {t["topic"]["name"] for t in topics}
+
+
+class StudyPlanManager:
+    """
+    Keeps a single active study plan per user and exam.
+
+    Plans are stored in the structured form built by
+    `TopicPrioritizer.build_plan`. On each request the stored plan is diffed
+    against the user's current profile: an unchanged plan is returned as-is,
+    a changed one is rescheduled from the first affected day only, and the
+    previous row is deactivated.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.prioritizer = TopicPrioritizer(db)
+        self.joint_planner = JointStudyPlanner(db)
+
+    def get_or_update_plan(self, user_id: int, exam_code: str, days_available: int) -> Dict:
+        """Return the active plan for an exam, creating or re-planning it as needed"""
+        user = self.db.get(User, user_id)
+        exam = exam_catalog.snapshot(self.db).get_by_code(exam_code)
+
+        if not user or not exam:
+            return {"error": "User or exam not found"}
+
+        return self._get_or_update(
+            user, exam.id, exam.code, days_available,
+            prioritize=lambda profile, days: self.prioritizer.prioritize_topics(exam.id, profile, days),
+            build=lambda days, topics=None, history=None: self.prioritizer.build_plan(
+                user, exam, days, prioritized_topics=topics, history=history
+            )
+        )
+
+    def get_or_update_joint_plan(self, user_id: int, days_available: Optional[int] = None) -> Dict:
+        """
+        Return the active joint plan across the user's active_exams.
+
+        Joint plans are stored with no exam_id; changing the set of active
+        exams builds a fresh plan.
+        """
+        user = self.db.get(User, user_id)
+        if not user:
+            return {"error": "User not found"}
+
+        exams = self.joint_planner.load_exams(user.active_exams or [])
+        if not exams:
+            return {"error": "No active exams found"}
+
+        return self._get_or_update(
+            user, None, JointStudyPlanner.joint_code(exams), days_available,
+            prioritize=lambda profile, days: self.joint_planner.prioritize_joint_topics(exams, profile, days),
+            build=lambda days, topics=None, history=None: self.joint_planner.build_joint_plan(
+                user, exams, days, prioritized_topics=topics, history=history
+            ),
+            default_days=lambda: self.joint_planner.default_days(exams)
+        )
+
+    def _get_or_update(
+        self,
+        user: User,
+        exam_id: Optional[int],
+        exam_code: str,
+        days_available: Optional[int],
+        prioritize: Callable,
+        build: Callable,
+        default_days: Optional[Callable] = None
+    ) -> Dict:
+        active = self._active_plan(user.id, exam_id)
+        stored = load_json(active.plan_data) if active else None
+        if stored and stored.get("exam_code") != exam_code:
+            stored = None
+        today = datetime.utcnow().date()
+
+        if days_available is None and stored:
+            # Keep the stored plan's end date, or its length once it has run out
+            days_available = self._days_left(stored, today) or stored["total_days"]
+        elif days_available is None:
+            days_available = default_days()
+
+        if not self._reusable(stored, days_available, today):
+            plan = build(days_available)
+            plan["start_date"] = today.isoformat()
+            return self._save(user.id, exam_id, plan, "created")
+
+        # Stored plans are sized from their start date, not from today
+        days_available = stored["total_days"]
+        profile = load_json(user.preparation_profile, {})
+        topics = prioritize(profile, days_available)
+        inputs = TopicPrioritizer.plan_inputs(profile)
+        current_day = self._current_day(stored, today)
+
+        replan_day = find_replan_day(stored, topics, inputs, current_day)
+        if replan_day is None:
+            if stored["inputs"] != inputs or stored["topics"] != topics:
+                # Priorities moved but no remaining day changes
+                stored["inputs"] = inputs
+                stored["topics"] = topics
+                active.plan_data = json.dumps(stored)
+                self.db.commit()
+            return self._response(active, stored, "unchanged")
+
+        plan = build(days_available, topics=topics, history=stored["days"][:replan_day - 1])
+        plan["start_date"] = stored["start_date"]
+        plan["replanned_from_day"] = replan_day
+        return self._save(user.id, exam_id, plan, "replanned")
+
+    def _active_plan(self, user_id: int, exam_id: int) -> Optional[StudyPlan]:
+        return self.db.query(StudyPlan).filter(
+            StudyPlan.user_id == user_id,
+            StudyPlan.exam_id == exam_id,
+            StudyPlan.is_active == True  # noqa: E712
+        ).order_by(StudyPlan.created_at.desc(), StudyPlan.id.desc()).first()
+
+    def _reusable(self, stored: Optional[Dict], days_available: int, today) -> bool:
+        """
+        Whether a stored plan can be diffed rather than regenerated: it is
+        still running and ends on the same day as a plan of days_available
+        days starting today, so a client counting down to the exam keeps it.
+        """
+        if not stored or stored.get("version") != TopicPrioritizer.PLAN_VERSION:
+            return False
+        return self._days_left(stored, today) == days_available
+
+    @classmethod
+    def _days_left(cls, stored: Dict, today) -> int:
+        """Days of the stored plan from today to its last day, today included; 0 once it has run out"""
+        return max(0, stored["total_days"] - cls._current_day(stored, today) + 1)
+
+    @staticmethod
+    def _current_day(stored: Dict, today) -> int:
+        start = datetime.fromisoformat(stored["start_date"]).date()
+        return max(1, (today - start).days + 1)
+
+    def _save(self, user_id: int, exam_id: int, plan: Dict, status: str) -> Dict:
+        """Deactivate the previous active plan(s) and store the new one"""
+        self.db.query(StudyPlan).filter(
+            StudyPlan.user_id == user_id,
+            StudyPlan.exam_id == exam_id,
+            StudyPlan.is_active == True  # noqa: E712
+        ).update({StudyPlan.is_active: False}, synchronize_session=False)
+
+        study_plan = StudyPlan(
+            user_id=user_id,
+            exam_id=exam_id,
+            plan_data=json.dumps(plan),
+            is_active=True
+        )
+        self.db.add(study_plan)
+        self.db.commit()
+        return self._response(study_plan, plan, status)
+
+    @staticmethod
+    def _response(study_plan: StudyPlan, plan: Dict, status: str) -> Dict:
+        response = TopicPrioritizer.plan_response(plan)
+        response.update({
+            "plan_id": study_plan.id,
+            "plan_status": status,
+            "start_date": plan["start_date"],
+            "replanned_from_day": plan.get("replanned_from_day")
+        })
+        return response
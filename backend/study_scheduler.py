@@ -0,0 +1,208 @@
+"""
+Study scheduler for ExamSensei
+Packs prioritized topics into daily study slots with spaced revision
+"""
+import heapq
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class StudyScheduler:
+    """
+    Greedy day-by-day scheduler.
+
+    Each day is a knapsack of `hours_per_day` hours. Due revisions are
+    packed first (up to `revision_share` of the day), then study blocks are
+    taken round-robin across subjects so consecutive sittings switch subject.
+    Within a subject, topics are studied in priority order and long topics
+    are split across days. Once the syllabus is covered, spare capacity goes
+    to early revision, practice and weekly mock tests.
+    """
+
+    REVISION_INTERVALS = (1, 7, 21)  # days after a topic is completed
+    REVISION_SHARE = 0.25  # max share of a day spent on revision while topics remain
+    REVISION_FRACTION = 0.2  # revision length relative to the topic's study hours
+    MAX_BLOCK_HOURS = 3.0  # longest single sitting on one topic
+    MIN_BLOCK_HOURS = 0.5  # shortest sitting worth scheduling
+    MOCK_TEST_EVERY = 7  # days between mock tests once the syllabus is covered
+
+    _EPS = 1e-6
+
+    def __init__(
+        self,
+        hours_per_day: float = 6,
+        revision_intervals: Optional[Tuple[int, ...]] = None,
+        max_block_hours: float = MAX_BLOCK_HOURS
+    ):
+        self.hours_per_day = max(float(hours_per_day or 0), self.MIN_BLOCK_HOURS)
+        self.revision_intervals = tuple(revision_intervals or self.REVISION_INTERVALS)
+        self.max_block_hours = max(max_block_hours, self.MIN_BLOCK_HOURS)
+
+    def schedule(self, topics: List[Dict], total_days: int, history: Optional[List[Dict]] = None) -> Dict:
+        """
+        Schedule topics over `total_days` days.
+
+        `topics` must be sorted by priority (highest first); each entry needs
+        "name", "subject" and "hours", and may carry "difficulty" and
+        "weightage" which are copied onto the sessions.
+
+        `history` is an optional list of already-scheduled days to keep
+        verbatim; scheduling then resumes on the day after the last one,
+        crediting the hours and revisions those days already cover.
+        """
+        history = history or []
+        start_day = len(history) + 1
+        studied, completed_on, revised = self._replay(history, topics)
+
+        by_subject: Dict[str, deque] = {}
+        revisions: List[Tuple] = []  # heap of (due_day, seq, topic, hours, round)
+        seq = 0
+        for topic in topics:
+            hours = self._topic_hours(topic)
+            remaining = hours - studied.get(topic["name"], 0.0)
+            if remaining > self._EPS and topic["name"] not in completed_on:
+                subject = topic.get("subject") or "general"
+                by_subject.setdefault(subject, deque()).append([topic, remaining])
+                continue
+
+            # Topic finished in history: queue whatever revision rounds are left
+            done_day = completed_on.get(topic["name"], start_day - 1)
+            rev_hours = self._revision_hours(hours)
+            for rev_round, interval in enumerate(self.revision_intervals, 1):
+                if rev_round > revised.get(topic["name"], 0):
+                    seq += 1
+                    heapq.heappush(revisions, (done_day + interval, seq, topic, rev_hours, rev_round))
+
+        # Subjects rotate in the order of their best topic
+        rotation = deque(by_subject.keys())
+        days = list(history)
+        for day in range(start_day, total_days + 1):
+            capacity = self.hours_per_day
+            sessions = []
+
+            # 1. Due revisions, capped while there is still syllabus to cover
+            revision_budget = capacity * self.REVISION_SHARE if rotation else capacity
+            while revisions and revisions[0][0] <= day and revision_budget >= self.MIN_BLOCK_HOURS:
+                _, _, topic, hours, rev_round = revisions[0]
+                if hours > revision_budget + self._EPS:
+                    break
+                heapq.heappop(revisions)
+                sessions.append(self._session(topic, "revision", hours, revision_round=rev_round))
+                revision_budget -= hours
+                capacity -= hours
+
+            # 2. Study blocks, interleaving subjects
+            while rotation and capacity >= self.MIN_BLOCK_HOURS - self._EPS:
+                subject = rotation.popleft()
+                queue = by_subject[subject]
+                entry = queue[0]
+                block = min(entry[1], capacity, self.max_block_hours)
+                sessions.append(self._session(entry[0], "study", block))
+                entry[1] -= block
+                capacity -= block
+
+                if entry[1] <= self._EPS:
+                    queue.popleft()
+                    rev_hours = self._revision_hours(self._topic_hours(entry[0]))
+                    for rev_round, interval in enumerate(self.revision_intervals, 1):
+                        seq += 1
+                        heapq.heappush(revisions, (day + interval, seq, entry[0], rev_hours, rev_round))
+
+                if queue:
+                    rotation.append(subject)
+
+            # 3. Syllabus covered: pull revisions forward, then practice
+            if not rotation:
+                while revisions and capacity >= revisions[0][3] - self._EPS:
+                    _, _, topic, hours, rev_round = heapq.heappop(revisions)
+                    sessions.append(self._session(topic, "revision", hours, revision_round=rev_round))
+                    capacity -= hours
+
+                if capacity >= self.MIN_BLOCK_HOURS - self._EPS:
+                    if day % self.MOCK_TEST_EVERY == 0:
+                        sessions.append({"topic": "Full-length mock test", "type": "mock_test",
+                                         "hours": round(capacity, 2)})
+                    elif topics:
+                        topic = topics[(day - 1) % len(topics)]
+                        sessions.append(self._session(topic, "practice", capacity))
+                    capacity = 0
+
+            week = (day - 1) // 7 + 1
+            days.append({
+                "day": f"Week {week}, Day {(day - 1) % 7 + 1}",
+                "day_number": day,
+                "sessions": sessions,
+                "total_hours": round(self.hours_per_day - capacity, 2)
+            })
+
+        unscheduled = [entry[0]["name"] for queue in by_subject.values() for entry in queue]
+
+        return {
+            "days": days,
+            "unscheduled_topics": unscheduled,
+            "stats": self._stats(days, len(topics), len(unscheduled))
+        }
+
+    @staticmethod
+    def to_weekly_plan(days: List[Dict]) -> Dict:
+        """Group scheduled days into {"week_N": [days]}"""
+        plan = {}
+        for day in days:
+            week = (day["day_number"] - 1) // 7 + 1
+            plan.setdefault(f"week_{week}", []).append(day)
+        return plan
+
+    def _replay(self, history: List[Dict], topics: List[Dict]) -> Tuple[Dict, Dict, Dict]:
+        """Hours studied, completion day and revision rounds done per topic in `history`"""
+        hours = {topic["name"]: self._topic_hours(topic) for topic in topics}
+        studied: Dict[str, float] = {}
+        completed_on: Dict[str, int] = {}
+        revised: Dict[str, int] = {}
+
+        for day in history:
+            for session in day["sessions"]:
+                name = session["topic"]
+                if session["type"] == "study":
+                    studied[name] = studied.get(name, 0.0) + session["hours"]
+                    if name in hours and name not in completed_on and studied[name] >= hours[name] - self._EPS:
+                        completed_on[name] = day["day_number"]
+                elif session["type"] == "revision":
+                    revised[name] = revised.get(name, 0) + 1
+
+        return studied, completed_on, revised
+
+    @staticmethod
+    def _stats(days: List[Dict], topics_total: int, unscheduled: int) -> Dict:
+        totals = {"study": 0.0, "revision": 0.0, "practice": 0.0, "mock_test": 0.0}
+        for day in days:
+            for session in day["sessions"]:
+                totals[session["type"]] += session["hours"]
+
+        return {
+            "topics_total": topics_total,
+            "topics_completed": topics_total - unscheduled,
+            "study_hours": round(totals["study"], 2),
+            "revision_hours": round(totals["revision"], 2),
+            "practice_hours": round(totals["practice"] + totals["mock_test"], 2)
+        }
+
+    def _topic_hours(self, topic: Dict) -> float:
+        return max(float(topic.get("hours") or 0), self.MIN_BLOCK_HOURS)
+
+    def _revision_hours(self, study_hours: float) -> float:
+        hours = max(study_hours * self.REVISION_FRACTION, self.MIN_BLOCK_HOURS)
+        return round(min(hours, self.hours_per_day * self.REVISION_SHARE, self.max_block_hours), 2)
+
+    @staticmethod
+    def _session(topic: Dict, session_type: str, hours: float, **extra) -> Dict:
+        session = {
+            "topic": topic["name"],
+            "subject": topic.get("subject"),
+            "type": session_type,
+            "hours": round(hours, 2),
+            "difficulty": topic.get("difficulty")
+        }
+        if session_type == "study" and topic.get("weightage") is not None:
+            session["focus_area"] = f"High-weightage ({topic['weightage']}%)"
+        session.update(extra)
+        return session
@@ -1,16 +1,30 @@
 """
 Pytest configuration and fixtures for ExamSensei tests
 """
+import os
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+# Keep the suite's log files out of the source tree; must be set before config is imported
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="examsensei-logs-"), "examsensei.log"))
+
 from models import Base
 from database import get_db
+from listeners import install_listeners
+from config import settings
 from app_v2 import app
-from auth import get_password_hash
+from auth import get_password_hash, principal_cache
+from revocation import revocation_store
+from catalog import exam_catalog
+from search import exam_search
+
+
+# Every request must stay within its endpoint's query budget and repeat no statement in a loop
+settings.query_checks = "raise"
 
 
 # Test database setup
@@ -22,6 +36,7 @@ engine = create_engine(
     poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+install_listeners(engine, TestingSessionLocal)
 
 
 @pytest.fixture(scope="function")
@@ -33,6 +48,10 @@ def db_session():
         yield session
     finally:
         session.close()
+        principal_cache.clear()
+        revocation_store.clear()
+        exam_catalog.clear()
+        exam_search.clear()
         Base.metadata.drop_all(bind=engine)
 
 
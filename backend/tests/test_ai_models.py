@@ -93,3 +93,138 @@ def test_exam_clash_detector(db_session):
     assert clashes["has_clashes"] is True
     assert len(clashes["clashes"]) > 0
     assert "2025-01-15" in clashes["clashes"][0]["conflicting_dates"]
+
+
+def _joint_exam(db_session, code, exam_date, topics):
+    """Create an exam with (subject, name, correlation_topics) topics"""
+    from models import Exam, Topic
+    import json
+
+    exam = Exam(
+        name=code.upper(),
+        code=code,
+        body="NTA",
+        exam_type="entrance",
+        important_dates=json.dumps({"exam_dates": [exam_date]})
+    )
+    db_session.add(exam)
+    db_session.commit()
+    for subject, name, correlated in topics:
+        db_session.add(Topic(
+            exam_id=exam.id,
+            subject=subject,
+            name=name,
+            weightage_history=json.dumps([10]),
+            avg_questions=4,
+            difficulty_distribution=json.dumps({"hard": 15}),
+            correlation_topics=json.dumps(correlated)
+        ))
+    db_session.commit()
+    return exam
+
+
+def test_joint_planner_merges_shared_topics(db_session, test_user):
+    """Topics shared or correlated across exams are scheduled once"""
+    from ai_models import JointStudyPlanner
+    from datetime import datetime, timedelta
+
+    soon = (datetime.utcnow() + timedelta(days=30)).date().isoformat()
+    later = (datetime.utcnow() + timedelta(days=120)).date().isoformat()
+    _joint_exam(db_session, "jee_main", soon, [
+        ("physics", "mechanics", []),
+        ("mathematics", "calculus", ["differential_calculus"]),
+        ("chemistry", "organic_chemistry", []),
+    ])
+    _joint_exam(db_session, "bitsat", later, [
+        ("physics", "mechanics", []),
+        ("mathematics", "differential_calculus", []),
+        ("english", "grammar", []),
+    ])
+    test_user.active_exams = ["jee_main", "bitsat"]
+    db_session.commit()
+
+    plan = JointStudyPlanner(db_session).generate_joint_plan(test_user.id, 60)
+
+    names = [t["topic"]["name"] for t in plan["prioritized_topics"]]
+    assert sorted(names) == ["calculus", "grammar", "mechanics", "organic_chemistry"]
+    assert plan["exam_codes"] == ["jee_main", "bitsat"]
+
+    by_name = {t["topic"]["name"]: t for t in plan["prioritized_topics"]}
+    assert by_name["mechanics"]["exams"] == ["bitsat", "jee_main"]
+    assert by_name["calculus"]["merged_topics"] == ["differential_calculus"]
+    # Nearer exam outweighs the later one
+    assert by_name["organic_chemistry"]["priority_score"] > by_name["grammar"]["priority_score"]
+
+    studied = [
+        s["topic"] for week in plan["weekly_plan"].values() for day in week
+        for s in day["sessions"] if s["type"] == "study"
+    ]
+    assert "differential_calculus" not in studied
+
+
+def test_joint_planner_pairs_correlated_topics_once(db_session, test_user):
+    """Two topics of one exam correlated with the same topic elsewhere are not merged together"""
+    from ai_models import JointStudyPlanner
+    from datetime import datetime, timedelta
+
+    soon = (datetime.utcnow() + timedelta(days=30)).date().isoformat()
+    later = (datetime.utcnow() + timedelta(days=120)).date().isoformat()
+    _joint_exam(db_session, "exam_a", soon, [
+        ("physics", "kinematics", ["mechanics"]),
+        ("physics", "dynamics", ["mechanics"]),
+        ("physics", "optics", ["waves"]),
+    ])
+    _joint_exam(db_session, "exam_b", later, [
+        ("physics", "mechanics", ["kinematics", "dynamics"]),
+        ("physics", "waves", ["optics", "electrostatics"]),
+        ("physics", "electrostatics", []),
+    ])
+    test_user.active_exams = ["exam_a", "exam_b"]
+    db_session.commit()
+
+    topics = JointStudyPlanner(db_session).generate_joint_plan(test_user.id, 60)["prioritized_topics"]
+    groups = [sorted([t["topic"]["name"], *t["merged_topics"]]) for t in topics]
+
+    # mechanics pairs with one of kinematics/dynamics; the other stays on its own with full hours
+    assert sum("mechanics" in group for group in groups) == 1
+    assert not any({"kinematics", "dynamics"} <= set(group) for group in groups)
+    assert ["dynamics"] in groups or ["kinematics"] in groups
+    assert all(len(group) <= 2 for group in groups)
+    assert sorted(name for group in groups for name in group) == sorted(
+        ["kinematics", "dynamics", "optics", "mechanics", "waves", "electrostatics"]
+    )
+
+
+def test_clash_detector_mixed_formats_and_near_clashes(db_session):
+    """Clashes are found across date formats, and back-to-back exams are near-clashes"""
+    from models import Exam
+    import json
+
+    db_session.add_all([
+        Exam(name="A", code="exam_a", body="NTA", exam_type="entrance",
+             important_dates=json.dumps({"exam_dates": ["24-31 Jan 2025"]})),
+        Exam(name="B", code="exam_b", body="NTA", exam_type="entrance",
+             important_dates=json.dumps({"exam_dates": [["31/01/2025"]]})),
+        Exam(name="C", code="exam_c", body="UPSC", exam_type="entrance",
+             important_dates=json.dumps({"exam_dates": ["February 1, 2025"]})),
+        Exam(name="D", code="exam_d", body="SSC", exam_type="entrance",
+             important_dates=json.dumps({"exam_dates": ["2025-03-10"]})),
+    ])
+    db_session.commit()
+
+    result = ExamClashDetector().detect_clashes(["exam_a", "exam_b", "exam_c", "exam_d"], db_session)
+    clashes = {tuple(c["exams"]): c for c in result["clashes"]}
+
+    assert clashes[("exam_a", "exam_b")]["conflicting_dates"] == ["2025-01-31"]
+    assert clashes[("exam_a", "exam_c")]["type"] == "near_clash"
+    assert clashes[("exam_a", "exam_c")]["days_apart"] == 1
+    assert clashes[("exam_b", "exam_c")]["type"] == "near_clash"
+    assert not any("exam_d" in pair for pair in clashes)
+
+    # Wider near-clash window and the precomputed catalog graph agree
+    wide = ExamClashDetector(near_clash_days=40)
+    graph_mode = ExamClashDetector(near_clash_days=40, use_global_graph=True)
+    local = wide.detect_clashes(["exam_a", "exam_d"], db_session)["clashes"]
+    cached = graph_mode.detect_clashes(["exam_a", "exam_d"], db_session)["clashes"]
+    assert local == cached
+    assert local[0]["days_apart"] == 38
@@ -94,3 +94,225 @@ def test_get_current_user_unauthorized(client):
     response = client.get("/api/v1/auth/me")
     
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_login_rehashes_outdated_password_hash(client, db_session, test_user):
+    """A hash made with a different bcrypt cost is replaced on login"""
+    from passlib.context import CryptContext
+
+    test_user.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpassword123")
+    db_session.commit()
+
+    response = client.post(
+        "/api/v1/auth/login",
+        data={"username": "test@example.com", "password": "testpassword123"}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    db_session.refresh(test_user)
+    assert not test_user.hashed_password.startswith("$2b$04$")
+
+
+def test_password_hashing_rejects_when_saturated():
+    """Beyond max_pending, hashing fails fast with a 503"""
+    import asyncio
+    from fastapi import HTTPException
+    from auth import PasswordHasher
+
+    hasher = PasswordHasher(workers=1, max_pending=2)
+
+    async def storm():
+        return await asyncio.gather(*(hasher.hash("password") for _ in range(6)), return_exceptions=True)
+
+    results = asyncio.run(storm())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+
+    assert len(rejected) == 4
+    assert all(r.status_code == status.HTTP_503_SERVICE_UNAVAILABLE for r in rejected)
+    assert hasher.pending == 0
+
+
+@pytest.fixture
+def user_queries(db_session):
+    """SELECTs on the users table issued during the test"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(db_session.get_bind(), "before_cursor_execute", record)
+    yield statements
+    event.remove(db_session.get_bind(), "before_cursor_execute", record)
+
+
+def test_cached_principal_skips_user_query(client, db_session, auth_headers, test_user, user_queries):
+    """After the first request the user is served from the principal cache"""
+    assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == status.HTTP_200_OK
+
+    db_session.expunge_all()
+    user_queries.clear()
+    response = client.get(f"/api/v1/users/{test_user.id}", headers=auth_headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["email"] == test_user.email
+    assert user_queries == []
+
+
+def test_profile_update_invalidates_principal(client, db_session, auth_headers, test_user):
+    """Profile changes are visible to the next request"""
+    from auth import principal_cache
+
+    client.get("/api/v1/auth/me", headers=auth_headers)
+    response = client.put(
+        f"/api/v1/users/{test_user.id}/profile", headers=auth_headers, json={"study_hours": 6}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert principal_cache._get_local(test_user.id, 0) is None
+
+
+def test_lifecycle_writes_invalidate_principal(client, db_session, auth_headers, test_user):
+    """Stage and profile changes made outside the API also drop the cached user"""
+    from auth import principal_cache
+    from lifecycle import LifecycleStateMachine
+
+    machine = LifecycleStateMachine(db_session)
+    for change in (
+        lambda: machine.progress_user_stage(test_user.id, "class_12_completed"),
+        lambda: machine.update_user_profile(test_user.id, {"study_hours": 5}),
+    ):
+        client.get("/api/v1/auth/me", headers=auth_headers)
+        assert principal_cache._get_local(test_user.id, 0) is not None
+        change()
+        assert principal_cache._get_local(test_user.id, 0) is None
+
+    response = client.get("/api/v1/auth/me", headers=auth_headers)
+    assert response.json()["current_stage"] == "class_12_completed"
+
+
+def test_logins_keep_principal_and_changes_delete_exact_keys(client, db_session, auth_headers, test_user, monkeypatch):
+    """last_login writes leave the cached user alone; real changes delete only that user's keys"""
+    from auth import principal_cache
+    import auth
+
+    deleted, scanned = [], []
+    monkeypatch.setattr(auth.cache, "delete", lambda key: deleted.append(key))
+    monkeypatch.setattr(auth.cache, "clear_pattern", lambda pattern: scanned.append(pattern))
+
+    client.get("/api/v1/auth/me", headers=auth_headers)
+    response = client.post("/api/v1/auth/login", data={"username": "test@example.com", "password": "testpassword123"})
+    assert response.status_code == status.HTTP_200_OK
+    assert principal_cache._get_local(test_user.id, 0) is not None
+    assert deleted == []
+
+    test_user.name = "Renamed"
+    db_session.commit()
+    assert principal_cache._get_local(test_user.id, 0) is None
+    assert deleted == [f"principal:{test_user.id}:0"]
+    assert scanned == []
+
+
+def test_revoked_tokens_are_rejected(client, db_session, auth_headers, test_user):
+    """Bumping the token version invalidates tokens issued before it"""
+    from auth import revoke_user_tokens
+
+    client.get("/api/v1/auth/me", headers=auth_headers)
+    revoke_user_tokens(test_user)
+    db_session.commit()
+
+    response = client.get("/api/v1/auth/me", headers=auth_headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_inactive_user_is_rejected(client, db_session, auth_headers, test_user):
+    """Deactivated accounts cannot use their tokens"""
+    from auth import revoke_user_tokens
+
+    test_user.is_active = False
+    revoke_user_tokens(test_user)
+    db_session.commit()
+
+    response = client.post(
+        "/api/v1/auth/login",
+        data={"username": "test@example.com", "password": "testpassword123"}
+    )
+    token = response.json()["access_token"]
+    response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def login_tokens(client):
+    response = client.post(
+        "/api/v1/auth/login",
+        data={"username": "test@example.com", "password": "testpassword123"}
+    )
+    return response.json()
+
+
+def test_refresh_rotates_tokens(client, test_user):
+    """A refresh token can be used once and yields a working new pair"""
+    tokens = login_tokens(client)
+
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_200_OK
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+
+    me = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.status_code == status.HTTP_200_OK
+
+    # An access token is not a refresh token
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": rotated["access_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_token_reuse_revokes_everything(client, test_user):
+    """Replaying a rotated refresh token signs the user out everywhere"""
+    tokens = login_tokens(client)
+    rotated = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    replay = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert replay.status_code == status.HTTP_401_UNAUTHORIZED
+
+    me = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_logout_revokes_tokens(client, test_user):
+    """After logout neither the access nor the refresh token works"""
+    tokens = login_tokens(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.post("/api/v1/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_200_OK
+
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_revocation_filter_has_no_false_negatives():
+    """Every revoked id is reported; unrevoked ids rarely reach the exact check"""
+    import time
+    from revocation import RevocationStore
+
+    store = RevocationStore(capacity=1000)
+    revoked = [f"revoked-{i}" for i in range(500)]
+    for jti in revoked:
+        store.revoke(jti, time.time() + 60)
+
+    assert all(store.is_revoked(jti) for jti in revoked)
+    others = [f"valid-{i}" for i in range(5000)]
+    assert not any(store.is_revoked(jti) for jti in others)
+    assert sum(jti in store.filter for jti in others) < 5000 * 0.03
+
+    # Past capacity the filter is rebuilt larger without losing entries
+    for i in range(1000):
+        store.revoke(f"more-{i}", time.time() + 60)
+    assert store.capacity >= 1500
+    assert all(store.is_revoked(jti) for jti in revoked)
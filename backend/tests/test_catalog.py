@@ -0,0 +1,80 @@
+"""
+Tests for the in-memory exam catalog
+"""
+import pytest
+from models import Exam
+from catalog import CatalogSnapshot, exam_catalog
+from tracing import start_trace, end_trace
+
+
+@pytest.fixture
+def exams(db_session):
+    db_session.add_all([
+        Exam(name="JEE Main 2025", code="jee_main", body="NTA", exam_type="entrance"),
+        Exam(name="JEE Advanced 2025", code="jee_advanced", body="IIT", exam_type="entrance"),
+        Exam(name="SSC CGL 2025", code="ssc_cgl", body="SSC", exam_type="government_job"),
+    ])
+    db_session.commit()
+
+
+def test_snapshot_indexes(db_session, exams):
+    """Lookups by id, code, body, type and name are dictionary reads"""
+    snapshot = exam_catalog.snapshot(db_session)
+
+    jee = snapshot.get_by_code("jee_main")
+    assert snapshot.get(jee.id) is jee
+    assert [e.code for e in snapshot.get_many(["ssc_cgl", "missing", "jee_main", "ssc_cgl"])] == ["ssc_cgl", "jee_main"]
+    assert [e.code for e in snapshot.filter(exam_type="entrance")] == ["jee_main", "jee_advanced"]
+    assert [e.code for e in snapshot.by_body["SSC"]] == ["ssc_cgl"]
+    assert snapshot.find_by_name("jee advanced").code == "jee_advanced"
+    assert snapshot.find_by_name("JEE").code == "jee_main"
+    assert snapshot.find_by_name("main 20").code == "jee_main"  # partial words still match
+    assert snapshot.find_by_name("gate") is None
+
+
+def test_entries_are_read_only(db_session, exams):
+    exam = exam_catalog.snapshot(db_session).get_by_code("jee_main")
+    with pytest.raises(AttributeError):
+        exam.name = "changed"
+
+
+def test_loaded_catalog_needs_no_queries(db_session, exams):
+    exam_catalog.snapshot(db_session)
+
+    trace, token = start_trace()
+    try:
+        exam_catalog.snapshot(db_session).get_by_code("jee_main")
+    finally:
+        end_trace(token)
+    assert trace.query_count == 0
+
+
+def test_committed_exam_changes_reload_the_snapshot(db_session, exams):
+    """Committing an exam bumps the version; the old snapshot object is left untouched"""
+    before = exam_catalog.snapshot(db_session)
+
+    exam = db_session.query(Exam).filter(Exam.code == "ssc_cgl").one()
+    exam.name = "SSC CGL 2026"
+    db_session.commit()
+
+    after = exam_catalog.snapshot(db_session)
+    assert after is not before
+    assert after.version > before.version
+    assert after.get_by_code("ssc_cgl").name == "SSC CGL 2026"
+    assert before.get_by_code("ssc_cgl").name == "SSC CGL 2025"
+
+
+def test_rolled_back_changes_keep_the_snapshot(db_session, exams):
+    before = exam_catalog.snapshot(db_session)
+
+    db_session.add(Exam(name="CAT", code="cat", body="IIM", exam_type="management"))
+    db_session.flush()
+    db_session.rollback()
+
+    assert exam_catalog.snapshot(db_session) is before
+
+
+def test_empty_snapshot():
+    snapshot = CatalogSnapshot([], version=0)
+    assert snapshot.find_by_name("jee") is None
+    assert snapshot.filter(exam_type="entrance") == ()
@@ -0,0 +1,57 @@
+"""
+Tests for exam date parsing
+"""
+from datetime import date
+from exam_dates import parse_date_range, parse_date_ranges, exam_date_ranges, exam_events
+
+
+def test_parse_common_formats():
+    """ISO, day-first numeric and written-out dates all parse"""
+    jan_24 = (date(2025, 1, 24), date(2025, 1, 24))
+    assert parse_date_range("2025-01-24") == jan_24
+    assert parse_date_range("24-01-2025") == jan_24
+    assert parse_date_range("24/01/2025") == jan_24
+    assert parse_date_range("24 Jan 2025") == jan_24
+    assert parse_date_range("January 24, 2025") == jan_24
+    assert parse_date_range("To be announced") is None
+
+
+def test_parse_ranges():
+    """Day spans and explicit ranges become inclusive ranges"""
+    assert parse_date_range("24-31 Jan 2025") == (date(2025, 1, 24), date(2025, 1, 31))
+    assert parse_date_range("24 Jan - 2 Feb 2025") == (date(2025, 1, 24), date(2025, 2, 2))
+    assert parse_date_range("2025-01-24 to 2025-01-31") == (date(2025, 1, 24), date(2025, 1, 31))
+
+
+def test_nested_lists_are_merged():
+    """Nested lists flatten and consecutive days merge into one range"""
+    ranges = parse_date_ranges([["2025-01-24", "2025-01-25"], "2025-01-26", ["2025-02-10"]])
+    assert ranges == [(date(2025, 1, 24), date(2025, 1, 26)), (date(2025, 2, 10), date(2025, 2, 10))]
+
+
+def test_exam_date_ranges_reads_json_strings():
+    """important_dates stored as a JSON string is decoded"""
+    assert exam_date_ranges('{"exam_dates": ["2025-05-04"]}') == [(date(2025, 5, 4), date(2025, 5, 4))]
+    assert exam_date_ranges(None) == []
+
+
+def test_exam_events():
+    """Start/end pairs become one range; other keys are events of their own"""
+    events = exam_events({
+        "notification": "2024-11-01",
+        "application_start": "2024-11-01",
+        "application_end": "2024-11-30",
+        "exam_dates": [["2025-01-24", "2025-01-25"], "2025-01-29"],
+        "result": "To be announced",
+        "last_updated": "2024-11-02T10:00:00"
+    })
+    assert events == [
+        ("application", date(2024, 11, 1), date(2024, 11, 30)),
+        ("notification", date(2024, 11, 1), date(2024, 11, 1)),
+        ("exam", date(2025, 1, 24), date(2025, 1, 25)),
+        ("exam", date(2025, 1, 29), date(2025, 1, 29)),
+    ]
+    assert exam_events('{"exam_date": "2025-05-04", "admit_card_end": "2025-05-01"}') == [
+        ("admit_card", date(2025, 5, 1), date(2025, 5, 1)),
+        ("exam", date(2025, 5, 4), date(2025, 5, 4)),
+    ]
@@ -0,0 +1,96 @@
+"""
+Tests for the exam timeline
+"""
+import json
+from datetime import date
+from models import Exam, ExamEvent
+from exam_events import upcoming_events, backfill_exam_events
+
+
+def add_exam(db_session, code, **dates):
+    exam = Exam(name=code.upper(), code=code, body="NTA", exam_type="entrance", important_dates=json.dumps(dates))
+    db_session.add(exam)
+    db_session.commit()
+    return exam
+
+
+def event_rows(db_session, exam_id):
+    return [
+        (e.event_type, e.start_date.isoformat())
+        for e in db_session.query(ExamEvent).filter(ExamEvent.exam_id == exam_id).order_by(ExamEvent.start_date)
+    ]
+
+
+def test_events_follow_important_dates(db_session):
+    """Inserting, changing and deleting an exam keeps its events in step"""
+    exam = add_exam(db_session, "jee", exam_dates=["2025-01-24"], result="2025-02-12")
+    assert event_rows(db_session, exam.id) == [("exam", "2025-01-24"), ("result", "2025-02-12")]
+
+    exam.important_dates = json.dumps({"exam_dates": ["2025-04-02"]})
+    db_session.commit()
+    assert event_rows(db_session, exam.id) == [("exam", "2025-04-02")]
+
+    # Writes that leave the dates alone don't touch the events
+    first_id = db_session.query(ExamEvent.id).scalar()
+    exam.name = "JEE Main"
+    db_session.commit()
+    assert db_session.query(ExamEvent.id).scalar() == first_id
+
+    db_session.delete(exam)
+    db_session.commit()
+    assert db_session.query(ExamEvent).count() == 0
+
+
+def test_keyset_paging(db_session):
+    """Pages continue exactly after the cursor, ties on a date broken by id"""
+    for i in range(5):
+        add_exam(db_session, f"exam_{i}", exam_dates=["2025-03-01"], result=f"2025-03-0{i + 2}")
+
+    seen, cursor = [], None
+    while True:
+        events, cursor = upcoming_events(db_session, date(2025, 1, 1), limit=3, after=cursor)
+        seen.extend((e.end_date, e.id) for e in events)
+        if cursor is None:
+            break
+    assert len(seen) == 10
+    assert seen == sorted(seen)
+
+    results, _ = upcoming_events(db_session, date(2025, 3, 3), event_type="result", until=date(2025, 3, 4))
+    assert [e.start_date for e in results] == [date(2025, 3, 3), date(2025, 3, 4)]
+
+
+def test_open_ranges_stay_upcoming_until_they_end(db_session):
+    """An application window that opened before `since` is listed until its deadline"""
+    add_exam(db_session, "cuet", application_start="2025-02-20", application_end="2025-03-20", exam_date="2025-05-13")
+
+    events, _ = upcoming_events(db_session, date(2025, 3, 10))
+    assert [(e.event_type, e.start_date, e.end_date) for e in events] == [
+        ("application", date(2025, 2, 20), date(2025, 3, 20)), ("exam", date(2025, 5, 13), date(2025, 5, 13))
+    ]
+    events, _ = upcoming_events(db_session, date(2025, 3, 21))
+    assert [e.event_type for e in events] == ["exam"]
+
+
+def test_backfill(db_session):
+    exam_id = add_exam(db_session, "neet", exam_date="2025-05-04").id
+    db_session.query(ExamEvent).delete()
+    db_session.commit()
+
+    assert backfill_exam_events(db_session) == {"exams": 1, "events": 1}
+    assert event_rows(db_session, exam_id) == [("exam", "2025-05-04")]
+
+
+def test_upcoming_endpoint(client, db_session, test_exam):
+    response = client.get("/api/v1/exams/upcoming", params={"since": "2025-01-01", "limit": 1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["events"] == [{
+        "exam_id": test_exam.id, "exam_code": "jee_main_2025", "exam_name": "JEE Main 2025",
+        "event_type": "exam", "start_date": "2025-01-24", "end_date": "2025-01-25"
+    }]
+
+    response = client.get("/api/v1/exams/upcoming", params={"since": "2025-01-01", "cursor": body["next_cursor"]})
+    assert [e["event_type"] for e in response.json()["events"]] == ["result"]
+    assert response.json()["next_cursor"] is None
+
+    assert client.get("/api/v1/exams/upcoming", params={"cursor": "soon"}).status_code == 400
@@ -0,0 +1,67 @@
+"""
+Tests for sharded, resumable batch jobs
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+from models import User, Notification, JobLease
+from jobs import ShardedJobRunner
+
+
+@pytest.fixture
+def runner(db_session):
+    return ShardedJobRunner("daily_checks", session_factory=sessionmaker(bind=db_session.get_bind()))
+
+
+@pytest.fixture
+def users(db_session):
+    past = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    db_session.add_all([
+        User(email=f"student{i}@example.com", hashed_password="x", current_stage="class_12_started",
+             milestone_triggers=json.dumps({"board_exam_date": past}))
+        for i in range(20)
+    ])
+    db_session.commit()
+
+
+def test_run_covers_every_shard(db_session, runner, users):
+    """Each user is processed exactly once across shards"""
+    progress = runner.run(run_id="run-1", shards=3, workers=1)
+
+    assert progress["shards"] == 3
+    assert progress["done"] == 3
+    assert progress["users"] == 20
+    assert progress["progressed"] == 20
+    assert db_session.query(Notification).count() == 20
+
+
+def test_crashed_shard_resumes_from_checkpoint(db_session, runner, users):
+    """An expired lease is reclaimed and continues after the last checkpoint"""
+    runner.plan("run-2", 2)
+    lease = db_session.query(JobLease).filter(JobLease.shard == 0).one()
+    lease.status = "running"
+    lease.owner = "dead-worker"
+    lease.lease_expires_at = datetime.utcnow() - timedelta(minutes=1)
+    lease.checkpoint_id = lease.start_id + 4
+    db_session.commit()
+
+    progress = runner.run(run_id="run-2", workers=1)
+
+    assert progress["done"] == 2
+    assert progress["users"] == 16  # four users were before the checkpoint
+    reclaimed = db_session.query(JobLease).filter(JobLease.shard == 0).one()
+    db_session.refresh(reclaimed)
+    assert reclaimed.attempts == 1
+
+
+def test_live_lease_is_not_claimed_twice(db_session, runner, users):
+    """Workers never hold the same shard"""
+    runner.plan("run-3", 2)
+    first = runner.claim(db_session, "run-3", "worker-a")
+    second = runner.claim(db_session, "run-3", "worker-b")
+    third = runner.claim(db_session, "run-3", "worker-c")
+
+    assert {first.shard, second.shard} == {0, 1}
+    assert third is None
+    assert runner.plan("run-3", 5) == 2
@@ -0,0 +1,182 @@
+"""
+Tests for lifecycle daily checks and milestone reminders
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from models import User, Notification, UserActivity, MilestoneTrigger
+from lifecycle import LifecycleStateMachine, MilestoneScheduler
+
+
+@pytest.fixture
+def machine(db_session):
+    return LifecycleStateMachine(db_session)
+
+
+def add_users(db_session, count, **fields):
+    for i in range(count):
+        db_session.add(User(email=f"student{i}@example.com", hashed_password="x", **fields))
+    db_session.commit()
+
+
+def test_daily_checks_page_through_users(db_session, machine):
+    """Every user is visited once across batches"""
+    add_users(db_session, 25, current_stage="class_11_started")
+
+    stats = machine.run_daily_checks(batch_size=10)
+
+    assert stats["users"] == 25
+    assert stats["batches"] == 3
+    assert stats["progressed"] == 0
+    assert stats["users_per_second"] > 0
+
+
+def test_stage_change_schedules_milestones(db_session, machine, test_user):
+    """Progressing writes one time-indexed trigger per milestone, fired a week early"""
+    machine.progress_user_stage(test_user.id, "class_12_completed")
+
+    triggers = db_session.query(MilestoneTrigger).filter(MilestoneTrigger.user_id == test_user.id).all()
+    assert {t.name for t in triggers} == {
+        "jee_application_start", "neet_application_start", "jee_exam_date", "neet_exam_date"
+    }
+    assert all(t.trigger_date - t.fire_at == timedelta(days=7) for t in triggers)
+
+    # Re-entering the stage moves the dates and re-arms the triggers without duplicating them
+    machine.progress_user_stage(test_user.id, "class_12_completed")
+    assert db_session.query(MilestoneTrigger).count() == 4
+
+
+def test_scheduler_fires_only_due_triggers(db_session, test_user):
+    """Only triggers past their fire time are sent, each exactly once"""
+    now = datetime.utcnow()
+    for name, days in [("jee_exam_date", 3), ("neet_exam_date", 30)]:
+        db_session.add(MilestoneTrigger(
+            user_id=test_user.id, name=name,
+            trigger_date=now + timedelta(days=days),
+            fire_at=now + timedelta(days=days - 7)
+        ))
+    db_session.commit()
+    scheduler = MilestoneScheduler(db_session)
+
+    assert scheduler.fire_due(now)["fired"] == 1
+    assert scheduler.fire_due(now)["fired"] == 0
+    notification = db_session.query(Notification).one()
+    assert notification.dedupe_key.startswith("jee_exam_date:")
+
+    assert scheduler.fire_due(now + timedelta(days=24))["fired"] == 1
+
+
+def test_backfill_moves_json_triggers(db_session, machine):
+    """Existing JSON triggers become rows; reminders already sent are marked fired"""
+    soon = datetime.utcnow() + timedelta(days=3)
+    later = datetime.utcnow() + timedelta(days=60)
+    add_users(db_session, 4, milestone_triggers=json.dumps({
+        "jee_exam_date": soon.isoformat(), "neet_exam_date": later.isoformat()
+    }))
+    first = db_session.query(User).first()
+    db_session.add(Notification(
+        user_id=first.id, notification_type="milestone_reminder",
+        dedupe_key=LifecycleStateMachine.reminder_key("jee_exam_date", soon)
+    ))
+    db_session.commit()
+
+    stats = machine.backfill_milestones(batch_size=3)
+    assert stats["scheduled"] == 8
+    assert machine.backfill_milestones()["scheduled"] == 0
+
+    # Every jee_exam_date reminder was due under the daily check, so none is sent again
+    fired = MilestoneScheduler(db_session).fire_due()
+    assert fired["fired"] == 0
+    assert db_session.query(MilestoneTrigger).filter(MilestoneTrigger.fired_at.isnot(None)).count() == 4
+
+
+def test_backfill_does_not_resend_undeduped_reminders(db_session, machine):
+    """Users already inside the reminder window keep the reminder the old check sent"""
+    now = datetime.utcnow()
+    add_users(db_session, 1, milestone_triggers=json.dumps({
+        "jee_exam_date": (now + timedelta(days=5)).isoformat(),
+        "neet_exam_date": (now - timedelta(days=2)).isoformat(),
+        "college_start_date": (now + timedelta(days=20)).isoformat(),
+    }))
+    user = db_session.query(User).one()
+    db_session.add(Notification(user_id=user.id, notification_type="milestone_reminder", message="JEE Main exam in 7 days"))
+    db_session.commit()
+
+    machine.backfill_milestones()
+    scheduler = MilestoneScheduler(db_session)
+    assert scheduler.fire_due(now)["fired"] == 0
+    assert db_session.query(Notification).count() == 1
+
+    reminder = scheduler.fire_due(now + timedelta(days=14))
+    assert reminder["fired"] == 1
+    assert db_session.query(Notification).filter(Notification.dedupe_key.isnot(None)).one().message.startswith(
+        "College starts in 6 days"
+    )
+
+
+def test_scheduler_expires_triggers_whose_milestone_passed(db_session, test_user):
+    """A trigger left unfired past its milestone is closed without a reminder"""
+    now = datetime.utcnow()
+    db_session.add(MilestoneTrigger(
+        user_id=test_user.id, name="jee_exam_date",
+        trigger_date=now - timedelta(days=1), fire_at=now - timedelta(days=8)
+    ))
+    db_session.commit()
+
+    stats = MilestoneScheduler(db_session).fire_due(now)
+    assert stats["fired"] == 0 and stats["expired"] == 1
+    assert db_session.query(Notification).count() == 0
+    assert db_session.query(MilestoneTrigger).one().fired_at == now
+
+
+def test_daily_checks_progress_stage(db_session, machine):
+    """Users past their board exam move on, with the previous stage recorded"""
+    past = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    add_users(db_session, 3, current_stage="class_12_started",
+              milestone_triggers=json.dumps({"board_exam_date": past}))
+
+    stats = machine.run_daily_checks()
+
+    assert stats["progressed"] == 3
+    assert {u.current_stage for u in db_session.query(User).all()} == {"class_12_completed"}
+    details = json.loads(db_session.query(UserActivity).first().details)
+    assert details == {"from_stage": "class_12_started", "to_stage": "class_12_completed"}
+
+
+def test_stage_rules_are_pure():
+    """Transitions are evaluated from a table, without a database"""
+    machine = LifecycleStateMachine(session_factory=None)
+    now = datetime.utcnow()
+    past, future = now - timedelta(days=1), now + timedelta(days=1)
+
+    assert machine.evaluate_stage("class_12_started", {"board_exam_date": past}, now) == "class_12_completed"
+    assert machine.evaluate_stage("class_12_started", {"board_exam_date": future}, now) is None
+    assert machine.evaluate_stage("entrance_exams_preparing", {"neet_result_date": past}, now) == "college_admission_phase"
+
+    users = [
+        User(id=1, current_stage="class_12_started", milestone_triggers=json.dumps({"board_exam_date": past.isoformat()})),
+        User(id=2, current_stage="class_12_started", milestone_triggers=json.dumps({"board_exam_date": "soon"})),
+        User(id=3, current_stage="career_started", milestone_triggers=None),
+    ]
+    assert machine.next_stages(users, now) == {1: "class_12_completed"}
+
+
+def test_shared_instance_uses_a_session_per_call(db_session, test_user):
+    """Without a bound session every call opens and closes its own"""
+    from sqlalchemy.orm import sessionmaker
+
+    opened = []
+    factory = sessionmaker(bind=db_session.get_bind())
+
+    def session_factory():
+        session = factory()
+        opened.append(session)
+        return session
+
+    machine = LifecycleStateMachine(session_factory=session_factory)
+    assert opened == []
+
+    machine.progress_user_stage(test_user.id, "class_12_completed")
+    assert machine.recommend_next_exams(test_user.id) == []
+    assert len(opened) == 2
+    assert all(not session.in_transaction() for session in opened)
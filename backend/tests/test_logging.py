@@ -0,0 +1,84 @@
+"""
+Tests for queued logging and request log sampling
+"""
+import json
+import logging
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from config import settings
+from logger import (
+    JSONFormatter, DeferredQueueHandler, RequestLogSampler, flush_logs, logger as app_logger, request_log_sampler, setup_logging
+)
+
+
+def test_sampler_keeps_errors_and_samples_successes():
+    """Errors are always logged; successes follow the route's rate"""
+    sampler = RequestLogSampler(default_rate=1.0, route_rates={"/quiet": 0.0, "/half": 0.5})
+
+    assert sampler.should_log("/anything", 200)
+    assert not sampler.should_log("/quiet", 200)
+    assert sampler.should_log("/quiet", 404)
+    assert sampler.should_log("/quiet", 503)
+    kept = sum(sampler.should_log("/half", 200) for _ in range(2000))
+    assert 800 < kept < 1200
+
+
+def test_deferred_records_format_on_listener():
+    """Prepared records carry the merged message and traceback text, not live objects"""
+    logger = logging.getLogger("test")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logger.makeRecord("test", logging.ERROR, __file__, 1, "failed %s", ("job",), None)
+        import sys
+        record.exc_info = sys.exc_info()
+    record.request_id = "abc"
+
+    prepared = DeferredQueueHandler(None).prepare(record)
+    data = json.loads(JSONFormatter().format(prepared))
+
+    assert prepared.args is None and prepared.exc_info is None
+    assert record.exc_info is not None  # the original is untouched
+    assert data["message"] == "failed job"
+    assert "ValueError: boom" in data["exception"]
+    assert data["request_id"] == "abc"
+
+
+def test_sampled_routes_are_not_logged(client, caplog, monkeypatch):
+    """Route sampling applies to the path template"""
+    monkeypatch.setattr(request_log_sampler, "route_rates", {"/api/v1/exams/{exam_id}": 0.0})
+
+    with caplog.at_level(logging.INFO):
+        client.get("/api/v1/health")
+        client.get("/api/v1/exams/999")
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert "API GET /api/v1/health - Status: 200" in messages
+    assert "API GET /api/v1/exams/999 - Status: 404" in messages
+
+
+@pytest.fixture
+def tmp_log_file(tmp_path, monkeypatch):
+    """Point the log listener at a fresh file for one test"""
+    monkeypatch.setattr(settings, "log_file", str(tmp_path / "examsensei.log"))
+    setup_logging()
+    yield tmp_path / "examsensei.log"
+    monkeypatch.undo()
+    setup_logging()
+
+
+def _log_from_worker(marker: str):
+    app_logger.warning(f"worker says {marker}")
+
+
+def test_forked_job_workers_write_their_logs(tmp_log_file):
+    """Records logged in forked job workers reach the log file"""
+    from jobs import _init_worker_process
+
+    marker = uuid.uuid4().hex
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker_process) as pool:
+        pool.submit(_log_from_worker, marker).result()
+    flush_logs()
+
+    assert f"worker says {marker}" in tmp_log_file.read_text()
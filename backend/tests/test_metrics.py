@@ -0,0 +1,84 @@
+"""
+Tests for the Prometheus metrics endpoint
+"""
+from prometheus_client import REGISTRY
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_counted_per_route(client, auth_headers, test_user):
+    """Counts and latency use the route template, not the raw path"""
+    labels = {"method": "GET", "route": "/api/v1/users/{user_id}/gamification", "status": "200"}
+    before = sample("http_requests_total", **labels)
+
+    client.get(f"/api/v1/users/{test_user.id}/gamification", headers=auth_headers)
+    client.get("/api/v1/no-such-route")
+
+    assert sample("http_requests_total", **labels) == before + 1
+    assert sample("http_requests_total", method="GET", route="unmatched", status="404") >= 1
+    assert sample(
+        "http_request_duration_seconds_count", method="GET", route="/api/v1/users/{user_id}/gamification"
+    ) >= 1
+
+
+def test_metrics_endpoint_exposes_all_groups(client, db_session, test_user):
+    """The exposition covers HTTP, database, notification queue and job metrics"""
+    from datetime import datetime
+    from models import Notification
+
+    db_session.add(Notification(user_id=test_user.id, notification_type="reminder", scheduled_at=datetime.utcnow()))
+    db_session.commit()
+    client.get("/api/v1/health")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for name in ("http_requests_total", "db_queries_total", "db_pool_connections_in_use",
+                 "cache_requests_total", "ollama_requests_in_flight", "rate_limit_rejections_total",
+                 "job_items_total"):
+        assert f"# TYPE {name.replace('_total', '')}" in body
+    assert "notification_queue_pending 1.0" in body
+
+
+def test_cache_lookups_are_labelled_by_prefix(monkeypatch):
+    """Hit ratio can be computed per key prefix"""
+    from cache import cache
+
+    class FakeRedis:
+        def get(self, key):
+            return "1" if key.endswith(":hit") else None
+
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(cache, "redis_client", FakeRedis())
+    before_hits = sample("cache_requests_total", prefix="principal", result="hit")
+    before_misses = sample("cache_requests_total", prefix="principal", result="miss")
+
+    cache.get("principal:1:hit")
+    cache.get("principal:2:miss")
+
+    assert sample("cache_requests_total", prefix="principal", result="hit") == before_hits + 1
+    assert sample("cache_requests_total", prefix="principal", result="miss") == before_misses + 1
+
+
+def test_multiprocess_collector_aggregates_workers(tmp_path):
+    """Samples written by separate worker processes are summed in one scrape"""
+    import subprocess
+    import sys
+    import os
+
+    script = (
+        "from metrics import JOB_ITEMS; JOB_ITEMS.labels('daily_checks').inc(5)"
+    )
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), LOG_ASYNC="false")
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", script], env=env, check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    from prometheus_client import CollectorRegistry, generate_latest, multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+
+    assert 'job_items_total{job="daily_checks"} 10.0' in generate_latest(registry).decode()
@@ -0,0 +1,194 @@
+"""
+Tests for notification delivery
+"""
+import smtplib
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+from models import Notification
+import notifications
+from notifications import DeliveryWorker, EmailAdapter, FakeChannelAdapter
+
+
+@pytest.fixture
+def session_factory(db_session):
+    return sessionmaker(bind=db_session.get_bind())
+
+
+def queue(db_session, user, count, channel="push", **fields):
+    db_session.add_all([
+        Notification(user_id=user.id, notification_type="milestone_reminder", message=f"Reminder {i}",
+                     channel=channel, scheduled_at=datetime.utcnow() - timedelta(minutes=1), **fields)
+        for i in range(count)
+    ])
+    db_session.commit()
+
+
+def test_delivers_each_notification_once(db_session, test_user, session_factory):
+    """Due notifications are sent per channel and marked sent"""
+    push, email = FakeChannelAdapter("push"), FakeChannelAdapter("email")
+    queue(db_session, test_user, 5, channel="push")
+    queue(db_session, test_user, 3, channel="email")
+    queue(db_session, test_user, 2, channel="telegram")  # no adapter: left alone
+
+    worker = DeliveryWorker([push, email], session_factory=session_factory, batch_size=4)
+    metrics = worker.run_once()
+    worker.run_once()
+
+    assert len(push.sent) == 5 and len(email.sent) == 3
+    assert metrics["sent"] == 8
+    assert metrics["channels"]["email"]["sent"] == 3
+    assert db_session.query(Notification).filter(Notification.sent == True).count() == 8  # noqa: E712
+    assert DeliveryWorker.queue_stats(db_session)["pending"] == 2
+
+
+def test_transient_failures_back_off_then_succeed(db_session, test_user, session_factory):
+    """A failed send is retried only after its backoff has passed"""
+    push = FakeChannelAdapter("push", fail_times=1)
+    queue(db_session, test_user, 1)
+    worker = DeliveryWorker([push], session_factory=session_factory)
+
+    assert worker.run_once()["retried"] == 1
+    notification = db_session.query(Notification).one()
+    db_session.refresh(notification)
+    assert notification.status == "pending"
+    assert notification.next_attempt_at > datetime.utcnow()
+    assert push.sent == []
+
+    notification.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    worker.run_once()
+    db_session.refresh(notification)
+    assert notification.status == "sent"
+    assert notification.attempts == 2
+
+
+def test_permanent_failures_are_not_retried(db_session, test_user, session_factory):
+    """Permanent errors and exhausted retries end in failed"""
+    queue(db_session, test_user, 1)
+    queue(db_session, test_user, 1, channel="email", attempts=4)
+    worker = DeliveryWorker(
+        [FakeChannelAdapter("push", fail_times=1, permanent=True), FakeChannelAdapter("email", fail_times=1)],
+        session_factory=session_factory, max_attempts=5
+    )
+
+    assert worker.run_once()["failed"] == 2
+    assert {n.status for n in db_session.query(Notification).all()} == {"failed"}
+
+
+def test_per_channel_concurrency_limit(db_session, test_user, session_factory):
+    """No more than the channel's concurrency is in flight at once"""
+    push = FakeChannelAdapter("push", concurrency=3, delay=0.01)
+    queue(db_session, test_user, 12)
+
+    DeliveryWorker([push], session_factory=session_factory).run_once()
+
+    assert len(push.sent) == 12
+    assert push.max_in_flight == 3
+
+
+def test_channels_send_concurrently(db_session, test_user, session_factory):
+    """A slow channel does not hold back the others in the same batch"""
+    push = FakeChannelAdapter("push", concurrency=1, delay=0.01)
+    email = FakeChannelAdapter("email", concurrency=1, delay=0.01)
+    queue(db_session, test_user, 1, channel="push")
+    queue(db_session, test_user, 1, channel="email")
+
+    overlapped = []
+    send = email.send
+
+    async def send_email(notification, user):
+        overlapped.append(push.in_flight > 0)
+        await send(notification, user)
+    email.send = send_email
+
+    DeliveryWorker([push, email], session_factory=session_factory).run_once()
+
+    assert len(push.sent) == 1 and len(email.sent) == 1
+    assert overlapped == [True]
+
+
+def test_claims_do_not_overlap(db_session, test_user, session_factory):
+    """Two workers claiming from the same queue get disjoint batches"""
+    queue(db_session, test_user, 6)
+    first = DeliveryWorker([FakeChannelAdapter("push")], session_factory=session_factory, batch_size=4)
+    second = DeliveryWorker([FakeChannelAdapter("push")], session_factory=session_factory, batch_size=4)
+
+    a = first.claim(db_session, datetime.utcnow())
+    b = second.claim(db_session, datetime.utcnow())
+
+    assert len(a) == 4 and len(b) == 2
+    assert not {n.id for n in a} & {n.id for n in b}
+
+
+class FakeSMTP:
+    """Records connections; drops the connection after `drop_after` messages"""
+
+    opened = []
+    drop_after = None
+
+    def __init__(self, host, port, timeout=None):
+        self.logins = 0
+        self.sent = []
+        self.closed = False
+        FakeSMTP.opened.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def send_message(self, message):
+        if self.drop_after is not None and len(self.sent) >= self.drop_after:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.sent.append(message["To"])
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    FakeSMTP.opened, FakeSMTP.drop_after = [], None
+    monkeypatch.setattr(notifications.smtplib, "SMTP", FakeSMTP)
+    monkeypatch.setattr(notifications.settings, "smtp_user", "mailer")
+    return FakeSMTP
+
+
+def test_email_reuses_connections_within_a_batch(db_session, test_user, session_factory, fake_smtp):
+    """A batch logs in once per concurrent sender and closes its connections when done"""
+    queue(db_session, test_user, 6, channel="email")
+
+    metrics = DeliveryWorker([EmailAdapter(concurrency=2)], session_factory=session_factory).run_once()
+
+    assert metrics["sent"] == 6
+    assert 1 <= len(fake_smtp.opened) <= 2
+    assert all(smtp.logins == 1 and smtp.closed for smtp in fake_smtp.opened)
+    assert sum(len(smtp.sent) for smtp in fake_smtp.opened) == 6
+
+
+def test_email_reconnects_when_the_server_drops(db_session, test_user, session_factory, fake_smtp):
+    """A dropped connection is replaced and the message still goes out"""
+    fake_smtp.drop_after = 2
+    queue(db_session, test_user, 3, channel="email")
+
+    metrics = DeliveryWorker([EmailAdapter(concurrency=1)], session_factory=session_factory).run_once()
+
+    assert metrics["sent"] == 3
+    assert [len(smtp.sent) for smtp in fake_smtp.opened] == [2, 1]
+
+
+def test_unscheduled_notifications_are_due(db_session, test_user, session_factory):
+    """Rows without scheduled_at, as queued before scheduling existed, are delivered"""
+    push = FakeChannelAdapter("push")
+    db_session.add(Notification(user_id=test_user.id, notification_type="exam_update", message="Old", channel="push"))
+    db_session.commit()
+    assert DeliveryWorker.queue_stats(db_session)["pending"] == 1
+
+    DeliveryWorker([push], session_factory=session_factory).run_once()
+
+    assert [sent["message"] for sent in push.sent] == ["Old"]
@@ -87,3 +87,105 @@ def test_caching_performance(client, test_exam):
     assert response2.status_code == 200
     # Cached request should be faster
     assert duration2 < duration1
+
+
+def test_login_storm_keeps_event_loop_responsive():
+    """Concurrent bcrypt verifications run on the pool while the loop keeps ticking"""
+    import asyncio
+    from passlib.context import CryptContext
+    from auth import PasswordHasher
+
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=10)
+    stored = context.hash("testpassword123")
+    hasher = PasswordHasher(workers=4, max_pending=64, context=context)
+
+    async def storm():
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - start - 0.005)
+
+        tick = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        results = await asyncio.gather(*(hasher.verify_and_update("testpassword123", stored) for _ in range(32)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await tick
+        return results, elapsed, max(lags)
+
+    results, elapsed, max_lag = asyncio.run(storm())
+
+    assert all(valid for valid, _ in results)
+    assert max_lag < 0.05  # the loop never stalls behind a hash
+    print(f"32 logins in {elapsed:.2f}s, max event loop lag {max_lag * 1000:.1f}ms")
+
+
+def test_request_logging_overhead():
+    """The logging middleware adds well under a millisecond per request"""
+    import asyncio
+    from starlette.requests import Request
+    from starlette.responses import Response
+    from app_v2 import log_requests
+
+    async def call_next(request):
+        return Response("ok")
+
+    async def bench(n):
+        scope = {"type": "http", "method": "GET", "path": "/api/v1/exams", "headers": [], "query_string": b""}
+        start = time.perf_counter()
+        for _ in range(n):
+            await call_next(Request(scope))
+        baseline = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(n):
+            await log_requests(Request(scope), call_next)
+        return (time.perf_counter() - start - baseline) / n
+
+    overhead = asyncio.run(bench(2000))
+
+    assert overhead < 0.001
+    print(f"logging middleware overhead: {overhead * 1e6:.0f}us per request")
+
+
+def test_exam_search_at_100k_exams():
+    """Search and autocomplete stay interactive over a 100k exam index"""
+    import random
+    from types import SimpleNamespace
+    from search import SearchIndex
+
+    rng = random.Random(42)
+    bodies = ["NTA", "UPSC", "SSC", "IBPS", "State PSC", "University"]
+    words = ["engineering", "medical", "entrance", "recruitment", "officer", "clerk", "assistant", "teacher",
+             "eligibility", "aptitude", "science", "commerce", "law", "design", "management", "nursing"]
+    exams = [
+        SimpleNamespace(
+            id=i, name=f"{rng.choice(words).title()} {rng.choice(words).title()} Exam {i}",
+            code=f"exam_{i}", body=rng.choice(bodies), exam_type="entrance",
+            syllabus=" ".join(rng.choice(words) for _ in range(30))
+        )
+        for i in range(100000)
+    ]
+
+    start = time.perf_counter()
+    index = SearchIndex(exams)
+    build = time.perf_counter() - start
+
+    def per_call(fn, *queries):
+        start = time.perf_counter()
+        for query in queries:
+            fn(query)
+        return (time.perf_counter() - start) / len(queries)
+
+    exact = per_call(index.search, "medical officer", "exam 4242", "law design")
+    fuzzy = per_call(index.search, "nursng", "recruitmnt clerk")
+    complete = per_call(index.autocomplete, "med", "engineering off", "exam 42")
+
+    assert index.search("exam 4242")[0][0].id == 4242
+    assert exact < 0.5 and fuzzy < 0.5 and complete < 0.1
+    print(f"100k exams: build {build:.1f}s, search {exact * 1000:.0f}ms, "
+          f"fuzzy {fuzzy * 1000:.0f}ms, autocomplete {complete * 1000:.1f}ms")
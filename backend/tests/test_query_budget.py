@@ -0,0 +1,65 @@
+"""
+Tests for per-request query budgets and N+1 detection
+"""
+import pytest
+from models import User
+from exceptions import QueryBudgetExceeded
+from tracing import start_trace, end_trace, query_problems, statement_shape
+
+
+def test_statement_shapes_ignore_in_list_length():
+    """Batched lookups of different sizes count as one shape"""
+    assert statement_shape("SELECT * FROM exams WHERE code IN (?, ?,\n ?)") == \
+        statement_shape("SELECT * FROM exams WHERE code IN (?)")
+
+
+def test_repeated_statement_is_flagged_with_call_site(db_session, test_user):
+    """A query issued in a loop is reported along with where it came from"""
+    trace, token = start_trace(repeat_threshold=3)
+    try:
+        for _ in range(4):
+            db_session.query(User).filter(User.id == test_user.id).first()
+    finally:
+        end_trace(token)
+
+    problems = query_problems(trace, budget=None)
+    assert len(problems) == 1
+    assert "repeated 4 times" in problems[0]
+    assert "test_repeated_statement_is_flagged_with_call_site" in problems[0]
+
+
+def test_distinct_statements_are_not_flagged(db_session, test_user):
+    """Different statements within budget pass"""
+    trace, token = start_trace(repeat_threshold=3)
+    try:
+        db_session.query(User).filter(User.id == test_user.id).first()
+        db_session.query(User).filter(User.email == test_user.email).first()
+    finally:
+        end_trace(token)
+
+    assert query_problems(trace, budget=2) == []
+    assert query_problems(trace, budget=1) == ["2 queries, budget is 1"]
+
+
+def test_endpoint_over_budget_fails(client, auth_headers, test_user, monkeypatch):
+    """In the test suite an endpoint exceeding its declared budget raises"""
+    from app_v2 import get_gamification_status
+
+    monkeypatch.setattr(get_gamification_status, "query_budget", 0)
+
+    with pytest.raises(QueryBudgetExceeded):
+        client.get(f"/api/v1/users/{test_user.id}/gamification", headers=auth_headers)
+
+
+def test_log_mode_reports_without_failing(client, auth_headers, test_user, monkeypatch, caplog):
+    """In development the offending request is logged and still answered"""
+    from app_v2 import get_gamification_status
+    from config import settings
+
+    monkeypatch.setattr(settings, "query_checks", "log")
+    monkeypatch.setattr(get_gamification_status, "query_budget", 0)
+
+    response = client.get(f"/api/v1/users/{test_user.id}/gamification", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert any("budget is 0" in record.getMessage() for record in caplog.records)
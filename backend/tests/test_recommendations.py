@@ -0,0 +1,147 @@
+"""
+Tests for materialized recommendations
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from models import User, Exam, Recommendation
+from ai_models import AdaptiveMentor, RecommendationMaterializer
+
+
+@pytest.fixture
+def engineering_user(db_session, test_user):
+    """Class 12 engineering aspirant preparing for two clashing exams"""
+    dates = json.dumps({"exam_dates": ["2025-04-10"]})
+    db_session.add_all([
+        Exam(name="JEE Main", code="jee_main", body="NTA", exam_type="entrance", important_dates=dates),
+        Exam(name="BITSAT", code="bitsat", body="BITS", exam_type="entrance", important_dates=dates),
+    ])
+    test_user.current_stage = "class_12_started"
+    test_user.career_paths = ["engineering"]
+    test_user.active_exams = ["jee_main", "bitsat"]
+    db_session.commit()
+    return test_user
+
+
+def test_job_upserts_without_growing_table(db_session, engineering_user):
+    """Re-running the job updates rows in place; unchanged users are skipped"""
+    first = RecommendationMaterializer(db_session, batch_size=1).run(only_changed=True)
+    count = db_session.query(Recommendation).count()
+
+    assert first["refreshed"] == 1
+    assert count == 4  # three career paths and one clash alert
+
+    second = RecommendationMaterializer(db_session).run(only_changed=True)
+    assert second["skipped"] == 1
+    assert second["refreshed"] == 0
+
+    RecommendationMaterializer(db_session).run(only_changed=False)
+    assert db_session.query(Recommendation).count() == count
+
+
+def test_job_removes_recommendations_that_no_longer_apply(db_session, engineering_user):
+    """Changing inputs rewrites the user's rows, dropping stale and legacy ones"""
+    db_session.add(Recommendation(user_id=engineering_user.id, recommendation_type="career_path", score=0.5))
+    db_session.commit()
+    RecommendationMaterializer(db_session).run()
+
+    user = db_session.query(User).first()
+    user.active_exams = ["jee_main"]
+    db_session.commit()
+    stats = RecommendationMaterializer(db_session).run()
+
+    types = [r.recommendation_type for r in db_session.query(Recommendation).all()]
+    assert stats["refreshed"] == 1
+    assert types.count("clash_alert") == 0
+    assert len(types) == 3
+
+
+def test_legacy_rows_are_replaced_once(db_session, engineering_user):
+    """Unkeyed rows from before materialization are all dropped and never served"""
+    now, user_id = datetime.utcnow(), engineering_user.id
+    db_session.add_all([
+        Recommendation(user_id=user_id, recommendation_type="career_path", score=0.99,
+                       reasoning=f"legacy {i}", created_at=now, expires_at=now + timedelta(days=90))
+        for i in range(3)
+    ])
+    db_session.commit()
+
+    first = RecommendationMaterializer(db_session).run()
+    assert first["rows_written"] == 4 and first["rows_deleted"] == 3
+    assert db_session.query(Recommendation).filter(Recommendation.rec_key.is_(None)).count() == 0
+
+    second = RecommendationMaterializer(db_session).run()
+    assert second["skipped"] == 1 and second["refreshed"] == 0
+
+    served = AdaptiveMentor(db_session).get_personalized_recommendations(user_id)
+    assert len(served["recommendations"]) == 4
+    assert not any(r["reasoning"].startswith("legacy") for r in served["recommendations"])
+
+
+def test_mentor_serves_materialized_rows(db_session, engineering_user):
+    """The endpoint reads stored rows and never inserts duplicates"""
+    mentor = AdaptiveMentor(db_session)
+
+    first = mentor.get_personalized_recommendations(engineering_user.id)
+    second = mentor.get_personalized_recommendations(engineering_user.id)
+
+    assert first["recommendations"] == second["recommendations"]
+    assert first["recommendations"][0]["type"] == "clash_alert"
+    assert {r["exam"] for r in first["recommendations"]} >= {"JEE Main", "BITSAT"}
+    assert db_session.query(Recommendation).count() == 4
+
+
+def test_mentor_query_count_does_not_grow_with_rows(db_session, engineering_user):
+    """Exams come with the rows, not one lazy load per recommendation"""
+    from tracing import start_trace, end_trace
+
+    mentor = AdaptiveMentor(db_session)
+
+    def traced(user_id):
+        trace, token = start_trace(repeat_threshold=2)
+        try:
+            response = mentor.get_personalized_recommendations(user_id)
+        finally:
+            end_trace(token)
+        db_session.expire_all()
+        return trace, response
+
+    cold, _ = traced(engineering_user.id)
+    assert cold.repeated == {}
+
+    warm, response = traced(engineering_user.id)
+    assert len(response["recommendations"]) == 4
+
+    for row in db_session.query(Recommendation).filter(Recommendation.recommendation_type == "career_path").limit(2):
+        db_session.delete(row)
+    db_session.commit()
+    fewer, response = traced(engineering_user.id)
+    assert len(response["recommendations"]) == 2
+    assert fewer.query_count == warm.query_count
+
+
+def test_input_changes_refresh_recommendations_but_logins_do_not(db_session, engineering_user, monkeypatch):
+    """Stage changes drop the cached response and are picked up; a login touches neither"""
+    import user_changes
+    from datetime import datetime
+    from lifecycle import LifecycleStateMachine
+
+    dropped = []
+    monkeypatch.setattr(user_changes, "invalidate_recommendations", dropped.append)
+    mentor = AdaptiveMentor(db_session)
+    mentor.get_personalized_recommendations(engineering_user.id)
+    created = {row.id: row.created_at for row in db_session.query(Recommendation)}
+
+    engineering_user.last_login = datetime.utcnow()
+    db_session.commit()
+    mentor.get_personalized_recommendations(engineering_user.id)
+    assert {row.id: row.created_at for row in db_session.query(Recommendation)} == created
+    assert dropped == []
+
+    LifecycleStateMachine(db_session).progress_user_stage(engineering_user.id, "undergraduate_started")
+    assert dropped == [engineering_user.id]
+    assert engineering_user.inputs_updated_at is not None
+
+    response = mentor.get_personalized_recommendations(engineering_user.id)
+    assert response["user_stage"] == "undergraduate_started"
+    assert "Postgraduate engineering studies" in {r["reasoning"] for r in response["recommendations"]}
@@ -0,0 +1,155 @@
+"""
+Tests for conditional fetching of scraped pages
+"""
+import json
+import pytest
+from sqlalchemy.orm import sessionmaker
+from types import SimpleNamespace
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from models import Exam, ExamEvent, ScrapedPage
+from scrape_cache import ConditionalFetchMiddleware, NotModified, PageStore, PageTimingMiddleware
+from scrape_pipeline import ExamUpserter, ExamUpsertPipeline
+
+URL = "https://nta.ac.in/PublicNotice"
+BODY = b"<html><body>JEE Main 2025</body></html>"
+
+
+@pytest.fixture
+def store(db_session):
+    return PageStore(session_factory=sessionmaker(bind=db_session.get_bind()))
+
+
+@pytest.fixture
+def stats():
+    return MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+
+
+def crawl_page(fetch, timing, body=BODY, status=200, headers=None, flags=None):
+    """Run one request through both middlewares; returns the parsed items, or None if skipped"""
+    request = Request(URL)
+    fetch.process_request(request, None)
+    response = HtmlResponse(URL, status=status, body=body, headers=headers, flags=flags, request=request)
+    try:
+        response = fetch.process_response(request, response, None)
+    except NotModified:
+        return None
+    return list(timing.process_spider_output(response, iter([{"code": "jee_main_2025"}]), None)), request
+
+
+def test_unchanged_pages_are_not_parsed_again(db_session, store, stats):
+    fetch, timing = ConditionalFetchMiddleware(store, stats), PageTimingMiddleware(store, stats)
+    items, request = crawl_page(fetch, timing, headers={"ETag": '"v1"', "Last-Modified": "Mon, 06 Jan 2025 10:00:00 GMT"})
+    assert items == [{"code": "jee_main_2025"}]
+    assert "If-None-Match" not in request.headers
+    store.save()
+
+    page = db_session.query(ScrapedPage).one()
+    assert (page.url, page.etag, page.content_length) == (URL, '"v1"', len(BODY))
+
+    # Next crawl: validators are sent back, and a 304 or an identical body skips parsing
+    store = PageStore(session_factory=store.session_factory)
+    store.load()
+    fetch, timing = ConditionalFetchMiddleware(store, stats), PageTimingMiddleware(store, stats)
+    request = Request(URL)
+    fetch.process_request(request, None)
+    assert request.headers["If-None-Match"] == b'"v1"'
+    assert request.headers["If-Modified-Since"] == b"Mon, 06 Jan 2025 10:00:00 GMT"
+
+    assert crawl_page(fetch, timing, body=b"", status=304) is None
+    assert crawl_page(fetch, timing) is None
+    assert stats.get_value("pagecache/not_modified") == 1
+    assert stats.get_value("pagecache/unchanged") == 1
+    assert stats.get_value("pagecache/bytes_saved") == len(BODY)
+    assert stats.get_value("pagecache/parsed") == 1
+
+    items, _ = crawl_page(fetch, timing, body=BODY + b"<p>Admit card released</p>")
+    assert items
+    assert stats.get_value("pagecache/parsed") == 2
+
+
+def test_page_is_recorded_only_after_a_successful_parse(store, stats):
+    fetch, timing = ConditionalFetchMiddleware(store, stats), PageTimingMiddleware(store, stats)
+    request = Request(URL)
+    response = fetch.process_response(request, HtmlResponse(URL, body=BODY, request=request), None)
+
+    def failing_parse():
+        yield {"code": "jee_main_2025"}
+        raise ValueError("layout changed")
+
+    with pytest.raises(ValueError):
+        list(timing.process_spider_output(response, failing_parse(), None))
+    assert store.get(URL) is None
+
+
+def test_force_and_cache_hits(store, stats):
+    store.update(URL, {"etag": '"v1"', "content_hash": None})
+    fetch, timing = ConditionalFetchMiddleware(store, stats, force=True), PageTimingMiddleware(store, stats)
+    request = Request(URL)
+    fetch.process_request(request, None)
+    assert "If-None-Match" not in request.headers
+
+    items, _ = crawl_page(fetch, timing, flags=["cached"])
+    assert items
+    assert stats.get_value("pagecache/cache_hits") == 1
+    assert stats.get_value("pagecache/bytes_saved") == len(BODY)
+
+
+def test_skipped_page_keeps_its_fields_when_a_sibling_changes(db_session, store, stats):
+    """PublicNotice answers 304 while Exam-Calendar changed: the notification date must survive"""
+    notice, calendar = URL, "https://nta.ac.in/Exam-Calendar"
+    upserter = ExamUpserter(session_factory=store.session_factory)
+    spider = SimpleNamespace(name="nta_spider", source="nta")
+
+    def crawl(pages):
+        fetch, timing = ConditionalFetchMiddleware(store, stats), PageTimingMiddleware(store, stats)
+        pipeline = ExamUpsertPipeline(upserter=upserter)
+        for url, status, body, item in pages:
+            request = Request(url)
+            fetch.process_request(request, None)
+            try:
+                response = fetch.process_response(request, HtmlResponse(url, status=status, body=body, request=request), None)
+            except NotModified:
+                continue
+            for output in timing.process_spider_output(response, iter([item]), None):
+                pipeline.process_item(output, spider)
+        pipeline.close_spider(spider)
+
+    crawl([
+        (notice, 200, b"notice v1", {"code": "jee", "name": "JEE Main", "important_dates": {"notification": "2024-11-01"}}),
+        (calendar, 200, b"calendar v1", {"code": "jee", "important_dates": {"exam_dates": ["2025-01-24"], "last_updated": "x"}}),
+    ])
+    crawl([
+        (notice, 304, b"", None),
+        (calendar, 200, b"calendar v2", {"code": "jee", "important_dates": {"exam_dates": ["2025-01-25"], "last_updated": "y"}}),
+    ])
+
+    jee = db_session.query(Exam).filter(Exam.code == "jee").one()
+    assert json.loads(jee.important_dates) == {"notification": "2024-11-01", "exam_dates": ["2025-01-25"], "last_updated": "y"}
+    assert sorted((event.event_type, event.start_date.isoformat()) for event in db_session.query(ExamEvent)) == [
+        ("exam", "2025-01-25"), ("notification", "2024-11-01")
+    ]
+
+
+def test_pages_are_not_recorded_when_a_batch_fails(store, stats):
+    class FailingUpserter:
+        def write(self, items, source):
+            raise RuntimeError("database unavailable")
+
+    fetch, timing = ConditionalFetchMiddleware(store, stats), PageTimingMiddleware(store, stats)
+    pipeline = ExamUpsertPipeline(upserter=FailingUpserter())
+    pipeline.pages = store
+    spider = SimpleNamespace(name="nta_spider", source="nta")
+
+    items, _ = crawl_page(fetch, timing)
+    for item in items:
+        pipeline.process_item(item, spider)
+    with pytest.raises(RuntimeError):
+        pipeline.close_spider(spider)
+
+    store.save()
+    assert store.session_factory().query(ScrapedPage).count() == 0
+    # Pages parsed after the failure are not recorded either
+    crawl_page(fetch, timing)
+    assert store.updated == {}
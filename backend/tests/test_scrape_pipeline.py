@@ -0,0 +1,159 @@
+"""
+Tests for the scraped exam pipeline
+"""
+import json
+import pytest
+from sqlalchemy.orm import sessionmaker
+from types import SimpleNamespace
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from models import Bookmark, Exam, ExamEvent, Notification, Topic
+from catalog import exam_catalog
+from exam_changes import exam_changes
+from scrape_pipeline import ExamUpserter, ExamUpsertPipeline, content_hash, merge_item
+
+
+@pytest.fixture
+def upserter(db_session):
+    return ExamUpserter(session_factory=sessionmaker(bind=db_session.get_bind()))
+
+
+@pytest.fixture
+def published():
+    changes = []
+    exam_changes.subscribe(changes.extend)
+    yield changes
+    exam_changes._subscribers.remove(changes.extend)
+
+
+def test_merge_item_keeps_partial_dates():
+    merged = merge_item(
+        {"code": "jee", "name": "JEE", "important_dates": {"notification": "2024-11-01"}},
+        {"code": "jee", "important_dates": {"exam_dates": ["2025-01-24"]}}
+    )
+    assert merged == {
+        "code": "jee", "name": "JEE",
+        "important_dates": {"notification": "2024-11-01", "exam_dates": ["2025-01-24"]}
+    }
+
+
+def test_write_counts_and_partial_updates(db_session, upserter):
+    first = upserter.write([
+        {"code": "jee", "name": "JEE Main", "exam_type": "entrance", "important_dates": {"exam_dates": ["2025-01-24"]}},
+        {"code": "neet", "name": "NEET", "exam_type": "medical"},
+    ], "nta")
+    assert first == {"inserted": 2, "changed": 0, "unchanged": 0}
+
+    version = exam_catalog.version
+    second = upserter.write([
+        {"code": "jee", "pattern": {"total_questions": 90}},
+        {"code": "neet", "name": "NEET"},
+    ], "nta")
+    assert second == {"inserted": 0, "changed": 1, "unchanged": 1}
+    assert exam_catalog.version > version
+
+    jee = db_session.query(Exam).filter(Exam.code == "jee").one()
+    assert jee.name == "JEE Main"  # untouched by the partial item
+    assert jee.body == "NTA"
+    assert json.loads(jee.pattern) == {"total_questions": 90}
+    assert [(e.event_type, e.start_date.isoformat()) for e in db_session.query(ExamEvent)] == [("exam", "2025-01-24")]
+
+    version = exam_catalog.version
+    assert upserter.write([{"code": "neet", "name": "NEET"}], "nta")["unchanged"] == 1
+    assert exam_catalog.version == version
+
+
+def test_write_topics(db_session, upserter):
+    topics = [{"subject": "physics", "name": "kinematics", "weightage_history": [3, 4]}]
+    upserter.write([{"code": "jee", "name": "JEE", "topics": topics}], "nta")
+    topics[0]["avg_questions"] = 3.5
+    upserter.write([{"code": "jee", "topics": topics}], "nta")
+
+    topic = db_session.query(Topic).one()
+    assert topic.avg_questions == 3.5
+    assert json.loads(topic.weightage_history) == [3, 4]
+
+
+def test_pipeline_batches_and_merges(db_session, upserter):
+    class Spider:
+        name = "nta_spider"
+        source = "nta"
+
+    spider = Spider()
+    stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+    pipeline = ExamUpsertPipeline(batch_size=2, upserter=upserter)
+    pipeline.stats = stats
+
+    pipeline.process_item({"code": "jee", "name": "JEE", "important_dates": {"notification": "2024-11-01"}}, spider)
+    pipeline.process_item({"code": "neet", "name": "NEET"}, spider)
+    assert db_session.query(Exam).count() == 2  # first batch written
+
+    # A late partial item for a written exam is merged with what came before
+    pipeline.process_item({"code": "jee", "important_dates": {"exam_dates": ["2025-01-24"]}}, spider)
+    pipeline.close_spider(spider)
+
+    jee = db_session.query(Exam).filter(Exam.code == "jee").one()
+    assert json.loads(jee.important_dates) == {"notification": "2024-11-01", "exam_dates": ["2025-01-24"]}
+    assert stats.get_value("exams/inserted") == 2
+    assert stats.get_value("exams/changed") == 1
+
+
+def test_content_hash_ignores_volatile_keys_and_encoding():
+    dates = {"exam_dates": ["2025-01-24"], "last_updated": "2025-01-06T10:00:00"}
+    restamped = {"last_updated": "2025-01-07T09:00:00", "exam_dates": ["2025-01-24"]}
+    assert content_hash({"code": "jee", "important_dates": dates}) == content_hash({"code": "jee", "important_dates": json.dumps(restamped)})
+    assert content_hash({"code": "jee", "important_dates": dates}) != content_hash({"code": "jee", "important_dates": {"exam_dates": ["2025-01-25"]}})
+
+
+def test_rescrape_with_new_timestamps_leaves_row_untouched(db_session, upserter, published):
+    upserter.write([{"code": "jee", "name": "JEE Main", "important_dates": {"exam_dates": ["2025-01-24"], "last_updated": "t1"}}], "nta")
+    jee = db_session.query(Exam).filter(Exam.code == "jee").one()
+    updated_at, version = jee.updated_at, exam_catalog.version
+    assert [(change.code, change.inserted) for change in published] == [("jee", True)]
+
+    stats = upserter.write([{"code": "jee", "name": "JEE Main", "important_dates": {"exam_dates": ["2025-01-24"], "last_updated": "t2"}}], "nta")
+    assert stats == {"inserted": 0, "changed": 0, "unchanged": 1}
+    db_session.expire_all()
+    assert jee.updated_at == updated_at
+    assert json.loads(jee.important_dates)["last_updated"] == "t1"
+    assert exam_catalog.version == version
+    assert len(published) == 1
+
+
+def test_only_changed_fields_are_written_and_published(db_session, upserter, published):
+    upserter.write([{"code": "jee", "name": "JEE Main", "fees": {"general": 1000}, "important_dates": {"exam_dates": ["2025-01-24"]}}], "nta")
+    db_session.query(Exam).filter(Exam.code == "jee").update({"name": "JEE Main (edited)"})
+    db_session.commit()
+    published.clear()
+
+    # name was edited since the last scrape but the scraper still reports the old value
+    stats = upserter.write([{"code": "jee", "name": "JEE Main (edited)", "fees": {"general": 1000},
+                             "important_dates": {"exam_dates": ["2025-01-25"]}}], "nta")
+    assert stats["changed"] == 1
+    assert [(change.code, change.fields) for change in published] == [("jee", ("important_dates",))]
+    assert [e.start_date.isoformat() for e in db_session.query(ExamEvent)] == ["2025-01-25"]
+
+
+def test_legacy_rows_get_a_hash_without_a_change(db_session, upserter, test_exam, published):
+    updated_at = test_exam.updated_at
+    stats = upserter.write([{"code": "jee_main_2025", "name": "JEE Main 2025"}], "nta")
+    assert stats["unchanged"] == 1 and published == []
+    db_session.expire_all()
+    assert test_exam.content_hash is not None
+    assert test_exam.updated_at == updated_at
+
+
+def test_followers_are_notified_once_per_change(db_session, upserter, test_user, test_exam):
+    db_session.add(Bookmark(user_id=test_user.id, exam_id=test_exam.id))
+    db_session.commit()
+    upserter.write([{"code": "jee_main_2025", "syllabus": "Physics, chemistry and mathematics"}], "nta")
+    assert db_session.query(Notification).count() == 0  # not a change users follow
+
+    item = {"code": "jee_main_2025", "important_dates": {"exam_dates": ["2025-04-02"], "last_updated": "t1"}}
+    upserter.write([item], "nta")
+    notification = db_session.query(Notification).one()
+    assert (notification.user_id, notification.exam_id, notification.notification_type) == (test_user.id, test_exam.id, "exam_update")
+    assert notification.message == "JEE Main 2025: important dates updated"
+
+    upserter.write([dict(item, important_dates={"exam_dates": ["2025-04-02"], "last_updated": "t2"})], "nta")
+    assert db_session.query(Notification).count() == 1
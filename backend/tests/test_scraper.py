@@ -0,0 +1,41 @@
+"""
+Tests for the multi-source crawl setup
+"""
+from config import settings
+from multi_scraper import MultiSourceScraper, SPIDERS
+
+
+def test_every_source_has_a_spider():
+    assert set(SPIDERS) == set(MultiSourceScraper.SOURCES)
+    assert {spider.source for spider in SPIDERS.values()} == set(SPIDERS)
+
+
+def test_crawl_settings_follow_config():
+    crawl = MultiSourceScraper.crawl_settings()
+    assert crawl["DOWNLOAD_DELAY"] == settings.scraper_delay
+    assert crawl["RETRY_TIMES"] == settings.scraper_max_retries
+    assert crawl["CONCURRENT_REQUESTS_PER_DOMAIN"] == settings.scraper_concurrency_per_domain
+    assert crawl["AUTOTHROTTLE_ENABLED"]
+    assert crawl["HTTPCACHE_EXPIRATION_SECS"] == settings.scraper_cache_expiry
+    assert 304 in crawl["HTTPCACHE_IGNORE_HTTP_CODES"]
+    assert not crawl["PAGE_CACHE_FORCE"] and MultiSourceScraper.crawl_settings(force=True)["PAGE_CACHE_FORCE"]
+
+
+def test_crawl_report():
+    report = MultiSourceScraper.crawl_report({
+        "finish_reason": "finished",
+        "elapsed_time_seconds": 3.14159,
+        "downloader/request_count": 4,
+        "downloader/response_count": 3,
+        "downloader/exception_count": 1,
+        "item_scraped_count": 5,
+        "log_count/ERROR": 9,  # shared by every crawler in the process
+    })
+    assert report["status"] == "partial"
+    assert report["errors"] == 1
+    assert report["elapsed_seconds"] == 3.14
+    assert report["items"] == 5
+
+    assert MultiSourceScraper.crawl_report({"finish_reason": "finished", "downloader/exception_count": 3})["status"] == "failed"
+    assert MultiSourceScraper.crawl_report({"finish_reason": "shutdown"})["status"] == "failed"
+    assert MultiSourceScraper.crawl_report({"finish_reason": "finished", "downloader/response_count": 2})["status"] == "success"
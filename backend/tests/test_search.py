@@ -0,0 +1,79 @@
+"""
+Tests for exam search and autocomplete
+"""
+import pytest
+from types import SimpleNamespace
+from models import Exam
+from search import SearchIndex, trigrams
+
+
+def make_exam(exam_id, name, code, body="NTA", exam_type="entrance", syllabus=None):
+    return SimpleNamespace(id=exam_id, name=name, code=code, body=body, exam_type=exam_type, syllabus=syllabus)
+
+
+@pytest.fixture
+def index():
+    return SearchIndex([
+        make_exam(1, "JEE Main 2025", "jee_main_2025", syllabus="Physics, chemistry and mathematics"),
+        make_exam(2, "JEE Advanced 2025", "jee_advanced_2025", body="IIT"),
+        make_exam(3, "NEET UG 2025", "neet_2025", exam_type="medical", syllabus="Physics, chemistry and biology"),
+        make_exam(4, "SSC CGL 2025", "ssc_cgl_2025", body="SSC", exam_type="government_job"),
+        make_exam(5, "Mains Practice Series", "mains_series", body="Coaching",
+                  syllabus="main topics revised weekly, " * 3 + "full length mock tests with analysis " * 10),
+    ])
+
+
+def test_bm25_ranks_name_matches_first(index):
+    results = index.search("jee main")
+    assert [exam.id for exam, _ in results][:2] == [1, 2]
+    assert results[0][1] > results[1][1]
+
+
+def test_long_syllabus_does_not_outrank_name(index):
+    """Several mentions in a long syllabus count for less than one in the name"""
+    ids = [exam.id for exam, _ in index.search("main")]
+    assert ids.index(1) < ids.index(5)
+
+
+def test_syllabus_and_type_filter(index):
+    assert [exam.id for exam, _ in index.search("biology")] == [3]
+    assert [exam.id for exam, _ in index.search("physics", exam_type="medical")] == [3]
+
+
+def test_fuzzy_matching_absorbs_typos(index):
+    assert index.search("neeet")[0][0].id == 3
+    assert index.search("advnced")[0][0].id == 2
+    assert index.search("xyzzy") == []
+
+
+def test_autocomplete(index):
+    assert [exam.id for exam in index.autocomplete("jee adv")] == [2]
+    assert {exam.id for exam in index.autocomplete("je")} == {1, 2}
+    assert index.autocomplete("ssc main") == []
+    assert index.autocomplete("  ") == []
+
+
+def test_trigrams_match_pg_trgm():
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+
+
+def test_search_endpoints(client, db_session, test_exam):
+    db_session.add(Exam(name="NEET UG 2025", code="neet_2025", body="NTA", exam_type="medical_entrance"))
+    db_session.commit()
+
+    response = client.get("/api/v1/exams/search", params={"q": "jee mian"})
+    assert response.status_code == 200
+    assert response.json()[0]["code"] == "jee_main_2025"
+
+    response = client.get("/api/v1/exams/autocomplete", params={"q": "ne"})
+    assert response.status_code == 200
+    assert [s["code"] for s in response.json()] == ["neet_2025"]
+
+    assert client.get("/api/v1/exams/search").status_code == 422
+
+
+def test_chatbot_finds_misspelt_exam(db_session, test_exam):
+    from chatbot import ExamSenseiChatbot
+
+    reply = ExamSenseiChatbot(db_session)._handle_exam_information({}, {"exam": "jee mains"})
+    assert reply["text"].startswith("**JEE Main 2025**")
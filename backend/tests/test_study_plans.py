@@ -0,0 +1,147 @@
+"""
+Tests for study plan persistence and incremental re-planning
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from models import Topic, StudyPlan
+from study_plans import StudyPlanManager
+
+
+@pytest.fixture
+def exam_topics(db_session, test_exam):
+    """Six topics across three subjects"""
+    names = [
+        ("physics", "mechanics"), ("physics", "optics"),
+        ("chemistry", "organic_chemistry"), ("chemistry", "thermodynamics"),
+        ("mathematics", "calculus"), ("mathematics", "algebra"),
+    ]
+    topics = []
+    for i, (subject, name) in enumerate(names):
+        topics.append(Topic(
+            exam_id=test_exam.id,
+            subject=subject,
+            name=name,
+            weightage_history=json.dumps([20 - i]),
+            avg_questions=4,
+            difficulty_distribution=json.dumps({"easy": 40, "medium": 45, "hard": 15})
+        ))
+    db_session.add_all(topics)
+    db_session.commit()
+    return topics
+
+
+def set_profile(db_session, user, **profile):
+    user.preparation_profile = json.dumps(profile)
+    db_session.commit()
+
+
+def active_plans(db_session, user):
+    return db_session.query(StudyPlan).filter(
+        StudyPlan.user_id == user.id, StudyPlan.is_active == True  # noqa: E712
+    ).all()
+
+
+def test_repeat_request_reuses_active_plan(db_session, test_user, test_exam, exam_topics):
+    """An unchanged profile returns the stored plan without adding rows"""
+    manager = StudyPlanManager(db_session)
+
+    first = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+    second = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+
+    assert first["plan_status"] == "created"
+    assert second["plan_status"] == "unchanged"
+    assert second["plan_id"] == first["plan_id"]
+    assert db_session.query(StudyPlan).count() == 1
+
+
+def test_profile_change_replans_from_affected_day(db_session, test_user, test_exam, exam_topics):
+    """A new weakness only reschedules from the first day it affects, keeping elapsed days"""
+    manager = StudyPlanManager(db_session)
+    first = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+
+    # Pretend the plan started 5 days ago
+    plan_row = active_plans(db_session, test_user)[0]
+    stored = json.loads(plan_row.plan_data)
+    stored["start_date"] = (datetime.utcnow().date() - timedelta(days=5)).isoformat()
+    plan_row.plan_data = json.dumps(stored)
+    db_session.commit()
+
+    set_profile(db_session, test_user, weaknesses=["algebra"])
+    second = manager.get_or_update_plan(test_user.id, test_exam.code, 25)
+
+    assert second["plan_status"] == "replanned"
+    assert second["replanned_from_day"] >= 6
+    assert second["weekly_plan"]["week_1"][:5] == first["weekly_plan"]["week_1"][:5]
+
+    # Previous row is deactivated rather than left active
+    actives = active_plans(db_session, test_user)
+    assert len(actives) == 1
+    assert actives[0].id == second["plan_id"]
+
+
+def test_study_hours_change_replans_from_today(db_session, test_user, test_exam, exam_topics):
+    """Daily capacity changes affect every remaining day"""
+    manager = StudyPlanManager(db_session)
+    manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+
+    set_profile(db_session, test_user, study_hours_per_day=3)
+    plan = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+
+    assert plan["plan_status"] == "replanned"
+    assert plan["replanned_from_day"] == 1
+    assert all(day["total_hours"] <= 3 for week in plan["weekly_plan"].values() for day in week)
+
+
+def test_new_horizon_regenerates_plan(db_session, test_user, test_exam, exam_topics):
+    """Asking for a different number of days builds a fresh plan"""
+    manager = StudyPlanManager(db_session)
+    manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+    plan = manager.get_or_update_plan(test_user.id, test_exam.code, 60)
+
+    assert plan["plan_status"] == "created"
+    assert plan["total_days"] == 60
+    assert len(active_plans(db_session, test_user)) == 1
+
+
+def test_countdown_to_same_exam_day_reuses_plan(db_session, test_user, test_exam, exam_topics):
+    """Days counted down to the same end date keep the plan; a new end date rebuilds it"""
+    manager = StudyPlanManager(db_session)
+    first = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+
+    plan_row = active_plans(db_session, test_user)[0]
+    stored = json.loads(plan_row.plan_data)
+    stored["start_date"] = (datetime.utcnow().date() - timedelta(days=3)).isoformat()
+    plan_row.plan_data = json.dumps(stored)
+    db_session.commit()
+
+    same_day = manager.get_or_update_plan(test_user.id, test_exam.code, 27)
+    assert same_day["plan_status"] == "unchanged"
+    assert same_day["plan_id"] == first["plan_id"]
+    assert same_day["total_days"] == 30
+
+    moved = manager.get_or_update_plan(test_user.id, test_exam.code, 30)
+    assert moved["plan_status"] == "created"
+    assert moved["total_days"] == 30
+
+
+def test_joint_plan_is_stored_once(db_session, test_user, test_exam, exam_topics):
+    """Joint plans follow the same reuse rules and rebuild when exams change"""
+    from models import Exam
+
+    db_session.add(Exam(name="BITSAT", code="bitsat", body="BITS", exam_type="entrance"))
+    test_user.active_exams = [test_exam.code, "bitsat"]
+    db_session.commit()
+    manager = StudyPlanManager(db_session)
+
+    first = manager.get_or_update_joint_plan(test_user.id, 30)
+    second = manager.get_or_update_joint_plan(test_user.id)
+    assert first["plan_status"] == "created"
+    assert second["plan_status"] == "unchanged"
+    assert second["total_days"] == 30
+
+    test_user.active_exams = [test_exam.code]
+    db_session.commit()
+    third = manager.get_or_update_joint_plan(test_user.id)
+    assert third["plan_status"] == "created"
+    assert len(active_plans(db_session, test_user)) == 1
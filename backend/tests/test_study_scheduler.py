@@ -0,0 +1,85 @@
+"""
+Tests and benchmarks for the study scheduler
+"""
+import time
+import pytest
+from study_scheduler import StudyScheduler
+
+
+SUBJECTS = ["physics", "chemistry", "mathematics"]
+
+
+def make_topics(count: int, hours: float = 8):
+    """Build `count` topics spread across subjects, highest priority first"""
+    return [
+        {
+            "name": f"topic_{i}",
+            "subject": SUBJECTS[i % len(SUBJECTS)],
+            "hours": hours + (i % 5),
+            "difficulty": "medium",
+            "weightage": 10
+        }
+        for i in range(count)
+    ]
+
+
+def test_respects_daily_capacity():
+    """No day is scheduled beyond the available study hours"""
+    result = StudyScheduler(hours_per_day=5).schedule(make_topics(40), 60)
+
+    assert len(result["days"]) == 60
+    for day in result["days"]:
+        assert sum(s["hours"] for s in day["sessions"]) <= 5 + 1e-6
+
+
+def test_fills_days_after_topics_run_out():
+    """Once the syllabus is covered, remaining days get revision or practice"""
+    result = StudyScheduler(hours_per_day=6).schedule(make_topics(3, hours=4), 30)
+
+    assert result["unscheduled_topics"] == []
+    assert all(day["sessions"] for day in result["days"])
+    assert any(s["type"] == "mock_test" for day in result["days"] for s in day["sessions"])
+
+
+def test_interleaves_subjects():
+    """Consecutive study blocks within a day switch subject"""
+    result = StudyScheduler(hours_per_day=6).schedule(make_topics(30), 20)
+
+    for day in result["days"]:
+        study = [s["subject"] for s in day["sessions"] if s["type"] == "study"]
+        assert all(a != b for a, b in zip(study, study[1:]))
+
+
+def test_spaced_revision_after_completion():
+    """Completed topics come back for revision on the spacing intervals"""
+    topics = [{"name": "kinematics", "subject": "physics", "hours": 3}]
+    result = StudyScheduler(hours_per_day=3).schedule(topics + make_topics(20), 40)
+
+    revision_days = [
+        day["day_number"] for day in result["days"]
+        for s in day["sessions"] if s["type"] == "revision" and s["topic"] == "kinematics"
+    ]
+    assert revision_days[:3] == [2, 8, 22]
+
+
+def test_reports_unscheduled_topics():
+    """Topics that do not fit in the horizon are reported"""
+    result = StudyScheduler(hours_per_day=2).schedule(make_topics(50), 7)
+
+    assert result["unscheduled_topics"]
+    assert result["stats"]["topics_completed"] < 50
+
+
+@pytest.mark.parametrize("days,topic_count", [(30, 20), (90, 100), (180, 250), (365, 500)])
+def test_scheduler_benchmark(days, topic_count):
+    """Scheduling stays well under 50ms up to a 365-day plan over 500 topics"""
+    topics = make_topics(topic_count)
+    scheduler = StudyScheduler(hours_per_day=6)
+
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        scheduler.schedule(topics, days)
+        durations.append(time.perf_counter() - start)
+
+    assert min(durations) < 0.05
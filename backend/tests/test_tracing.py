@@ -0,0 +1,75 @@
+"""
+Tests for request-scoped tracing
+"""
+import time
+from tracing import start_trace, end_trace, current_trace, record, span
+
+
+def test_responses_carry_server_timing(client, auth_headers, test_user):
+    """Each response reports its query time and a unique request id"""
+    url = f"/api/v1/users/{test_user.id}/gamification"
+    first = client.get(url, headers=auth_headers)
+    second = client.get(url, headers=auth_headers)
+
+    assert first.headers["X-Request-ID"] != second.headers["X-Request-ID"]
+    assert len(first.headers["X-Request-ID"]) == 32
+    timing = second.headers["Server-Timing"]
+    assert timing.startswith("db;dur=")
+    assert 'desc="1 queries"' in timing  # the user comes from the principal cache
+    assert "total;dur=" in timing
+
+
+def test_spans_outside_a_request_are_ignored():
+    """Without an active trace recording is a no-op"""
+    assert current_trace() is None
+    record("db", 0.5)
+    with span("llm"):
+        pass
+    assert current_trace() is None
+
+
+def test_cache_calls_are_traced(monkeypatch):
+    """Redis calls add cache time and hit/miss counts to the trace"""
+    from cache import cache
+
+    class FakeRedis:
+        def get(self, key):
+            return '{"a": 1}' if key == "hit" else None
+
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(cache, "redis_client", FakeRedis())
+
+    trace, token = start_trace()
+    try:
+        cache.get("hit")
+        cache.get("miss")
+        cache.get("miss")
+    finally:
+        end_trace(token)
+
+    totals = trace.totals()
+    assert totals["cache_count"] == 3
+    assert totals["cache_hits"] == 1
+    assert totals["cache_misses"] == 2
+
+
+def test_llm_calls_are_traced(db_session, monkeypatch):
+    """Ollama requests are timed as llm spans"""
+    import chatbot
+
+    def slow_post(*args, **kwargs):
+        time.sleep(0.02)
+        raise ConnectionError("ollama is down")
+
+    monkeypatch.setattr(chatbot.requests, "post", slow_post)
+    bot = chatbot.ExamSenseiChatbot(db_session)
+
+    trace, token = start_trace()
+    try:
+        bot._ollama_intent_analysis("hello", {})
+    finally:
+        end_trace(token)
+
+    assert trace.totals()["llm_count"] == 1
+    assert trace.totals()["llm_ms"] >= 20
+    assert "llm;dur=" in trace.server_timing()
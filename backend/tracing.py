@@ -0,0 +1,183 @@
+"""
+Request-scoped tracing for ExamSensei
+Times database, cache and LLM work per request and reports it as Server-Timing
+"""
+import re
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestTrace:
+    """Span totals for one request: name -> call count and seconds, plus free counters"""
+
+    # Span names shown in Server-Timing, with the description of their count
+    SPANS = {"db": "queries", "cache": "calls", "llm": "calls"}
+
+    def __init__(self, request_id: Optional[str] = None, repeat_threshold: Optional[int] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        # Query shape tracking, only when N+1 checks are on
+        self.repeat_threshold = repeat_threshold
+        self.shapes: Dict[str, int] = {}
+        self.repeated: Dict[str, str] = {}  # shape -> stack of the call that crossed the threshold
+        self._lock = threading.Lock()  # sync endpoints and to_thread work share the trace
+
+    def add(self, name: str, seconds: float, **counters: int):
+        with self._lock:
+            span = self.spans.setdefault(name, [0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_statement(self, statement: str):
+        """
+        Count a SELECT by shape; capture the call site when a shape repeats too
+        often. Writes are left out: flushing several new rows of one table is
+        the unit of work, not a loop of lookups.
+        """
+        if not statement.lstrip()[:6].upper() == "SELECT":
+            return
+        shape = statement_shape(statement)
+        with self._lock:
+            count = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if count == self.repeat_threshold:
+            self.repeated[shape] = "".join(traceback.format_stack(limit=25)[:-3])
+
+    @property
+    def query_count(self) -> int:
+        span = self.spans.get("db")
+        return int(span[0]) if span else 0
+
+    def totals(self) -> Dict:
+        """Per-request totals for structured logs"""
+        with self._lock:
+            totals = {}
+            for name, (count, seconds) in self.spans.items():
+                totals[f"{name}_count"] = count
+                totals[f"{name}_ms"] = round(seconds * 1000, 2)
+            totals.update(self.counters)
+            return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. `db;dur=12.5;desc="4 queries", total;dur=20.1`"""
+        with self._lock:
+            parts = [
+                f'{name};dur={seconds * 1000:.1f};desc="{int(count)} {self.SPANS.get(name, "calls")}"'
+                for name, (count, seconds) in self.spans.items()
+            ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def start_trace(request_id: Optional[str] = None, repeat_threshold: Optional[int] = None) -> Tuple[RequestTrace, Token]:
+    """
+    Begin tracing the current request; pass the token to end_trace. With a
+    repeat_threshold, statements are also counted by shape to spot N+1 loops.
+    """
+    trace = RequestTrace(request_id, repeat_threshold)
+    return trace, _current.set(trace)
+
+
+def end_trace(token: Token):
+    _current.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def record(name: str, seconds: float, **counters: int):
+    """Add a timed call to the current request's trace, if any"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds, **counters)
+
+
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """A statement with whitespace collapsed and IN lists of any length made equal"""
+    return _IN_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def query_budget(limit: int) -> Callable:
+    """
+    Declare the most queries an endpoint may issue per request. Exceeding it
+    is logged in development and fails the test suite.
+
+        @app.get("/things")
+        @query_budget(3)
+        async def list_things(...):
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = limit
+        return endpoint
+    return decorator
+
+
+def query_problems(trace: RequestTrace, budget: Optional[int]) -> List[str]:
+    """Budget overruns and repeated statements of a finished request, with call sites"""
+    problems = []
+    if budget is not None and trace.query_count > budget:
+        problems.append(f"{trace.query_count} queries, budget is {budget}")
+    for shape, stack in trace.repeated.items():
+        problems.append(
+            f"statement repeated {trace.shapes[shape]} times (possible N+1): {shape[:300]}\n"
+            f"first repeat at:\n{stack}"
+        )
+    return problems
+
+
+@contextmanager
+def span(name: str, **counters: int):
+    """Time a block as one call of `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, **counters)
+
+
+# Query time on installed engines; outside a request nothing is recorded
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    trace = _current.get()
+    if trace is not None:
+        trace.add("db", seconds)
+        if trace.repeat_threshold:
+            trace.add_statement(statement)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        record("db", time.perf_counter() - connection.info["query_start"].pop())
+
+
+def install(engine: Engine):
+    """Time the queries run on `engine`; installing twice is a no-op"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,73 @@
+"""
+User change tracking for ExamSensei
+Stamps changes to recommendation inputs and reports committed user changes to the caches built from them
+"""
+from datetime import datetime
+from typing import Callable, List, Set
+from sqlalchemy import event, inspect
+from models import User
+from cache import invalidate_recommendations
+
+# Columns recommendations are built from; last_login and similar writes leave them fresh
+RECOMMENDATION_INPUTS = ("current_stage", "career_paths", "active_exams", "preparation_profile")
+
+# Called after commit with (user id, changed columns, token versions) for every user row written
+_user_commit_callbacks: List[Callable[[int, Set[str], Set[int]], None]] = []
+
+
+def on_user_commit(callback: Callable[[int, Set[str], Set[int]], None]):
+    """Register a callback for committed user row changes; registering twice is a no-op"""
+    if callback not in _user_commit_callbacks:
+        _user_commit_callbacks.append(callback)
+    return callback
+
+
+def _stamp_input_changes(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in session.deleted:
+            if isinstance(obj, User):
+                _note_user_change(session, obj, {column.key for column in User.__table__.columns})
+        for obj in session.dirty:
+            if not isinstance(obj, User) or obj in session.deleted or not session.is_modified(obj):
+                continue
+            state = inspect(obj)
+            _note_user_change(session, obj, {
+                attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()
+            })
+            if any(state.attrs[name].history.has_changes() for name in RECOMMENDATION_INPUTS):
+                obj.inputs_updated_at = datetime.utcnow()
+                session.info.setdefault("recommendation_inputs_changed", set()).add(obj.id)
+
+
+def _note_user_change(session, user: User, columns: Set[str]):
+    """Remember a user's changed columns and every token version it had in this transaction"""
+    changed, versions = session.info.setdefault("users_changed", {}).setdefault(user.id, (set(), set()))
+    changed.update(columns)
+    versions.add(user.token_version or 0)
+    versions.update(version or 0 for version in inspect(user).attrs.token_version.history.deleted)
+
+
+def _drop_cached_recommendations(session):
+    for user_id in session.info.pop("recommendation_inputs_changed", ()):
+        invalidate_recommendations(user_id)
+
+
+def _notify_user_commits(session):
+    for user_id, (changed, versions) in session.info.pop("users_changed", {}).items():
+        for callback in _user_commit_callbacks:
+            callback(user_id, changed, versions)
+
+
+def _forget_after_rollback(session):
+    session.info.pop("recommendation_inputs_changed", None)
+    session.info.pop("users_changed", None)
+
+
+def install(session_factory):
+    """Track user changes made through sessions from `session_factory`; installing twice is a no-op"""
+    if event.contains(session_factory, "before_flush", _stamp_input_changes):
+        return
+    event.listen(session_factory, "before_flush", _stamp_input_changes)
+    event.listen(session_factory, "after_commit", _drop_cached_recommendations)
+    event.listen(session_factory, "after_commit", _notify_user_commits)
+    event.listen(session_factory, "after_rollback", _forget_after_rollback)